@@ -3,4 +3,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'aban.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from app.order_stream import ORDER_STREAM_PATH, order_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # The order stream holds its connection open for as long as the client listens, so it is served
+    # as a plain ASGI app, without a Django request or a thread per client
+    if scope['type'] == 'http' and scope['path'] == ORDER_STREAM_PATH:
+        return await order_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -26,8 +26,10 @@ INSTALLED_APPS = [
 ]
 
 REST_FRAMEWORK = {
+    # Builds request.user from the token claims instead of loading the User row on every request;
+    # use rest_framework_simplejwt.authentication.JWTAuthentication where views need the full User.
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'app.authentication.StatelessJWTAuthentication',
     )
 }
 
@@ -39,6 +41,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'app.query_profiler.QueryProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'aban.urls'
@@ -80,6 +83,15 @@ if "test" in sys.argv:
         }
     }
 
+# A process has at most REDIS_MAX_CONNECTIONS Redis connections open, shared by its sync pool and the pool of
+# every event loop; callers wait up to REDIS_POOL_TIMEOUT seconds for a free one. Idle connections are pinged
+# after REDIS_HEALTH_CHECK_INTERVAL seconds. Replies are parsed by hiredis when it is installed, unless
+# REDIS_HIREDIS is False.
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 20))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+REDIS_HIREDIS = os.getenv('REDIS_HIREDIS', 'True') == 'True'
+
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
@@ -131,3 +143,115 @@ SIMPLE_JWT = {
 }
 
 MIN_BATCH_AMOUNT = 10
+BATCH_CLAIM_CHUNK_SIZE = int(os.getenv('BATCH_CLAIM_CHUNK_SIZE', 1000))
+# Orders claimed into one batch, so the row locks a claim holds until it commits stay bounded; the rest of the
+# backlog goes into the next batch
+BATCH_MAX_ORDERS = int(os.getenv('BATCH_MAX_ORDERS', 10000))
+# `batch_maker_command --daemon` cuts a batch early once its oldest order waited this many seconds
+BATCH_MAX_LATENCY = float(os.getenv('BATCH_MAX_LATENCY', 1.0))
+BATCH_RECONCILE_INTERVAL = float(os.getenv('BATCH_RECONCILE_INTERVAL', 30))
+
+# "rq" settles one batch per RQ job; "async" hands batches to `async_settle_worker_command`
+SETTLEMENT_BACKEND = os.getenv('SETTLEMENT_BACKEND', 'rq')
+ASYNC_SETTLE_CONCURRENCY = int(os.getenv('ASYNC_SETTLE_CONCURRENCY', 256))
+EXCHANGER_MAX_IN_FLIGHT = int(os.getenv('EXCHANGER_MAX_IN_FLIGHT', 32))
+EXCHANGER_REQUEST_TIMEOUT = float(os.getenv('EXCHANGER_REQUEST_TIMEOUT', 60))
+
+# `queues_worker_command` supervises this many RQ worker processes
+QUEUE_WORKERS = int(os.getenv('QUEUE_WORKERS', 1))
+QUEUE_WORKER_AFFINITY = os.getenv('QUEUE_WORKER_AFFINITY', '')
+QUEUE_SUPERVISOR_POLL_INTERVAL = float(os.getenv('QUEUE_SUPERVISOR_POLL_INTERVAL', 5))
+
+# Exchanger routing: latency and error rate of exchanger calls are averaged with weight EXCHANGER_STATS_ALPHA.
+# An exchanger is routed around once its error rate reaches EXCHANGER_MAX_ERROR_RATE over at least
+# EXCHANGER_MIN_SAMPLES calls; its stats expire EXCHANGER_STATS_TTL seconds after its last call.
+EXCHANGER_STATS_ALPHA = float(os.getenv('EXCHANGER_STATS_ALPHA', 0.2))
+EXCHANGER_MAX_ERROR_RATE = float(os.getenv('EXCHANGER_MAX_ERROR_RATE', 0.5))
+EXCHANGER_MIN_SAMPLES = int(os.getenv('EXCHANGER_MIN_SAMPLES', 5))
+EXCHANGER_STATS_TTL = int(os.getenv('EXCHANGER_STATS_TTL', 300))
+
+# With several symbols due at once, their orders are netted into one multi-leg batch when an active exchanger
+# has supports_multi_leg
+MULTI_LEG_BATCHING = os.getenv('MULTI_LEG_BATCHING', 'True') == 'True'
+
+# An exchanger's circuit opens after EXCHANGER_BREAKER_FAILURES consecutive failed calls; settlements then
+# skip it for EXCHANGER_BREAKER_COOLDOWN seconds, after which a single probe decides whether it closes again.
+EXCHANGER_BREAKER_FAILURES = int(os.getenv('EXCHANGER_BREAKER_FAILURES', 5))
+EXCHANGER_BREAKER_COOLDOWN = int(os.getenv('EXCHANGER_BREAKER_COOLDOWN', 30))
+
+# Metrics are aggregated per thread and added up in Redis every METRICS_FLUSH_INTERVAL seconds, by the recording
+# thread or by the process's background flusher
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+# Opt-in query profiling of requests, settle jobs and batch making. Every profile is logged with its
+# QUERY_PROFILING_SLOWEST slowest statements, as a warning when it repeats a statement or runs more than
+# QUERY_PROFILING_MAX_QUERIES queries.
+QUERY_PROFILING = os.getenv('QUERY_PROFILING', 'False') == 'True'
+QUERY_PROFILING_MAX_QUERIES = int(os.getenv('QUERY_PROFILING_MAX_QUERIES', 50))
+QUERY_PROFILING_SLOWEST = int(os.getenv('QUERY_PROFILING_SLOWEST', 5))
+
+# Exchanger request logs are buffered in Redis and bulk inserted every EXCHANGER_LOG_FLUSH_INTERVAL seconds, at most
+# EXCHANGER_LOG_FLUSH_BATCH_SIZE rows per insert. Only the first EXCHANGER_LOG_BODY_LIMIT bytes of a response are
+# kept, and logs older than EXCHANGER_LOG_RETENTION_DAYS are pruned.
+EXCHANGER_LOG_FLUSH_INTERVAL = float(os.getenv('EXCHANGER_LOG_FLUSH_INTERVAL', 1.0))
+EXCHANGER_LOG_FLUSH_BATCH_SIZE = int(os.getenv('EXCHANGER_LOG_FLUSH_BATCH_SIZE', 1000))
+EXCHANGER_LOG_BODY_LIMIT = int(os.getenv('EXCHANGER_LOG_BODY_LIMIT', 512))
+EXCHANGER_LOG_RETENTION_DAYS = int(os.getenv('EXCHANGER_LOG_RETENTION_DAYS', 30))
+
+# Users per set-based wallet UPDATE when a batch is settled
+WALLET_UPDATE_CHUNK_SIZE = int(os.getenv('WALLET_UPDATE_CHUNK_SIZE', 500))
+
+# Upper bound in seconds on how long a cached CryptoCurrency price may be charged;
+# price changes are also pushed to every process through Redis pub/sub.
+CURRENCY_CACHE_TTL = float(os.getenv('CURRENCY_CACHE_TTL', 5))
+
+# Reserve purchases against a Redis copy of the wallet instead of locking the wallet row;
+# the rows are written by `purchase_flusher_command`.
+PURCHASE_RESERVATION_MODE = os.getenv('PURCHASE_RESERVATION_MODE', 'False') == 'True'
+PURCHASE_FLUSH_BATCH_SIZE = int(os.getenv('PURCHASE_FLUSH_BATCH_SIZE', 500))
+PURCHASE_FLUSH_INTERVAL = float(os.getenv('PURCHASE_FLUSH_INTERVAL', 0.2))
+# Purchases are refused while `purchase_flusher_command --rebuild` runs; the guard expires after
+# RESERVATION_REBUILD_TIMEOUT seconds without progress if the rebuild dies
+RESERVATION_REBUILD_TIMEOUT = int(os.getenv('RESERVATION_REBUILD_TIMEOUT', 600))
+
+# Upper bound on the items of one /purchase/batch/ request
+PURCHASE_BATCH_MAX_ITEMS = int(os.getenv('PURCHASE_BATCH_MAX_ITEMS', 100))
+
+# Order read API: default and maximum page size, and seconds a cached page may live. Cached pages are
+# invalidated as soon as a purchase, batch or settlement changes the user's orders.
+ORDERS_PAGE_SIZE = int(os.getenv('ORDERS_PAGE_SIZE', 20))
+ORDERS_MAX_PAGE_SIZE = int(os.getenv('ORDERS_MAX_PAGE_SIZE', 100))
+ORDERS_CACHE_TTL = int(os.getenv('ORDERS_CACHE_TTL', 60))
+
+# Seconds a wallet balance snapshot served by /api/wallet/ lives in Redis; every balance write replaces it.
+WALLET_SNAPSHOT_TTL = int(os.getenv('WALLET_SNAPSHOT_TTL', 3600))
+
+# Keep balances in an append-only double-entry ledger instead of the wallet rows; run `ledger_command --open`
+# before switching it on. It cannot be combined with PURCHASE_RESERVATION_MODE. A user's purchases wait up to
+# LEDGER_SPENDING_WAIT seconds for their spending lock, and a ledger transaction is given LEDGER_WRITE_TIMEOUT
+# seconds. `ledger_command` folds committed entries into per-account checkpoints, LEDGER_COMPACTION_CHUNK_SIZE
+# users per transaction, after waiting up to LEDGER_COMPACTION_WAIT seconds for the ledger transactions in flight.
+LEDGER_ENABLED = os.getenv('LEDGER_ENABLED', 'False') == 'True'
+LEDGER_SPENDING_WAIT = float(os.getenv('LEDGER_SPENDING_WAIT', 10))
+LEDGER_WRITE_TIMEOUT = int(os.getenv('LEDGER_WRITE_TIMEOUT', 60))
+LEDGER_COMPACTION_WAIT = float(os.getenv('LEDGER_COMPACTION_WAIT', 10))
+LEDGER_COMPACTION_CHUNK_SIZE = int(os.getenv('LEDGER_COMPACTION_CHUNK_SIZE', 1000))
+
+# Order updates kept per user for clients reconnecting to /api/orders/stream/, and for how long; the stream
+# sends a keep-alive comment every ORDER_STREAM_HEARTBEAT seconds.
+ORDER_EVENTS_MAXLEN = int(os.getenv('ORDER_EVENTS_MAXLEN', 100))
+ORDER_EVENTS_RETENTION = int(os.getenv('ORDER_EVENTS_RETENTION', 3600))
+ORDER_STREAM_HEARTBEAT = float(os.getenv('ORDER_STREAM_HEARTBEAT', 15))
+
+# Seconds a user's active flag is cached in Redis for stateless JWT authentication;
+# saving or deleting a user updates it immediately. Tokens revoked through /api/token/revoke/
+# are denylisted until they expire and checked in the same Redis round trip.
+AUTH_USER_STATE_TTL = int(os.getenv('AUTH_USER_STATE_TTL', 300))
+
+# Responses to requests carrying an Idempotency-Key are replayed for IDEMPOTENCY_TTL seconds. A retry that
+# arrives while the first request is still running waits up to IDEMPOTENCY_WAIT_TIMEOUT seconds for it. The
+# in-flight marker is extended while the request runs, and expires IDEMPOTENCY_LOCK_TIMEOUT seconds after its
+# process crashed.
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 86400))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', 10))
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', 30))
@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        from app import signals  # noqa: F401
+
+        # Reservations keep the balance in Redis and the wallet rows, the ledger in its entries; one owns it
+        if getattr(settings, "LEDGER_ENABLED", False) and getattr(settings, "PURCHASE_RESERVATION_MODE", False):
+            raise ImproperlyConfigured("LEDGER_ENABLED and PURCHASE_RESERVATION_MODE cannot both be on")
@@ -0,0 +1,20 @@
+import functools
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def database_sync_to_async(func):
+    """
+    Runs ORM code from async code in a worker thread. Threads are not tied to the request, so several
+    requests hit the database in parallel, and connections are checked like at the start and end of a request.
+    """
+
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(inner, thread_sensitive=False)
@@ -0,0 +1,127 @@
+import asyncio
+import httpx
+import json
+import time
+from django.conf import settings
+from app import metrics
+from app.async_db import database_sync_to_async
+from app.exchanger_client import AsyncExchangerClient
+from app.exchanger_router import ExchangerRouter
+from app.redis_client import RedisClient
+from app.request_log import RequestLogBuffer, RequestLogFlusher, request_log_record
+from app.tasks.settle_task import start_settlement, complete_settlement, fail_settlement, response_outcome
+
+QUEUE_KEY = 'settle:async'
+DELAYED_KEY = 'settle:async:delayed'
+
+PROMOTE_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, item in ipairs(items) do
+    redis.call('ZREM', KEYS[1], item)
+    redis.call('RPUSH', KEYS[2], item)
+end
+return #items
+"""
+
+
+def enqueue_async_settle(exchange_transaction_id, currency, delay=0):
+    """Queues a batch for the asyncio settlement worker, optionally after `delay` seconds"""
+    client = RedisClient().client
+    payload = json.dumps({'exchange_transaction_id': exchange_transaction_id, 'currency': currency})
+    if delay:
+        client.zadd(DELAYED_KEY, {payload: time.time() + delay})
+    else:
+        client.rpush(QUEUE_KEY, payload)
+
+
+class AsyncSettlementWorker:
+    """
+    Settles many exchange transactions concurrently on one event loop. HTTP calls share a pooled
+    client per exchanger; the database phases of each settlement run in worker threads.
+    """
+
+    def __init__(self, concurrency=None, max_in_flight=None, timeout=None):
+        self.client = RedisClient().client
+        self.promote_script = self.client.register_script(PROMOTE_SCRIPT)
+        self.router = ExchangerRouter()
+        self.request_logs = RequestLogBuffer()
+        self.concurrency = concurrency or getattr(settings, "ASYNC_SETTLE_CONCURRENCY", 256)
+        self.exchanger_client = AsyncExchangerClient(
+            max_in_flight or getattr(settings, "EXCHANGER_MAX_IN_FLIGHT", 32),
+            timeout or getattr(settings, "EXCHANGER_REQUEST_TIMEOUT", 60),
+        )
+
+    def next_job(self, timeout=1):
+        self.promote_script(keys=[DELAYED_KEY, QUEUE_KEY], args=[time.time()])
+        item = self.client.blpop(QUEUE_KEY, timeout=timeout)
+        return json.loads(item[1]) if item else None
+
+    async def run(self, stop_when_idle=False):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        flusher = RequestLogFlusher(self.request_logs)
+        flusher.start()
+
+        def done(task):
+            tasks.discard(task)
+            slots.release()
+
+        try:
+            while True:
+                await slots.acquire()
+                job = await loop.run_in_executor(None, self.next_job)
+                if job is None:
+                    slots.release()
+                    if stop_when_idle and not tasks:
+                        break
+                    continue
+
+                task = asyncio.create_task(self.settle(job['exchange_transaction_id'], job['currency']))
+                tasks.add(task)
+                task.add_done_callback(done)
+        finally:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.exchanger_client.aclose()
+            await loop.run_in_executor(None, flusher.stop)
+            metrics.flush_all()
+
+    async def settle(self, exchange_transaction_id, currency):
+        started = await database_sync_to_async(start_settlement)(
+            exchange_transaction_id, currency, enqueue_async_settle
+        )
+        if started is None:
+            return
+        exchange_transaction, request_data = started
+
+        try:
+            response = await self.post(exchange_transaction, request_data)
+
+            if response.status_code == 200:
+                await database_sync_to_async(complete_settlement)(exchange_transaction)
+            else:
+                raise Exception("Exchanger request failed")
+
+        except Exception as e:
+            await database_sync_to_async(fail_settlement)(
+                exchange_transaction, currency, enqueue_async_settle
+            )
+
+    async def post(self, exchange_transaction, request_data):
+        """Sends a batch to the exchanger; the outcome feeds its routing stats and the buffered request log"""
+        exchanger = exchange_transaction.exchanger
+        started = time.perf_counter()
+        try:
+            response = await self.exchanger_client.post(exchanger, request_data)
+        except httpx.HTTPError as e:
+            latency = time.perf_counter() - started
+            await self.router.arecord(exchanger.id, latency, ok=False)
+            metrics.EXCHANGER_REQUEST_SECONDS.observe(latency, exchanger=exchanger.id, outcome="error")
+            await self.request_logs.apush(request_log_record(exchange_transaction, request_data, latency, error=e))
+            raise
+        latency = time.perf_counter() - started
+        await self.router.arecord(exchanger.id, latency, ok=response.status_code == 200)
+        metrics.EXCHANGER_REQUEST_SECONDS.observe(latency, exchanger=exchanger.id, outcome=response_outcome(response))
+        await self.request_logs.apush(request_log_record(exchange_transaction, request_data, latency,
+                                                         response=response))
+        return response
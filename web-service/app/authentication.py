@@ -0,0 +1,151 @@
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from redis.exceptions import RedisError
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
+from rest_framework_simplejwt.authentication import JWTTokenUserAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from app.async_db import database_sync_to_async
+from app.redis_client import RedisClient, AsyncRedisClient
+
+USER_STATE_KEY = 'auth:user:{user_id}'
+REVOKED_TOKEN_KEY = 'auth:revoked:{jti}'
+ACTIVE = b'1'
+INACTIVE = b'0'
+REVOKED = b'revoked'
+
+
+class UserState:
+    """
+    Whether a user may still authenticate, cached in Redis for AUTH_USER_STATE_TTL seconds.
+    Saving or deleting a user rewrites its entry, so deactivation applies immediately; misses
+    and Redis outages fall back to the database.
+
+    Given a token's jti, the revoked-token entry is read in the same MGET. Revocations live only
+    in Redis, so while it is down revoked tokens are accepted until they expire.
+    """
+
+    @property
+    def ttl(self):
+        return getattr(settings, "AUTH_USER_STATE_TTL", 300)
+
+    def keys(self, user_id, jti):
+        keys = [USER_STATE_KEY.format(user_id=user_id)]
+        if jti is not None:
+            keys.append(REVOKED_TOKEN_KEY.format(jti=jti))
+        return keys
+
+    def state(self, user_id, jti=None):
+        """ACTIVE, INACTIVE, or REVOKED when the token with this jti was revoked"""
+        try:
+            state, *revoked = RedisClient().client.mget(self.keys(user_id, jti))
+        except RedisError:
+            return self.load(user_id)
+
+        if any(revoked):
+            return REVOKED
+        if state is None:
+            state = self.load(user_id)
+            self.store(user_id, state)
+        return state
+
+    async def astate(self, user_id, jti=None):
+        try:
+            state, *revoked = await AsyncRedisClient().client.mget(self.keys(user_id, jti))
+        except RedisError:
+            return await database_sync_to_async(self.load)(user_id)
+
+        if any(revoked):
+            return REVOKED
+        if state is None:
+            state = await database_sync_to_async(self.load)(user_id)
+            try:
+                await AsyncRedisClient().client.set(USER_STATE_KEY.format(user_id=user_id), state, ex=self.ttl)
+            except RedisError:
+                pass
+        return state
+
+    def is_active(self, user_id):
+        return self.state(user_id) == ACTIVE
+
+    def load(self, user_id):
+        is_active = User.objects.filter(id=user_id).values_list('is_active', flat=True).first()
+        return ACTIVE if is_active else INACTIVE
+
+    def store(self, user_id, state):
+        try:
+            RedisClient().client.set(USER_STATE_KEY.format(user_id=user_id), state, ex=self.ttl)
+        except RedisError:
+            # The previous entry expires after AUTH_USER_STATE_TTL
+            pass
+
+
+user_state = UserState()
+
+
+def revoke_token(token):
+    """
+    Denylists a validated access or refresh token by its jti until it expires. Raises RedisError:
+    a revocation that was not stored must not be reported as done.
+    """
+    ttl = max(int(token['exp'] - time.time()), 1)
+    RedisClient().client.set(REVOKED_TOKEN_KEY.format(jti=token[api_settings.JTI_CLAIM]), 1, ex=ttl)
+
+
+def check_state(state):
+    if state == REVOKED:
+        raise AuthenticationFailed("Token has been revoked", code='token_revoked')
+    if state != ACTIVE:
+        raise AuthenticationFailed("User is inactive", code='user_inactive')
+
+
+class StatelessJWTAuthentication(JWTTokenUserAuthentication):
+    """Authenticates a bearer access token without loading the User row; request.user is a TokenUser"""
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        check_state(user_state.state(user.id, validated_token.get(api_settings.JTI_CLAIM)))
+        return user
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses to mint access tokens from a revoked refresh token"""
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        check_state(user_state.state(refresh[api_settings.USER_ID_CLAIM], refresh.get(api_settings.JTI_CLAIM)))
+        return super().validate(attrs)
+
+
+async def authenticate_async(request):
+    """
+    Authenticates the bearer access token of a plain Django request without leaving the event loop.
+    The user is built from the token claims; raises NotAuthenticated or AuthenticationFailed.
+    """
+    return await authenticate_token_async(request.META.get(api_settings.AUTH_HEADER_NAME))
+
+
+async def authenticate_token_async(header):
+    """Authenticates the value of an Authorization header"""
+    if not header:
+        raise NotAuthenticated()
+
+    parts = header.split()
+    if len(parts) != 2 or parts[0] not in api_settings.AUTH_HEADER_TYPES:
+        raise AuthenticationFailed("Authorization header must contain two space-delimited values")
+
+    try:
+        token = AccessToken(parts[1])
+    except TokenError as e:
+        raise AuthenticationFailed(str(e))
+
+    if api_settings.USER_ID_CLAIM not in token:
+        raise AuthenticationFailed("Token contained no recognizable user identification")
+
+    user = TokenUser(token)
+    check_state(await user_state.astate(user.id, token.get(api_settings.JTI_CLAIM)))
+    return user
@@ -0,0 +1,6 @@
+# benchmarks/__init__.py
+
+from .purchase_benchmark import *
+from .settle_benchmark import *
+from .pipeline_benchmark import *
+from .asgi_benchmark import *
@@ -0,0 +1,94 @@
+import asyncio
+import uuid
+from decimal import Decimal
+import httpx
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from app.models import CryptoCurrency, UserWallet
+from app.redis_client import RedisClient
+from app.wallet_reservation import WALLET_KEY, WalletReservation
+from app.benchmarks.utils import run_concurrently, run_concurrently_async, summarize
+
+ENDPOINTS = {
+    'sync': "/api/purchase/",
+    'async': "/api/async/purchase/",
+}
+
+
+def check(response):
+    if response.status_code != 201:
+        raise AssertionError(f"purchase failed with {response.status_code}: {response.text}")
+
+
+def run_wsgi(path, headers, concurrency, requests):
+    """One thread per concurrent client, like a threaded WSGI server"""
+    application = get_wsgi_application()
+
+    def setup():
+        return httpx.Client(transport=httpx.WSGITransport(app=application), base_url="http://testserver")
+
+    def purchase_once(client):
+        check(client.post(path, json={"name": "BENCH", "count": 1}, headers=headers))
+
+    return run_concurrently(purchase_once, concurrency, requests, setup=setup)
+
+
+def run_asgi(path, headers, concurrency, requests):
+    """Every concurrent client on one event loop, like an ASGI server worker"""
+    application = get_asgi_application()
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=application),
+                                     base_url="http://testserver") as client:
+            async def purchase_once():
+                check(await client.post(path, json={"name": "BENCH", "count": 1}, headers=headers))
+
+            return await run_concurrently_async(purchase_once, concurrency, requests)
+
+    return asyncio.run(run())
+
+
+def run_asgi_benchmark(concurrency=64, requests=1000, reservation=False):
+    """
+    Serves the DRF purchase view and its async counterpart under WSGI and under ASGI in-process,
+    and reports throughput and latency of every combination
+    """
+    user = User.objects.create_user(username=f"bench-{uuid.uuid4().hex[:8]}")
+    UserWallet.objects.create(user=user, balance=Decimal(requests) * 40)
+    CryptoCurrency.objects.get_or_create(symbol="BENCH", defaults={"name": "Benchmark", "price": 1})
+    if reservation:
+        # Throwaway databases reuse user ids, so drop a wallet an earlier run left in Redis
+        RedisClient().client.delete(WALLET_KEY.format(user_id=user.id))
+    headers = {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+
+    results = {}
+    with override_settings(PURCHASE_RESERVATION_MODE=reservation):
+        for server, run in (('wsgi', run_wsgi), ('asgi', run_asgi)):
+            for view, path in ENDPOINTS.items():
+                latencies, elapsed = run(path, headers, concurrency, requests)
+                results[f'{server}_{view}'] = {
+                    'path': path,
+                    'requests_per_sec': round(requests / elapsed, 2),
+                    **summarize(latencies),
+                }
+
+    if reservation:
+        wallet_reservation = WalletReservation()
+        while wallet_reservation.flush():
+            pass
+
+    expected = requests * len(results)
+    locked_balance = UserWallet.objects.get(user=user).locked_balance
+    if locked_balance != expected:
+        raise AssertionError(f"expected locked balance {expected}, got {locked_balance}")
+
+    return {
+        'scenario': 'asgi',
+        'mode': 'reservation' if reservation else 'lock',
+        'concurrency': concurrency,
+        'requests': requests,
+        'servers': results,
+    }
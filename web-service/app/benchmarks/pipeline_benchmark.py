@@ -0,0 +1,152 @@
+import itertools
+import math
+import time
+import uuid
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from rq import Queue
+from app.benchmarks.stub_exchanger import StubExchanger
+from app.benchmarks.utils import QueryCounter, run_concurrently, summarize
+from app.models import CryptoCurrency, ExchangeTransaction, Exchanger, Order, UserWallet
+from app.redis_client import RedisClient
+from app.wallet_reservation import WALLET_KEY, WalletReservation
+
+FIXTURES = ['cryptocurrency_fixture', 'exchanger_fixture', 'users_fixture', 'userwallet_fixture']
+
+
+def seed_pipeline(users, requests, count):
+    """Loads the fixtures and clones the fixture users into `users` funded benchmark users"""
+    call_command('loaddata', *FIXTURES, verbosity=0)
+
+    currencies = list(CryptoCurrency.objects.order_by('id'))
+    templates = list(UserWallet.objects.select_related('user').order_by('id'))
+    # Every user must be able to afford its share of the purchases at the highest price
+    funding = max(currency.price for currency in currencies) * count * math.ceil(requests / users)
+
+    prefix = f"bench-{uuid.uuid4().hex[:8]}"
+    User.objects.bulk_create([
+        User(username=f"{prefix}-{templates[i % len(templates)].user.username}-{i}",
+             email=templates[i % len(templates)].user.email)
+        for i in range(users)
+    ])
+    # bulk_create does not return primary keys on MySQL
+    seeded = list(User.objects.filter(username__startswith=f"{prefix}-").order_by('id'))
+    UserWallet.objects.bulk_create([
+        UserWallet(user=user, balance=templates[i % len(templates)].balance + funding)
+        for i, user in enumerate(seeded)
+    ])
+
+    return seeded, currencies
+
+
+def drain_settle_jobs(symbols, exchange_transaction_ids, query_counter):
+    """
+    Performs the settle jobs the batch maker enqueued for this run, one at a time like an RQ worker: single-symbol
+    batches from the symbol queues and multi-leg batches from `default`
+    """
+    client = RedisClient().client
+    latencies = []
+    with query_counter.track():
+        for name in symbols + ['default']:
+            queue = Queue(connection=client, name=name)
+            for job in queue.jobs:
+                if job.func_name != 'app.tasks.settle_task.settle' or job.args[0] not in exchange_transaction_ids:
+                    continue
+                started = time.perf_counter()
+                job.perform()
+                latencies.append(time.perf_counter() - started)
+                job.delete()
+    return latencies
+
+
+def stage(unit, count, elapsed, latencies, queries):
+    """Result of one pipeline stage; `count` is the number of `unit` items it processed"""
+    return {
+        'unit': unit,
+        'count': count,
+        'seconds': round(elapsed, 3),
+        'per_sec': round(count / elapsed, 2) if elapsed else None,
+        **summarize(latencies),
+        'queries': queries,
+        'queries_per_item': round(queries / count, 2) if count else None,
+    }
+
+
+def run_pipeline_benchmark(users=100, requests=1000, count=1, concurrency=16, exchanger_latency=0.05,
+                           reservation=False):
+    """
+    Drives orders end to end: concurrent JWT-authenticated purchases, one batch maker run and the
+    settle jobs it enqueued against a local stub exchanger. Reports throughput, latency and SQL
+    statements per stage. Settle jobs are taken from the symbol queues and `default`, so run it against a
+    Redis that no live queue worker is consuming.
+    """
+    seeded, currencies = seed_pipeline(users, requests, count)
+    symbols = [currency.symbol for currency in currencies]
+    purchases = itertools.cycle([
+        (f"Bearer {AccessToken.for_user(user)}", symbols[i % len(symbols)])
+        for i, user in enumerate(seeded)
+    ])
+
+    if reservation:
+        # Throwaway databases reuse user ids, so drop wallets an earlier run left in Redis
+        RedisClient().client.delete(*[WALLET_KEY.format(user_id=user.id) for user in seeded])
+
+    stub = StubExchanger(latency=exchanger_latency)
+    Exchanger.objects.update(api_url=stub.start_in_thread())
+
+    def purchase_once(client):
+        authorization, symbol = next(purchases)
+        response = client.post("/api/purchase/", {"name": symbol, "count": count}, HTTP_AUTHORIZATION=authorization)
+        if response.status_code != 201:
+            raise AssertionError(f"purchase failed with {response.status_code}: {response.data}")
+
+    stages = {}
+    # Every symbol is batched, however little of it was bought, so every order reaches settle
+    with override_settings(PURCHASE_RESERVATION_MODE=reservation, SETTLEMENT_BACKEND='rq', MIN_BATCH_AMOUNT=0):
+        query_counter = QueryCounter()
+        latencies, elapsed = run_concurrently(purchase_once, concurrency, requests, setup=APIClient,
+                                              query_counter=query_counter)
+        stages['purchase'] = stage('orders', requests, elapsed, latencies, query_counter.count)
+
+        if reservation:
+            query_counter = QueryCounter()
+            wallet_reservation = WalletReservation()
+            with query_counter.track():
+                started = time.perf_counter()
+                while wallet_reservation.flush():
+                    pass
+                elapsed = time.perf_counter() - started
+            stages['flush'] = stage('orders', requests, elapsed, [], query_counter.count)
+
+        query_counter = QueryCounter()
+        with query_counter.track():
+            started = time.perf_counter()
+            call_command('batch_maker_command')
+            elapsed = time.perf_counter() - started
+        exchange_transaction_ids = set(ExchangeTransaction.objects.values_list('id', flat=True))
+        stages['batch'] = stage('batches', len(exchange_transaction_ids), elapsed, [elapsed], query_counter.count)
+
+        query_counter = QueryCounter()
+        started = time.perf_counter()
+        latencies = drain_settle_jobs(symbols, exchange_transaction_ids, query_counter)
+        elapsed = time.perf_counter() - started
+        stages['settle'] = stage('batches', len(latencies), elapsed, latencies, query_counter.count)
+
+    completed = Order.objects.filter(user__in=seeded, status="Completed").count()
+    if completed != requests:
+        raise AssertionError(f"expected {requests} completed orders, got {completed}")
+
+    total_elapsed = sum(result['seconds'] for result in stages.values())
+    return {
+        'scenario': 'pipeline',
+        'mode': 'reservation' if reservation else 'lock',
+        'users': users,
+        'requests': requests,
+        'concurrency': concurrency,
+        'exchanger_latency_ms': exchanger_latency * 1000,
+        'orders_per_sec': round(requests / total_elapsed, 2),
+        'stages': stages,
+    }
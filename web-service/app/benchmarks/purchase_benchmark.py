@@ -0,0 +1,59 @@
+import uuid
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from app.models import CryptoCurrency, UserWallet
+from app.redis_client import RedisClient
+from app.wallet_reservation import WALLET_KEY, WalletReservation
+from app.benchmarks.utils import run_concurrently, summarize
+
+
+def run_purchase_benchmark(concurrency=16, requests=1000, reservation=False, items=1):
+    """
+    Fires concurrent purchases for a single user and reports the latency distribution;
+    with items > 1 every request places that many orders through /purchase/batch/
+    """
+    user = User.objects.create_user(username=f"bench-{uuid.uuid4().hex[:8]}")
+    UserWallet.objects.create(user=user, balance=Decimal(requests * items) * 10)
+    CryptoCurrency.objects.get_or_create(symbol="BENCH", defaults={"name": "Benchmark", "price": 1})
+    if reservation:
+        # Throwaway databases reuse user ids, so drop a wallet an earlier run left in Redis
+        RedisClient().client.delete(WALLET_KEY.format(user_id=user.id))
+
+    def setup():
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    def purchase_once(client):
+        if items > 1:
+            response = client.post("/api/purchase/batch/", {"items": [{"name": "BENCH", "count": 1}] * items},
+                                   format="json")
+        else:
+            response = client.post("/api/purchase/", {"name": "BENCH", "count": 1})
+        if response.status_code != 201:
+            raise AssertionError(f"purchase failed with {response.status_code}: {response.data}")
+
+    with override_settings(PURCHASE_RESERVATION_MODE=reservation):
+        latencies, elapsed = run_concurrently(purchase_once, concurrency, requests, setup=setup)
+
+    if reservation:
+        wallet_reservation = WalletReservation()
+        while wallet_reservation.flush():
+            pass
+
+    locked_balance = UserWallet.objects.get(user=user).locked_balance
+    if locked_balance != requests * items:
+        raise AssertionError(f"expected locked balance {requests * items}, got {locked_balance}")
+
+    return {
+        'scenario': 'purchase',
+        'mode': 'reservation' if reservation else 'lock',
+        'concurrency': concurrency,
+        'requests': requests,
+        'items': items,
+        'requests_per_sec': round(requests / elapsed, 2),
+        'orders_per_sec': round(requests * items / elapsed, 2),
+        **summarize(latencies),
+    }
@@ -0,0 +1,65 @@
+import asyncio
+import time
+import uuid
+from decimal import Decimal
+from django.contrib.auth.models import User
+from app.async_settlement import AsyncSettlementWorker, enqueue_async_settle
+from app.benchmarks.stub_exchanger import StubExchanger
+from app.models import (
+    CryptoCurrency, ExchangeTransaction, Exchanger, Order, OrderExchangeTransaction, Transaction, UserWallet
+)
+from app.tasks import settle
+
+
+def seed_exchange_transactions(exchanger, batches, orders_per_batch):
+    user = User.objects.create_user(username=f"bench-{uuid.uuid4().hex[:8]}")
+    total = Decimal(batches * orders_per_batch)
+    UserWallet.objects.create(user=user, balance=total, locked_balance=total)
+    crypto_currency, _ = CryptoCurrency.objects.get_or_create(
+        symbol="BENCH", defaults={"name": "Benchmark", "price": 1}
+    )
+    trx = Transaction.objects.create(user=user, amount=total, type="Debit")
+
+    exchange_transactions = []
+    for _ in range(batches):
+        exchange_transaction = ExchangeTransaction.objects.create(exchanger=exchanger, amount=orders_per_batch)
+        for _ in range(orders_per_batch):
+            order = Order.objects.create(user=user, crypto_currency=crypto_currency, transaction=trx,
+                                         amount=1, count=1, status="processing",
+                                         exchange_transaction=exchange_transaction)
+            OrderExchangeTransaction.objects.create(order=order, exchange_transaction=exchange_transaction)
+        exchange_transactions.append(exchange_transaction)
+    return exchange_transactions
+
+
+def run_settle_benchmark(batches=200, orders_per_batch=10, exchanger_latency=0.05, concurrency=64,
+                         asynchronous=True):
+    """Settles batches against a local stub exchanger and reports batches/sec"""
+    stub = StubExchanger(latency=exchanger_latency)
+    exchanger = Exchanger.objects.create(name=f"stub-{uuid.uuid4().hex[:8]}", api_url=stub.start_in_thread())
+    exchange_transactions = seed_exchange_transactions(exchanger, batches, orders_per_batch)
+
+    started = time.perf_counter()
+    if asynchronous:
+        for exchange_transaction in exchange_transactions:
+            enqueue_async_settle(exchange_transaction.id, "BENCH")
+        asyncio.run(AsyncSettlementWorker(concurrency=concurrency).run(stop_when_idle=True))
+    else:
+        # One RQ worker handles one settle job at a time
+        for exchange_transaction in exchange_transactions:
+            settle(exchange_transaction.id, "BENCH")
+    elapsed = time.perf_counter() - started
+
+    completed = ExchangeTransaction.objects.filter(exchanger=exchanger, status="Completed").count()
+    if completed != batches:
+        raise AssertionError(f"expected {batches} completed batches, got {completed}")
+
+    return {
+        'scenario': 'settle',
+        'mode': 'async' if asynchronous else 'rq',
+        'batches': batches,
+        'orders_per_batch': orders_per_batch,
+        'exchanger_latency_ms': exchanger_latency * 1000,
+        'concurrency': concurrency if asynchronous else 1,
+        'batches_per_sec': round(batches / elapsed, 2),
+    }
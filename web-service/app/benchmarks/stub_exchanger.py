@@ -0,0 +1,74 @@
+import asyncio
+import random
+import threading
+
+
+class StubExchanger:
+    """Minimal keep-alive HTTP server that answers every request like an exchanger, for offline benchmarks"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/"
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length:
+                    await reader.readexactly(length)
+
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                failed = random.random() < self.failure_rate
+                status = b'500 Internal Server Error' if failed else b'200 OK'
+                body = b'{"status": "failed"}' if failed else b'{"status": "ok"}'
+                writer.write(
+                    b'HTTP/1.1 ' + status + b'\r\n'
+                    b'Content-Type: application/json\r\n'
+                    b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body
+                )
+                await writer.drain()
+                self.requests += 1
+
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, started=None):
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        if started:
+            started.set()
+        async with server:
+            await server.serve_forever()
+
+    def start_in_thread(self):
+        """Serves from a daemon thread and returns the URL once the server is listening"""
+        started = threading.Event()
+        thread = threading.Thread(target=lambda: asyncio.run(self.serve(started)), daemon=True)
+        thread.start()
+        started.wait()
+        return self.url
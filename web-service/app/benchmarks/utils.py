@@ -0,0 +1,128 @@
+import asyncio
+import itertools
+import math
+import platform
+import subprocess
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of values, p in [0, 100]"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies):
+    """Latency summary in milliseconds"""
+    return {
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else None,
+    }
+
+
+class QueryCounter:
+    """Counts the SQL statements executed while installed as a connection execute wrapper, across threads"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def track(self):
+        """Counts the statements of the current thread's connection"""
+        with connection.execute_wrapper(self):
+            yield self
+
+
+def run_concurrently(task, concurrency, total, setup=None, query_counter=None):
+    """Runs task `total` times over `concurrency` threads; returns (latencies, elapsed seconds)"""
+    counter = itertools.count()
+    latencies = []
+    errors = []
+
+    def worker():
+        context = setup() if setup else None
+        try:
+            with query_counter.track() if query_counter else nullcontext():
+                while next(counter) < total:
+                    started = time.perf_counter()
+                    try:
+                        task(context)
+                    except Exception as e:
+                        errors.append(e)
+                    latencies.append(time.perf_counter() - started)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    if errors:
+        raise errors[0]
+
+    return latencies, elapsed
+
+
+async def run_concurrently_async(task, concurrency, total):
+    """Runs the coroutine function task `total` times over `concurrency` tasks; returns (latencies, elapsed seconds)"""
+    counter = itertools.count()
+    latencies = []
+
+    async def worker():
+        while next(counter) < total:
+            started = time.perf_counter()
+            await task()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+@contextmanager
+def benchmark_database():
+    """Runs the benchmark against a throwaway test database, like the test runner does"""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def benchmark_metadata():
+    """Identifies where a result came from, so results of different commits can be compared"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+    }
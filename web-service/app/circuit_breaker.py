@@ -0,0 +1,94 @@
+import time
+from django.conf import settings
+from redis.exceptions import RedisError
+from app.redis_client import RedisClient
+
+BREAKER_KEY = 'exchanger:breaker:{exchanger_id}'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Returns 1 when a call may go out. Once the cooldown of an open circuit is over, the circuit turns half-open
+# and lets exactly one probe through; another probe is allowed only if that one never reports back.
+ALLOW_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'closed' then
+    return 1
+end
+local now = tonumber(ARGV[1])
+if now < tonumber(redis.call('HGET', KEYS[1], 'retry_at') or 0) then
+    redis.call('HINCRBY', KEYS[1], 'rejected', 1)
+    return 0
+end
+redis.call('HSET', KEYS[1], 'state', 'half_open', 'retry_at', tostring(now + tonumber(ARGV[2])))
+return 1
+"""
+
+# A success closes the circuit. FAILURES consecutive failures, or a failed probe, open it for COOLDOWN seconds.
+RECORD_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if ARGV[1] == '1' then
+    redis.call('HSET', KEYS[1], 'state', 'closed', 'failures', 0)
+    return 1
+end
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+if state == 'half_open' or failures >= tonumber(ARGV[3]) then
+    if state ~= 'open' then
+        redis.call('HINCRBY', KEYS[1], 'opened', 1)
+    end
+    redis.call('HSET', KEYS[1], 'state', 'open', 'retry_at', tostring(tonumber(ARGV[2]) + tonumber(ARGV[4])))
+end
+return 1
+"""
+
+
+def record_args(ok):
+    return ['1' if ok else '0', time.time(), getattr(settings, "EXCHANGER_BREAKER_FAILURES", 5),
+            getattr(settings, "EXCHANGER_BREAKER_COOLDOWN", 30)]
+
+
+class CircuitBreaker:
+    """
+    Per-exchanger circuit breaker shared by every worker through Redis. While a circuit is open, calls to
+    the exchanger are refused at once instead of each waiting for the request timeout.
+    """
+
+    def __init__(self, redis_client=None):
+        self.client = (redis_client or RedisClient()).client
+        self.allow_script = self.client.register_script(ALLOW_SCRIPT)
+        self.record_script = self.client.register_script(RECORD_SCRIPT)
+
+    def allow(self, exchanger_id):
+        """Whether a call may go out now; with Redis down the breaker stays closed"""
+        try:
+            return self.allow_script(
+                keys=[BREAKER_KEY.format(exchanger_id=exchanger_id)],
+                args=[time.time(), getattr(settings, "EXCHANGER_REQUEST_TIMEOUT", 60)],
+            ) == 1
+        except RedisError:
+            return True
+
+    def retry_after(self, exchanger_id):
+        """Seconds until an open circuit lets a probe through"""
+        try:
+            retry_at = self.client.hget(BREAKER_KEY.format(exchanger_id=exchanger_id), 'retry_at')
+        except RedisError:
+            return 0
+        return max(float(retry_at or 0) - time.time(), 0)
+
+
+def breaker_state(row):
+    """Parses the HGETALL of a breaker key"""
+    return {
+        'state': row.get(b'state', CLOSED.encode()).decode(),
+        'failures': int(row.get(b'failures', 0)),
+        'opened': int(row.get(b'opened', 0)),
+        'rejected': int(row.get(b'rejected', 0)),
+        'retry_at': float(row.get(b'retry_at', 0)),
+    }
+
+
+def is_open(state, now=None):
+    """Whether the circuit refuses calls right now"""
+    return state['state'] != CLOSED and (now or time.time()) < state['retry_at']
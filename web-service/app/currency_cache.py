@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from django.conf import settings
+from redis.exceptions import RedisError
+from app.models import CryptoCurrency
+from app.redis_client import RedisClient
+from app.async_db import database_sync_to_async
+
+VERSION_KEY = 'crypto_currency:version'
+INVALIDATION_CHANNEL = 'crypto_currency:invalidate'
+
+CachedCurrency = namedtuple('CachedCurrency', ['id', 'symbol', 'price'])
+
+
+class CurrencyCache:
+    """
+    Process-wide snapshot of the CryptoCurrency table keyed by symbol.
+
+    A snapshot is never used for longer than CURRENCY_CACHE_TTL seconds, which bounds how stale a charged
+    price can be. Changes are pushed earlier through Redis pub/sub: every change bumps a version counter and
+    publishes it, and snapshots loaded before that version are dropped.
+    """
+
+    def __init__(self):
+        self.redis_client = RedisClient()
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_pid = None
+
+    @property
+    def ttl(self):
+        return getattr(settings, "CURRENCY_CACHE_TTL", 5)
+
+    def get(self, symbol):
+        currency = self._currencies().get(symbol)
+        if currency is None:
+            raise CryptoCurrency.DoesNotExist(f"CryptoCurrency {symbol} does not exist")
+        return currency
+
+    def exists(self, symbol):
+        return symbol in self._currencies()
+
+    def symbols(self):
+        return list(self._currencies())
+
+    async def aget(self, symbol):
+        """Like get, for async code; only reloading an expired snapshot leaves the event loop"""
+        currency = (await self._acurrencies()).get(symbol)
+        if currency is None:
+            raise CryptoCurrency.DoesNotExist(f"CryptoCurrency {symbol} does not exist")
+        return currency
+
+    async def asymbols(self):
+        return list(await self._acurrencies())
+
+    def invalidate(self, version=None):
+        """Drops the snapshot, or only a snapshot loaded before `version`"""
+        snapshot = self._snapshot
+        if snapshot is not None and (version is None or snapshot[1] < version):
+            self._snapshot = None
+
+    def publish_change(self):
+        """Announces a currency change to every process, including this one"""
+        self.invalidate()
+        try:
+            version = self.redis_client.client.incr(VERSION_KEY)
+            self.redis_client.client.publish(INVALIDATION_CHANNEL, version)
+        except RedisError:
+            # Other processes still pick the change up once their TTL expires
+            pass
+
+    def _currencies(self):
+        self._ensure_listener()
+
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot[0] > self.ttl:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or time.monotonic() - snapshot[0] > self.ttl:
+                    snapshot = self._load()
+                    self._snapshot = snapshot
+
+        return snapshot[2]
+
+    async def _acurrencies(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot[0] <= self.ttl:
+            return snapshot[2]
+        return await database_sync_to_async(self._currencies)()
+
+    def _load(self):
+        # The version is read before the table, so a change racing with the load is never masked
+        try:
+            version = int(self.redis_client.client.get(VERSION_KEY) or 0)
+        except RedisError:
+            version = 0
+
+        currencies = {
+            symbol: CachedCurrency(id, symbol, price)
+            for id, symbol, price in CryptoCurrency.objects.values_list('id', 'symbol', 'price')
+        }
+        return time.monotonic(), version, currencies
+
+    def _ensure_listener(self):
+        # A forked child (an RQ work horse, a preforked web worker) inherits the listener but not its thread
+        if self._listener_pid != os.getpid():
+            with self._lock:
+                if self._listener_pid != os.getpid():
+                    self._listener = threading.Thread(target=self._listen, name="currency-cache", daemon=True)
+                    self._listener.start()
+                    self._listener_pid = os.getpid()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis_client.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything published while we were not subscribed is unknown, so start from a fresh snapshot
+                self.invalidate()
+                for message in pubsub.listen():
+                    self.invalidate(int(message['data']))
+            except RedisError:
+                self.invalidate()
+                time.sleep(1)
+
+
+currency_cache = CurrencyCache()
@@ -0,0 +1,33 @@
+import asyncio
+import httpx
+
+
+class AsyncExchangerClient:
+    """Keeps one pooled keep-alive HTTP client and a bounded number of in-flight requests per exchanger"""
+
+    def __init__(self, max_in_flight, timeout):
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self._pools = {}
+
+    def _pool(self, exchanger):
+        if exchanger.id not in self._pools:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_in_flight,
+                    max_keepalive_connections=self.max_in_flight,
+                ),
+            )
+            self._pools[exchanger.id] = (client, asyncio.Semaphore(self.max_in_flight))
+        return self._pools[exchanger.id]
+
+    async def post(self, exchanger, data):
+        client, in_flight = self._pool(exchanger)
+        async with in_flight:
+            return await client.post(exchanger.api_url, json=data)
+
+    async def aclose(self):
+        for client, _ in self._pools.values():
+            await client.aclose()
+        self._pools = {}
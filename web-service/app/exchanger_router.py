@@ -0,0 +1,134 @@
+from decimal import Decimal
+from django.conf import settings
+from redis.exceptions import RedisError
+from app.models import Exchanger
+from app.redis_client import RedisClient, AsyncRedisClient
+from app import circuit_breaker
+from app.circuit_breaker import BREAKER_KEY, CircuitBreaker, breaker_state, is_open
+
+STATS_KEY = 'exchanger:stats:{exchanger_id}'
+
+# Exponentially weighted moving averages of latency and error rate; stats of an exchanger that gets no
+# traffic expire, so an exchanger routed around for being unhealthy is tried again after EXCHANGER_STATS_TTL
+RECORD_SCRIPT = """
+local alpha = tonumber(ARGV[3])
+local latency = tonumber(redis.call('HGET', KEYS[1], 'latency') or ARGV[1])
+local error_rate = tonumber(redis.call('HGET', KEYS[1], 'error_rate') or ARGV[2])
+latency = latency + alpha * (tonumber(ARGV[1]) - latency)
+error_rate = error_rate + alpha * (tonumber(ARGV[2]) - error_rate)
+redis.call('HSET', KEYS[1], 'latency', tostring(latency), 'error_rate', tostring(error_rate))
+redis.call('HINCRBY', KEYS[1], 'samples', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+def record_args(latency, ok):
+    return [latency, 0 if ok else 1, getattr(settings, "EXCHANGER_STATS_ALPHA", 0.2),
+            getattr(settings, "EXCHANGER_STATS_TTL", 300)]
+
+
+class ExchangerRouter:
+    """
+    Routes batches to the cheapest healthy active exchanger. Latency and error rate of every exchanger call
+    are tracked in Redis, so all batch makers and settle workers route on the same view.
+    """
+
+    def __init__(self):
+        self.client = RedisClient().client
+        self.record_script = self.client.register_script(RECORD_SCRIPT)
+        self.breaker = CircuitBreaker()
+
+    def record(self, exchanger_id, latency, ok):
+        """Feeds the outcome of an exchanger call to its routing stats and its circuit breaker"""
+        try:
+            with RedisClient().pipelined() as pipeline:
+                self.record_script(keys=[STATS_KEY.format(exchanger_id=exchanger_id)],
+                                   args=record_args(latency, ok), client=pipeline)
+                self.breaker.record_script(keys=[BREAKER_KEY.format(exchanger_id=exchanger_id)],
+                                           args=circuit_breaker.record_args(ok), client=pipeline)
+        except RedisError:
+            pass
+
+    async def arecord(self, exchanger_id, latency, ok):
+        client = AsyncRedisClient().client
+        try:
+            await client.register_script(RECORD_SCRIPT)(
+                keys=[STATS_KEY.format(exchanger_id=exchanger_id)], args=record_args(latency, ok)
+            )
+            await client.register_script(circuit_breaker.RECORD_SCRIPT)(
+                keys=[BREAKER_KEY.format(exchanger_id=exchanger_id)], args=circuit_breaker.record_args(ok)
+            )
+        except RedisError:
+            pass
+
+    def stats(self, exchangers):
+        """Returns {exchanger_id: {'latency', 'error_rate', 'samples', 'breaker'}} in one round trip"""
+        try:
+            pipeline = RedisClient().pipeline()
+            for exchanger in exchangers:
+                pipeline.hgetall(STATS_KEY.format(exchanger_id=exchanger.id))
+                pipeline.hgetall(BREAKER_KEY.format(exchanger_id=exchanger.id))
+            rows = pipeline.execute()
+        except RedisError:
+            rows = [{}] * (2 * len(exchangers))
+
+        return {
+            exchanger.id: {
+                'latency': float(stats_row.get(b'latency', 0)),
+                'error_rate': float(stats_row.get(b'error_rate', 0)),
+                'samples': int(stats_row.get(b'samples', 0)),
+                'breaker': breaker_state(breaker_row),
+            }
+            for exchanger, stats_row, breaker_row in zip(exchangers, rows[::2], rows[1::2])
+        }
+
+    def is_healthy(self, stats):
+        if stats['samples'] < getattr(settings, "EXCHANGER_MIN_SAMPLES", 5):
+            return True
+        return stats['error_rate'] < getattr(settings, "EXCHANGER_MAX_ERROR_RATE", 0.5)
+
+    def rank(self, exchangers):
+        """Exchangers with a closed circuit first, then healthy ones, then by fee and by latency"""
+        stats = self.stats(exchangers)
+
+        def key(exchanger):
+            exchanger_stats = stats[exchanger.id]
+            return (is_open(exchanger_stats['breaker']), not self.is_healthy(exchanger_stats),
+                    exchanger.fee_percentage, exchanger_stats['latency'], exchanger.id)
+
+        return sorted(exchangers, key=key)
+
+    def choose(self, amount=None, exclude=(), multi_leg=False):
+        """
+        Picks the best active exchanger outside `exclude` that accepts `amount` in one request. A constraint
+        no exchanger satisfies is dropped, so there is a pick as long as one exchanger is active; `multi_leg`
+        is never dropped.
+        """
+        exchangers = Exchanger.objects.filter(is_active=True)
+        if multi_leg:
+            exchangers = exchangers.filter(supports_multi_leg=True)
+        exchangers = list(exchangers)
+        if not exchangers:
+            raise ValueError("No exchanger found")
+
+        candidates = [exchanger for exchanger in exchangers if exchanger.id not in exclude] or exchangers
+        if amount is not None:
+            candidates = [exchanger for exchanger in candidates if capacity(exchanger) >= amount] or candidates
+        return self.rank(candidates)[0]
+
+    def failover(self, exchange_transaction):
+        """Moves a batch that is about to be retried to another exchanger, when there is one"""
+        try:
+            exchanger = self.choose(exchange_transaction.amount, exclude=[exchange_transaction.exchanger_id],
+                                    multi_leg=bool(exchange_transaction.legs))
+        except ValueError:
+            return exchange_transaction.exchanger
+        if exchanger.id != exchange_transaction.exchanger_id:
+            exchange_transaction.exchanger = exchanger
+            exchange_transaction.save(update_fields=['exchanger'])
+        return exchanger
+
+
+def capacity(exchanger):
+    return Decimal('Infinity') if exchanger.max_batch_amount is None else exchanger.max_batch_amount
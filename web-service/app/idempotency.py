@@ -0,0 +1,344 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import asyncio
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.http import JsonResponse
+from redis.exceptions import RedisError
+from rest_framework import status
+from rest_framework.response import Response
+from app.redis_client import RedisClient, AsyncRedisClient
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+IDEMPOTENCY_KEY = 'idempotency:{user_id}:{key}'
+MAX_KEY_LENGTH = 255
+
+# Replaces the value only while it is still the caller's own in-flight marker
+COMPLETE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+REFRESH_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def request_payload(request):
+    """Parses the body of a plain Django request like DRF does for the sync views; raises ValueError on bad JSON"""
+    if request.content_type == "application/json":
+        return json.loads(request.body)
+    return request.POST.dict()
+
+
+def request_fingerprint(method, data):
+    """
+    Fingerprint of a request's method and parsed payload, as canonical JSON. The sync and async endpoints share
+    their keys, so the same purchase fingerprints the same whichever endpoint parsed it.
+    """
+    if hasattr(data, 'dict'):
+        # A form-encoded QueryDict
+        data = data.dict()
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{method} {body}".encode()).hexdigest()
+
+
+def in_flight_marker(fingerprint):
+    return json.dumps({'state': 'in_flight', 'fingerprint': fingerprint, 'token': str(uuid.uuid4())})
+
+
+def done_entry(fingerprint, status_code, data):
+    return json.dumps({'state': 'done', 'fingerprint': fingerprint, 'status': status_code, 'data': data}, default=str)
+
+
+def stored_outcome(stored, fingerprint):
+    """
+    Returns (status, data, replayed) for a request whose key already holds `stored`: the stored response, or
+    the rejection of a key reused for a different request. Returns None while the first request still runs.
+    """
+    entry = json.loads(stored)
+    if entry['fingerprint'] != fingerprint:
+        return (status.HTTP_422_UNPROCESSABLE_ENTITY,
+                {"error": f"{IDEMPOTENCY_HEADER} was already used for a different request"}, False)
+    if entry['state'] == 'done':
+        return entry['status'], entry['data'], True
+    return None
+
+
+IN_FLIGHT_CONFLICT = (status.HTTP_409_CONFLICT,
+                      {"error": f"A request with this {IDEMPOTENCY_HEADER} is still being processed"}, False)
+
+
+def idempotent(view):
+    """
+    Honours an Idempotency-Key header on a DRF function view; goes below @api_view so the user is authenticated.
+
+    The first request with a key runs the view behind an in-flight marker in Redis and stores its response
+    for IDEMPOTENCY_TTL seconds. Retries with the same key wait for that execution and replay its response
+    without running the view again. Reusing a key for a different request is rejected. Server errors are
+    not stored, so the client can retry them.
+    """
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({"error": f"{IDEMPOTENCY_HEADER} can have at most {MAX_KEY_LENGTH} characters"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        redis_key = IDEMPOTENCY_KEY.format(user_id=request.user.id, key=key)
+        fingerprint = request_fingerprint(request.method, request.data)
+        try:
+            store = IdempotencyStore()
+            marker, replay = store.claim(redis_key, fingerprint)
+        except RedisError:
+            # Without Redis the request is still served, only without the dedupe
+            return view(request, *args, **kwargs)
+
+        if replay is not None:
+            return replay
+
+        try:
+            with in_flight(redis_key, marker):
+                response = view(request, *args, **kwargs)
+        except BaseException:
+            store.release(redis_key, marker)
+            raise
+
+        store.complete(redis_key, marker, fingerprint, response)
+        return response
+
+    return wrapper
+
+
+class InFlightRefresher(threading.Thread):
+    """
+    Extends the in-flight markers of the requests the process is running every third of IDEMPOTENCY_LOCK_TIMEOUT,
+    so a request slower than the timeout keeps its key; the marker of a process that died still expires.
+    """
+
+    def __init__(self):
+        super().__init__(name="idempotency-refresher", daemon=True)
+        self.pid = os.getpid()
+        self.markers = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        refresh = RedisClient().client.register_script(REFRESH_SCRIPT)
+        while True:
+            lock_timeout = getattr(settings, "IDEMPOTENCY_LOCK_TIMEOUT", 30)
+            if self.stopped.wait(lock_timeout / 3):
+                return
+            # Copying a dict is atomic under the GIL, so requests can come and go meanwhile
+            markers = self.markers.copy()
+            if not markers:
+                continue
+            try:
+                with RedisClient().pipelined() as pipeline:
+                    for redis_key, marker in markers.items():
+                        refresh(keys=[redis_key], args=[marker, int(lock_timeout * 1000)], client=pipeline)
+            except RedisError:
+                logger.warning("Could not refresh %s in-flight idempotency markers", len(markers))
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def refresher():
+    """The process's InFlightRefresher, started again in a forked child, where the parent's thread does not run"""
+    global _refresher
+    if _refresher is None or _refresher.pid != os.getpid():
+        with _refresher_lock:
+            if _refresher is None or _refresher.pid != os.getpid():
+                _refresher = InFlightRefresher()
+                _refresher.start()
+    return _refresher
+
+
+@contextmanager
+def in_flight(redis_key, marker):
+    """Keeps the in-flight marker alive while the block runs"""
+    markers = refresher().markers
+    markers[redis_key] = marker
+    try:
+        yield
+    finally:
+        markers.pop(redis_key, None)
+
+
+class IdempotencyStore:
+    """Idempotency keys in Redis: an in-flight marker while the first request runs, then its stored response"""
+
+    def __init__(self):
+        self.client = RedisClient().client
+        self.complete_script = self.client.register_script(COMPLETE_SCRIPT)
+        self.release_script = self.client.register_script(RELEASE_SCRIPT)
+        self.ttl = getattr(settings, "IDEMPOTENCY_TTL", 86400)
+        self.lock_timeout = getattr(settings, "IDEMPOTENCY_LOCK_TIMEOUT", 30)
+        self.wait_timeout = getattr(settings, "IDEMPOTENCY_WAIT_TIMEOUT", 10)
+        self.poll_interval = getattr(settings, "IDEMPOTENCY_POLL_INTERVAL", 0.05)
+
+    def claim(self, redis_key, fingerprint):
+        """
+        Returns (marker, None) once this request owns the key, or (None, response) when the request must not run:
+        a stored response to replay, a fingerprint mismatch or a wait that timed out
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        marker = in_flight_marker(fingerprint)
+
+        while True:
+            if self.client.set(redis_key, marker, nx=True, px=int(self.lock_timeout * 1000)):
+                return marker, None
+
+            stored = self.client.get(redis_key)
+            if stored is None:
+                # The other execution failed and released the key; take it over
+                continue
+
+            outcome = stored_outcome(stored, fingerprint)
+            if outcome is None and time.monotonic() >= deadline:
+                outcome = IN_FLIGHT_CONFLICT
+            if outcome is not None:
+                status_code, data, replayed = outcome
+                response = Response(data, status=status_code)
+                if replayed:
+                    response[REPLAYED_HEADER] = 'true'
+                return None, response
+            time.sleep(self.poll_interval)
+
+    def complete(self, redis_key, marker, fingerprint, response):
+        """Stores the response for replays; server errors release the key instead so the client can retry"""
+        if response.status_code >= 500:
+            return self.release(redis_key, marker)
+
+        entry = done_entry(fingerprint, response.status_code, response.data)
+        try:
+            self.complete_script(keys=[redis_key], args=[marker, entry, int(self.ttl * 1000)])
+        except RedisError:
+            # The marker expires after IDEMPOTENCY_LOCK_TIMEOUT and the key becomes usable again
+            pass
+
+    def release(self, redis_key, marker):
+        try:
+            self.release_script(keys=[redis_key], args=[marker])
+        except RedisError:
+            pass
+
+
+def async_idempotent(view):
+    """
+    Honours an Idempotency-Key header on an async view called with (request, user), like @idempotent does
+    for DRF views. Keys are shared with the sync views, and Redis is only awaited on the event loop.
+    """
+
+    @functools.wraps(view)
+    async def wrapper(request, user, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return await view(request, user, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse({"error": f"{IDEMPOTENCY_HEADER} can have at most {MAX_KEY_LENGTH} characters"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            payload = request_payload(request)
+        except ValueError:
+            # Rejected by the view before anything runs
+            return await view(request, user, *args, **kwargs)
+
+        redis_key = IDEMPOTENCY_KEY.format(user_id=user.id, key=key)
+        fingerprint = request_fingerprint(request.method, payload)
+        try:
+            store = AsyncIdempotencyStore()
+            marker, replay = await store.claim(redis_key, fingerprint)
+        except RedisError:
+            return await view(request, user, *args, **kwargs)
+
+        if replay is not None:
+            return replay
+
+        try:
+            with in_flight(redis_key, marker):
+                response = await view(request, user, *args, **kwargs)
+        except BaseException:
+            await store.release(redis_key, marker)
+            raise
+
+        await store.complete(redis_key, marker, fingerprint, response)
+        return response
+
+    return wrapper
+
+
+class AsyncIdempotencyStore(IdempotencyStore):
+    """IdempotencyStore on the event loop, for views returning a JsonResponse"""
+
+    def __init__(self):
+        super().__init__()
+        self.client = AsyncRedisClient().client
+        self.complete_script = self.client.register_script(COMPLETE_SCRIPT)
+        self.release_script = self.client.register_script(RELEASE_SCRIPT)
+
+    async def claim(self, redis_key, fingerprint):
+        deadline = time.monotonic() + self.wait_timeout
+        marker = in_flight_marker(fingerprint)
+
+        while True:
+            if await self.client.set(redis_key, marker, nx=True, px=int(self.lock_timeout * 1000)):
+                return marker, None
+
+            stored = await self.client.get(redis_key)
+            if stored is None:
+                continue
+
+            outcome = stored_outcome(stored, fingerprint)
+            if outcome is None and time.monotonic() >= deadline:
+                outcome = IN_FLIGHT_CONFLICT
+            if outcome is not None:
+                status_code, data, replayed = outcome
+                response = JsonResponse(data, status=status_code)
+                if replayed:
+                    response[REPLAYED_HEADER] = 'true'
+                return None, response
+            await asyncio.sleep(self.poll_interval)
+
+    async def complete(self, redis_key, marker, fingerprint, response):
+        if response.status_code >= 500:
+            return await self.release(redis_key, marker)
+
+        entry = done_entry(fingerprint, response.status_code, json.loads(response.content))
+        try:
+            await self.complete_script(keys=[redis_key], args=[marker, entry, int(self.ttl * 1000)])
+        except RedisError:
+            pass
+
+    async def release(self, redis_key, marker):
+        try:
+            await self.release_script(keys=[redis_key], args=[marker])
+        except RedisError:
+            pass
@@ -0,0 +1,288 @@
+import logging
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BigIntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from app.models import LedgerCheckpoint, LedgerEntry, UserWallet
+from app.redis_client import RedisClient
+
+logger = logging.getLogger(__name__)
+
+# A user's balance is available + locked; locked_balance is the locked account alone
+USER_ACCOUNTS = ('available', 'locked')
+
+SPENDING_LOCK_KEY = 'ledger:spending:{user_id}'
+# Open ledger transactions, scored by the time their mark expires
+WRITERS_KEY = 'ledger:writers'
+
+
+def ledger_enabled():
+    return getattr(settings, "LEDGER_ENABLED", False)
+
+
+def entry(user_id, account, kind, amount, reference=''):
+    return LedgerEntry(user_id=user_id, account=account, kind=kind, amount=amount, reference=reference)
+
+
+def opening_entries(user_id, balance_delta, locked_delta, reference=''):
+    """Brings money from outside the ledger into the user's accounts"""
+    return [
+        entry(user_id, 'available', 'opening', balance_delta - locked_delta, reference),
+        entry(user_id, 'locked', 'opening', locked_delta, reference),
+        entry(None, 'external', 'opening', -balance_delta, reference),
+    ]
+
+
+def lock_entries(user_id, amount, reference=''):
+    return [
+        entry(user_id, 'available', 'lock', -amount, reference),
+        entry(user_id, 'locked', 'lock', amount, reference),
+    ]
+
+
+def settle_entries(user_id, amount, status, reference=''):
+    """A completed batch pays the locked amount to the exchange; a failed one gives it back"""
+    if status == 'Completed':
+        return [
+            entry(user_id, 'locked', 'settle', -amount, reference),
+            entry(None, 'exchange', 'settle', amount, reference),
+        ]
+    return [
+        entry(user_id, 'locked', 'release', -amount, reference),
+        entry(user_id, 'available', 'release', amount, reference),
+    ]
+
+
+def record(entries):
+    """Appends the entries with one INSERT; no row is locked or updated. A no-op unless LEDGER_ENABLED"""
+    if ledger_enabled() and entries:
+        LedgerEntry.objects.bulk_create(entries)
+
+
+@contextmanager
+def writing():
+    """
+    Marks the block as an open ledger transaction until it commits or rolls back, so compaction can wait for
+    entries whose ids are taken but not committed yet. The mark of a process that died expires after
+    LEDGER_WRITE_TIMEOUT seconds.
+    """
+    if not ledger_enabled():
+        yield
+        return
+
+    client = RedisClient().client
+    token = uuid.uuid4().hex
+    client.zadd(WRITERS_KEY, {token: time.time() + getattr(settings, "LEDGER_WRITE_TIMEOUT", 60)})
+    try:
+        yield
+    finally:
+        client.zrem(WRITERS_KEY, token)
+
+
+@contextmanager
+def atomic():
+    """A database transaction that appends ledger entries"""
+    with writing(), transaction.atomic():
+        yield
+
+
+class Funds:
+    """A user's available balance inside their spending lock; amounts locked through it are recorded together"""
+
+    def __init__(self, user_id, available):
+        self.user_id = user_id
+        self.available = available
+        self.entries = []
+
+    def lock(self, amount, reference=''):
+        self.available -= amount
+        self.entries += lock_entries(self.user_id, amount, reference)
+
+
+@contextmanager
+def spending(user_id):
+    """
+    Yields the user's Funds inside a ledger transaction and appends what was locked through them. The balance
+    check is serialized by a Redis lock of the user's own, held until the transaction commits: no row is
+    locked, settlements append without taking it, and other users never wait on it.
+    """
+    lock = RedisClient().client.lock(
+        SPENDING_LOCK_KEY.format(user_id=user_id),
+        timeout=getattr(settings, "LEDGER_WRITE_TIMEOUT", 60),
+        blocking_timeout=getattr(settings, "LEDGER_SPENDING_WAIT", 10),
+    )
+    if not lock.acquire():
+        raise TimeoutError("The wallet is busy, try again")
+    try:
+        with atomic():
+            funds = Funds(user_id, account_balances([user_id])[(user_id, 'available')])
+            yield funds
+            record(funds.entries)
+    finally:
+        lock.release()
+
+
+def tail_entries():
+    """User entries not folded into their account's checkpoint yet"""
+    last_entry_id = LedgerCheckpoint.objects.filter(
+        user_id=OuterRef('user_id'), account=OuterRef('account')
+    ).values('last_entry_id')
+    return LedgerEntry.objects.filter(
+        user__isnull=False,
+        id__gt=Coalesce(Subquery(last_entry_id), Value(0), output_field=BigIntegerField()),
+    )
+
+
+def account_balances(user_ids):
+    """Returns {(user_id, account): balance} from the checkpoints plus the tail, in two queries"""
+    balances = defaultdict(Decimal)
+    for user_id, account, balance in LedgerCheckpoint.objects.filter(user_id__in=user_ids) \
+            .values_list('user_id', 'account', 'balance'):
+        balances[(user_id, account)] += balance
+
+    tail = tail_entries().filter(user_id__in=user_ids).order_by().values('user_id', 'account') \
+        .annotate(total=Sum('amount')).values_list('user_id', 'account', 'total')
+    for user_id, account, total in tail:
+        balances[(user_id, account)] += total
+    return balances
+
+
+def balances(user_ids):
+    """Returns {user_id: {'balance', 'locked_balance'}} as the ledger has them"""
+    user_ids = list(user_ids)
+    account_balance = account_balances(user_ids)
+    return {
+        user_id: {
+            'balance': account_balance[(user_id, 'available')] + account_balance[(user_id, 'locked')],
+            'locked_balance': account_balance[(user_id, 'locked')],
+        }
+        for user_id in user_ids
+    }
+
+
+def wallet(user_id):
+    """The user's wallet as the ledger has it; its version is the id of the last entry counted"""
+    snapshot = balances([user_id])[user_id]
+    snapshot['version'] = LedgerEntry.objects.filter(user_id=user_id).aggregate(version=Max('id'))['version'] or 0
+    return snapshot
+
+
+def wait_for_writers(timeout):
+    """Waits until every ledger transaction open now has ended; returns False if one is still open at `timeout`"""
+    client = RedisClient().client
+    client.zremrangebyscore(WRITERS_KEY, '-inf', time.time())
+    writers = client.zrange(WRITERS_KEY, 0, -1)
+    deadline = time.monotonic() + timeout
+    while writers:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+        pipeline = client.pipeline(transaction=False)
+        for writer in writers:
+            pipeline.zscore(WRITERS_KEY, writer)
+        now = time.time()
+        writers = [writer for writer, expires in zip(writers, pipeline.execute())
+                   if expires is not None and expires > now]
+    return True
+
+
+def compact(chunk_size=None, wait=None):
+    """
+    Folds every committed entry into the checkpoints and returns the number of accounts advanced.
+
+    Ids are taken at insert but become visible at commit, so an open transaction may still commit an id below
+    the highest one visible. The horizon is read first and compaction then waits for the transactions open at
+    that point; one that started later takes its ids above the horizon. If they are not done within `wait`
+    seconds nothing is folded, and the next run tries again.
+    """
+    chunk_size = chunk_size or getattr(settings, "LEDGER_COMPACTION_CHUNK_SIZE", 1000)
+    wait = getattr(settings, "LEDGER_COMPACTION_WAIT", 10) if wait is None else wait
+
+    horizon = LedgerEntry.objects.aggregate(horizon=Max('id'))['horizon']
+    if horizon is None:
+        return 0
+    if not wait_for_writers(wait):
+        logger.warning("Ledger transactions are still open after %s s, compaction skipped", wait)
+        return 0
+
+    user_ids = list(tail_entries().filter(id__lte=horizon).order_by('user_id')
+                    .values_list('user_id', flat=True).distinct())
+    compacted = 0
+    for start in range(0, len(user_ids), chunk_size):
+        compacted += compact_users(user_ids[start:start + chunk_size], horizon)
+    return compacted
+
+
+def compact_users(user_ids, horizon):
+    with transaction.atomic():
+        checkpoints = {
+            (checkpoint.user_id, checkpoint.account): checkpoint
+            for checkpoint in LedgerCheckpoint.objects.select_for_update().filter(user_id__in=user_ids)
+        }
+        sums = tail_entries().filter(user_id__in=user_ids, id__lte=horizon).order_by() \
+            .values('user_id', 'account').annotate(total=Sum('amount')).values_list('user_id', 'account', 'total')
+
+        created, updated = [], []
+        for user_id, account, total in sums:
+            checkpoint = checkpoints.get((user_id, account))
+            if checkpoint is None:
+                created.append(LedgerCheckpoint(user_id=user_id, account=account, balance=total,
+                                                last_entry_id=horizon))
+            else:
+                checkpoint.balance += total
+                checkpoint.last_entry_id = horizon
+                updated.append(checkpoint)
+
+        LedgerCheckpoint.objects.bulk_create(created)
+        LedgerCheckpoint.objects.bulk_update(updated, ['balance', 'last_entry_id', 'updated_at'])
+    return len(created) + len(updated)
+
+
+def imbalance():
+    """Sum of every entry, which double entry keeps at zero"""
+    return LedgerEntry.objects.aggregate(total=Sum('amount'))['total'] or Decimal(0)
+
+
+def reconcile(chunk_size=1000):
+    """Yields (user_id, ledger balances) for every user with an account below zero, two queries per chunk"""
+    user_ids = UserWallet.objects.order_by('user_id').values_list('user_id', flat=True)
+    chunk = []
+    for user_id in user_ids.iterator(chunk_size=chunk_size):
+        chunk.append(user_id)
+        if len(chunk) == chunk_size:
+            yield from reconcile_users(chunk)
+            chunk = []
+    yield from reconcile_users(chunk)
+
+
+def reconcile_users(user_ids):
+    account_balance = account_balances(user_ids)
+    for user_id in user_ids:
+        if any(account_balance[(user_id, account)] < 0 for account in USER_ACCOUNTS):
+            yield user_id, {account: account_balance[(user_id, account)] for account in USER_ACCOUNTS}
+
+
+def open_wallets():
+    """
+    Writes opening entries that bring every user's ledger to their wallet, under the wallet row lock, and
+    returns the number of wallets opened. Run it before LEDGER_ENABLED is switched on: from then on the ledger
+    is the balance and the wallet rows are no longer written.
+    """
+    opened = 0
+    for user_id in UserWallet.objects.order_by('user_id').values_list('user_id', flat=True).iterator():
+        with transaction.atomic():
+            user_wallet = UserWallet.objects.select_for_update().filter(user_id=user_id).first()
+            if user_wallet is None:
+                continue
+            ledger_balance = balances([user_id])[user_id]
+            balance_delta = user_wallet.balance - ledger_balance['balance']
+            locked_delta = user_wallet.locked_balance - ledger_balance['locked_balance']
+            if balance_delta or locked_delta:
+                LedgerEntry.objects.bulk_create(opening_entries(user_id, balance_delta, locked_delta))
+                opened += 1
+    return opened
@@ -0,0 +1,15 @@
+import asyncio
+from django.core.management.base import BaseCommand
+from app.async_settlement import AsyncSettlementWorker
+
+
+class Command(BaseCommand):
+    help = "This command will settle exchange transactions concurrently on an asyncio event loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, help="Exchange transactions settled at once.")
+        parser.add_argument('--max-in-flight', type=int, help="Concurrent requests per exchanger.")
+
+    def handle(self, *args, **options):
+        worker = AsyncSettlementWorker(concurrency=options['concurrency'], max_in_flight=options['max_in_flight'])
+        asyncio.run(worker.run())
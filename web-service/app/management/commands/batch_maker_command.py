@@ -1,9 +1,17 @@
+import json
+import time
+from decimal import Decimal
 from django.core.management.base import BaseCommand
-from collections import defaultdict
 from django.db import transaction
+from django.db.models import DecimalField, F, Max, Min, Sum
 from django.conf import settings
-from app.models import Order, ExchangeTransaction, Exchanger, OrderExchangeTransaction
+from app.models import Order, Exchanger, ExchangeTransaction, OrderExchangeTransaction
+from app.exchanger_router import ExchangerRouter, capacity
+from app.order_events import NEW_ORDER_CHANNEL
+from app.order_cache import invalidate_orders_on_commit
 from app.redis_client import RedisClient
+from app.async_settlement import enqueue_async_settle
+from app import metrics, query_profiler
 from rq import Queue
 from app.tasks import settle
 
@@ -14,37 +22,266 @@ class Command(BaseCommand):
     def __init__(self):
         super().__init__()
         self.redis_client = RedisClient()
+        self.router = ExchangerRouter()
         self.min_batch_amount = getattr(settings, "MIN_BATCH_AMOUNT", 10)  # مقدار دیفالت ۱۰ در نظر گرفته می‌شود
+        self.chunk_size = getattr(settings, "BATCH_CLAIM_CHUNK_SIZE", 1000)
+        self.max_orders = getattr(settings, "BATCH_MAX_ORDERS", 10000)
+        self.max_latency = getattr(settings, "BATCH_MAX_LATENCY", 1.0)
+        self.reconcile_interval = getattr(settings, "BATCH_RECONCILE_INTERVAL", 30)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--daemon', action='store_true',
+                            help="Keep running and cut batches as soon as new-order signals fill them.")
 
     def handle(self, *args, **options):
-        orders = Order.objects.select_related('crypto_currency').filter(status="pending")
+        if options['daemon']:
+            return self.run_daemon()
+
+        self.make_batches([
+            pending for pending in self.pending_totals() if pending['sum_amount'] >= self.min_batch_amount
+        ])
+        metrics.flush()
+
+    def pending_totals(self, crypto_currency_ids=None):
+        """One row per symbol with the pending sum, aggregated by the database"""
+        orders = Order.objects.filter(status=Order.PENDING)
+        if crypto_currency_ids is not None:
+            orders = orders.filter(crypto_currency_id__in=crypto_currency_ids)
+
+        return (
+            orders.values('crypto_currency_id', 'crypto_currency__symbol')
+            .annotate(
+                sum_amount=Sum(F('amount') * F('count'), output_field=DecimalField(max_digits=18, decimal_places=8)),
+                max_order_id=Max('id'),
+                oldest_created_at=Min('created_at'),
+            )
+            .order_by('crypto_currency_id')
+        )
+
+    def run_daemon(self):
+        """
+        Cuts a batch per symbol once MIN_BATCH_AMOUNT is pending or its oldest order has waited
+        BATCH_MAX_LATENCY seconds, whichever comes first. Pub/sub is fire-and-forget, so the
+        in-memory view is re-seeded from the database every BATCH_RECONCILE_INTERVAL seconds.
+        """
+        pubsub = self.redis_client.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(NEW_ORDER_CHANNEL)
+
+        pending = self.reconcile()
+        next_reconcile = time.time() + self.reconcile_interval
+
+        while True:
+            message = pubsub.get_message(timeout=min(self.max_latency / 4, 0.1))
+            if message:
+                self.on_new_order(pending, json.loads(message['data']))
+
+            self.cut_expired(pending, time.time())
+
+            if time.time() >= next_reconcile:
+                pending = self.reconcile()
+                next_reconcile = time.time() + self.reconcile_interval
+
+    def reconcile(self):
+        """Rebuilds the per-symbol pending view from the database"""
+        return {
+            row['crypto_currency_id']: {
+                'symbol': row['crypto_currency__symbol'],
+                'amount': row['sum_amount'],
+                'since': row['oldest_created_at'].timestamp(),
+            }
+            for row in self.pending_totals()
+        }
+
+    def on_new_order(self, pending, signal):
+        entry = pending.setdefault(signal['crypto_currency_id'], {
+            'symbol': signal['symbol'],
+            'amount': Decimal(0),
+            'since': time.time(),
+        })
+        entry['amount'] += Decimal(signal['amount'])
+
+        if entry['amount'] >= self.min_batch_amount:
+            self.cut(pending, signal['crypto_currency_id'])
+
+    def cut_expired(self, pending, now):
+        expired = [crypto_currency_id for crypto_currency_id, entry in pending.items()
+                   if now - entry['since'] >= self.max_latency]
+        for crypto_currency_id in expired:
+            pending.pop(crypto_currency_id)
+        if expired:
+            self.make_batches(list(self.pending_totals(expired)))
+
+    def cut(self, pending, crypto_currency_id):
+        pending.pop(crypto_currency_id, None)
+        for row in self.pending_totals([crypto_currency_id]):
+            self.make_batch(row['crypto_currency_id'], row['crypto_currency__symbol'], row['max_order_id'])
+
+    def make_batches(self, rows):
+        """
+        Cuts the pending_totals rows of several symbols at once: into multi-leg batches when an active exchanger
+        takes them, so one upstream request settles every symbol, or else into batches per symbol
+        """
+        if len(rows) > 1 and getattr(settings, "MULTI_LEG_BATCHING", True) \
+                and Exchanger.objects.filter(is_active=True, supports_multi_leg=True).exists():
+            return self.make_multi_leg_batch(rows)
 
-        orders_based_symbol = defaultdict(list)
-        for order in orders:
-            orders_based_symbol[order.crypto_currency.symbol].append(order)
+        return [
+            exchange_transaction for row in rows
+            for exchange_transaction in self.make_batch(row['crypto_currency_id'], row['crypto_currency__symbol'],
+                                                        row['max_order_id'])
+        ]
 
-        for symbol, orders in orders_based_symbol.items():
-            sum_amount = sum(order.amount * order.count for order in orders)
-            order_ids = [order.id for order in orders]
+    def make_batch(self, crypto_currency_id, symbol, max_order_id):
+        """
+        Cuts the pending orders of a symbol into batches. A batch is capped by its exchanger's max_batch_amount,
+        and the next batch goes to another exchanger, so a large backlog is spread over every healthy upstream.
+        """
+        with metrics.BATCH_SECONDS.time(symbol=symbol), query_profiler.profile("batch_maker"):
+            return self.cut_batches(
+                lambda used: self.create_exchange_transaction(crypto_currency_id, max_order_id, used), symbol
+            )
 
-            if sum_amount >= self.min_batch_amount:
-                exchange_transaction = self.create_exchange_transaction(orders, order_ids, sum_amount)
-                queue = Queue(connection=self.redis_client.client, name=symbol)
+    def make_multi_leg_batch(self, rows):
+        """Like make_batch, with the orders of every row netted into one batch with a leg per symbol"""
+        with metrics.BATCH_SECONDS.time(symbol="multi_leg"), query_profiler.profile("batch_maker"):
+            return self.cut_batches(lambda used: self.create_multi_leg_transaction(rows, used), None)
+
+    def cut_batches(self, create, symbol):
+        exchange_transactions = []
+        while True:
+            used = [exchange_transaction.exchanger_id for exchange_transaction in exchange_transactions]
+            exchange_transaction = create(used)
+            if not exchange_transaction:
+                break
+
+            # Multi-leg batches have no symbol and are settled from the default queue
+            if getattr(settings, "SETTLEMENT_BACKEND", "rq") == "async":
+                enqueue_async_settle(exchange_transaction.id, symbol)
+            else:
+                queue = Queue(connection=self.redis_client.client, name=symbol or 'default')
                 queue.enqueue(settle, exchange_transaction.id, symbol)
+            exchange_transactions.append(exchange_transaction)
 
-    def create_exchange_transaction(self, orders, order_ids, amount):
+            # A batch cut short by BATCH_MAX_ORDERS leaves orders for the next one, whatever the exchanger's capacity
+            if exchange_transaction.exchanger.max_batch_amount is None \
+                    and exchange_transaction.order_count < self.max_orders:
+                break
+        return exchange_transactions
+
+    def create_exchange_transaction(self, crypto_currency_id, max_order_id, used_exchangers=()):
+        """
+        Claims the pending orders of a symbol up to max_order_id into a batch for the exchanger the router picked.
+        Claiming stops at the exchanger's capacity or at BATCH_MAX_ORDERS orders; the rest is left for the next batch.
+        """
         with transaction.atomic():
-            Order.objects.filter(id__in=order_ids).update(status="processing")
+            exchanger = self.router.choose(exclude=used_exchangers)
+            exchange_transaction = ExchangeTransaction.objects.create(exchanger=exchanger, amount=0)
 
-            exchanger = Exchanger.objects.first()
-            if not exchanger:
-                raise ValueError("No exchanger found")
+            amount, order_count, _ = self.claim_orders(
+                exchange_transaction, crypto_currency_id, max_order_id, capacity(exchanger), max_orders=self.max_orders
+            )
 
-            exchange_transaction = ExchangeTransaction.objects.create(exchanger=exchanger, amount=amount)
+            if not amount:
+                # Another batch maker claimed these orders first
+                transaction.set_rollback(True)
+                return None
 
-            order_exchange_transactions = [
-                OrderExchangeTransaction(order=order, exchange_transaction=exchange_transaction) for order in orders
-            ]
-            OrderExchangeTransaction.objects.bulk_create(order_exchange_transactions)
+            exchange_transaction.amount = amount
+            exchange_transaction.save(update_fields=['amount'])
 
+        metrics.BATCH_ORDERS.observe(order_count, exchanger=exchanger.id)
+        exchange_transaction.order_count = order_count
         return exchange_transaction
+
+    def create_multi_leg_transaction(self, rows, used_exchangers=()):
+        """
+        Claims the pending orders of every row into one batch for a multi-leg exchanger, netting them into one
+        leg per symbol. Rows are claimed in order until the exchanger's capacity or BATCH_MAX_ORDERS is used up.
+        """
+        with transaction.atomic():
+            exchanger = self.router.choose(exclude=used_exchangers, multi_leg=True)
+            remaining = capacity(exchanger)
+            exchange_transaction = ExchangeTransaction.objects.create(exchanger=exchanger, amount=0)
+
+            amount = Decimal(0)
+            order_count = 0
+            legs = []
+            for row in rows:
+                leg_amount, leg_order_count, full = self.claim_orders(
+                    exchange_transaction, row['crypto_currency_id'], row['max_order_id'], remaining, amount,
+                    self.max_orders - order_count
+                )
+                if leg_amount:
+                    legs.append({'currency': row['crypto_currency__symbol'], 'amount': str(leg_amount)})
+                    amount += leg_amount
+                    remaining -= leg_amount
+                    order_count += leg_order_count
+                if full:
+                    break
+
+            if not amount:
+                transaction.set_rollback(True)
+                return None
+
+            exchange_transaction.amount = amount
+            exchange_transaction.legs = legs
+            exchange_transaction.save(update_fields=['amount', 'legs'])
+
+        metrics.BATCH_ORDERS.observe(order_count, exchanger=exchanger.id)
+        exchange_transaction.order_count = order_count
+        return exchange_transaction
+
+    def claim_orders(self, exchange_transaction, crypto_currency_id, max_order_id, remaining, batch_amount=0,
+                     max_orders=None):
+        """
+        Claims the pending orders of a symbol up to max_order_id in keyset-paginated chunks, so memory and
+        statement size stay bounded however large the backlog is, until `remaining` capacity or `max_orders`
+        orders are used up. The claimed rows stay locked until the surrounding transaction commits, which is why
+        a batch holds at most `max_orders` of them. `batch_amount` is what the batch already holds. The cached
+        orders of each chunk's users are invalidated on that commit. Returns (amount, order count, whether full).
+        """
+        if max_orders is None:
+            max_orders = self.max_orders
+        amount = Decimal(0)
+        order_count = 0
+        last_order_id = 0
+        full = False
+        while not full:
+            if order_count >= max_orders:
+                full = True
+                break
+            chunk = list(
+                Order.objects.select_for_update()
+                .filter(status=Order.PENDING, crypto_currency_id=crypto_currency_id,
+                        id__gt=last_order_id, id__lte=max_order_id)
+                .order_by('id')
+                .values_list('id', 'user_id', 'amount', 'count')[:min(self.chunk_size, max_orders - order_count)]
+            )
+            if not chunk:
+                break
+
+            claimed = []
+            for order in chunk:
+                order_total = order[2] * order[3]
+                # An order is never split; one larger than the capacity still goes out alone
+                if order_total > remaining and (claimed or amount or batch_amount):
+                    full = True
+                    break
+                remaining -= order_total
+                claimed.append(order)
+            if not claimed:
+                break
+
+            order_ids = [order_id for order_id, _, _, _ in claimed]
+            Order.objects.filter(id__in=order_ids).update(status="processing", exchange_transaction=exchange_transaction)
+            OrderExchangeTransaction.objects.bulk_create([
+                OrderExchangeTransaction(order_id=order_id, exchange_transaction=exchange_transaction)
+                for order_id in order_ids
+            ])
+
+            amount += sum(order_amount * count for _, _, order_amount, count in claimed)
+            order_count += len(claimed)
+            invalidate_orders_on_commit({user_id for _, user_id, _, _ in claimed})
+            last_order_id = order_ids[-1]
+
+        return amount, order_count, full
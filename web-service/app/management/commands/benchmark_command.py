@@ -0,0 +1,62 @@
+import json
+from django.core.management.base import BaseCommand
+from app.benchmarks import run_asgi_benchmark, run_pipeline_benchmark, run_purchase_benchmark, run_settle_benchmark
+from app.benchmarks.utils import benchmark_database, benchmark_metadata
+
+
+class Command(BaseCommand):
+    help = "This command will benchmark the hot paths against a throwaway database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=['purchase', 'settle', 'pipeline', 'asgi'])
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--reservation', action='store_true', help="Use the Redis reservation mode.")
+        parser.add_argument('--items', type=int, default=1, help="Orders per purchase request, through /purchase/batch/.")
+        parser.add_argument('--batches', type=int, default=200)
+        parser.add_argument('--orders-per-batch', type=int, default=10)
+        parser.add_argument('--exchanger-latency', type=float, default=0.05)
+        parser.add_argument('--sync', action='store_true', help="Settle with the RQ task instead of the async worker.")
+        parser.add_argument('--users', type=int, default=100, help="Users the pipeline purchases are spread over.")
+        parser.add_argument('--count', type=int, default=1, help="Count of every pipeline purchase.")
+        parser.add_argument('--output', help="Also write the JSON result to this file.")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            if options['scenario'] == 'purchase':
+                result = run_purchase_benchmark(
+                    concurrency=options['concurrency'],
+                    requests=options['requests'],
+                    reservation=options['reservation'],
+                    items=options['items'],
+                )
+            elif options['scenario'] == 'pipeline':
+                result = run_pipeline_benchmark(
+                    users=options['users'],
+                    requests=options['requests'],
+                    count=options['count'],
+                    concurrency=options['concurrency'],
+                    exchanger_latency=options['exchanger_latency'],
+                    reservation=options['reservation'],
+                )
+            elif options['scenario'] == 'asgi':
+                result = run_asgi_benchmark(
+                    concurrency=options['concurrency'],
+                    requests=options['requests'],
+                    reservation=options['reservation'],
+                )
+            else:
+                result = run_settle_benchmark(
+                    batches=options['batches'],
+                    orders_per_batch=options['orders_per_batch'],
+                    exchanger_latency=options['exchanger_latency'],
+                    concurrency=options['concurrency'],
+                    asynchronous=not options['sync'],
+                )
+            result['meta'] = benchmark_metadata()
+
+        output = json.dumps(result, indent=4)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from app import request_log
+
+
+class Command(BaseCommand):
+    help = "This command will write the buffered exchanger request logs to the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true',
+                            help="Delete logs older than EXCHANGER_LOG_RETENTION_DAYS and exit.")
+        parser.add_argument('--days', type=int, help="Retention in days, overriding the setting.")
+        parser.add_argument('--recover', action='store_true',
+                            help="First put back the batches a crashed flusher left in processing.")
+
+    def handle(self, *args, **options):
+        if options['prune']:
+            self.stdout.write(f"{request_log.prune(options['days'])} request logs pruned")
+            return
+
+        buffer = request_log.RequestLogBuffer()
+        if options['recover']:
+            buffer.recover()
+
+        flushed = 0
+        while True:
+            count = buffer.flush()
+            if not count:
+                break
+            flushed += count
+        self.stdout.write(f"{flushed} request logs flushed")
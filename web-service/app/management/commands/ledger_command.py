@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from app import ledger
+
+
+class Command(BaseCommand):
+    help = "This command will fold committed ledger entries into the balance checkpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--open', action='store_true',
+                            help="Write opening entries that bring the ledger to the wallets and exit.")
+        parser.add_argument('--reconcile', action='store_true',
+                            help="Report an unbalanced ledger and the accounts below zero and exit.")
+
+    def handle(self, *args, **options):
+        if options['open']:
+            if ledger.ledger_enabled():
+                raise CommandError("The wallets are no longer written once LEDGER_ENABLED is on; "
+                                   "open the ledger before enabling it.")
+            self.stdout.write(f"{ledger.open_wallets()} wallets opened")
+            return
+
+        if options['reconcile']:
+            self.stdout.write(f"Ledger imbalance: {ledger.imbalance()}")
+            mismatches = 0
+            for user_id, accounts in ledger.reconcile():
+                mismatches += 1
+                self.stdout.write(f"User {user_id}: {accounts}")
+            self.stdout.write(f"{mismatches} users have an account below zero")
+            return
+
+        self.stdout.write(f"{ledger.compact()} ledger accounts compacted")
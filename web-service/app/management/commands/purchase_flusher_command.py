@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from app.wallet_reservation import WalletReservation
+
+
+class Command(BaseCommand):
+    help = "This command will persist the purchases reserved in Redis."
+
+    def __init__(self):
+        super().__init__()
+        self.wallet_reservation = WalletReservation()
+        self.batch_size = getattr(settings, "PURCHASE_FLUSH_BATCH_SIZE", 500)
+        self.interval = getattr(settings, "PURCHASE_FLUSH_INTERVAL", 0.2)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Flush what is pending and exit.")
+        parser.add_argument('--rebuild', action='store_true', help="Rebuild the Redis wallets from MySQL and exit.")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.wallet_reservation.rebuild()
+            self.stdout.write("Redis wallets rebuilt from MySQL")
+            return
+
+        self.wallet_reservation.recover()
+
+        while True:
+            flushed = self.wallet_reservation.flush(self.batch_size)
+            if flushed < self.batch_size:
+                if options['once']:
+                    break
+                time.sleep(self.interval)
@@ -1,19 +1,131 @@
+import logging
+import multiprocessing
+import signal
+import time
+import zlib
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from app.models import CryptoCurrency
+from django.db import connections
+from app.currency_cache import currency_cache
 from rq import Worker, Queue
 from app.redis_client import RedisClient
+from app.request_log import RequestLogFlusher
+
+logger = logging.getLogger(__name__)
+
+
+def assign_queues(symbols, workers, affinity):
+    """Maps every symbol queue to one worker: pinned by `affinity`, otherwise by a stable hash"""
+    assignment = [['default'] for _ in range(workers)]
+    for symbol in sorted(symbols):
+        if symbol in affinity:
+            index = affinity[symbol] % workers
+        else:
+            index = zlib.crc32(symbol.encode()) % workers
+        assignment[index].append(symbol)
+    return assignment
+
+
+def parse_affinity(value):
+    """Parses "BTC:0,ETH:1" into {'BTC': 0, 'ETH': 1}"""
+    affinity = {}
+    for pair in filter(None, (value or '').split(',')):
+        symbol, _, index = pair.partition(':')
+        affinity[symbol.strip().upper()] = int(index)
+    return affinity
+
+
+def work(queue_names):
+    conn = RedisClient().client
+    queues = [Queue(name=q, connection=conn) for q in queue_names]
+    worker = Worker(queues, connection=conn)
+    # Settle jobs only buffer their exchanger request logs; this thread writes them to the database
+    flusher = RequestLogFlusher()
+    flusher.start()
+    try:
+        worker.work(with_scheduler=True)
+    finally:
+        flusher.stop()
+
+
+class Supervisor:
+    """
+    Keeps `workers` RQ worker processes alive, each listening on its share of the symbol queues.
+    Crashed children are restarted, and children whose share changes because a symbol was added
+    are warm-restarted, so no restart of the supervisor is needed.
+    """
+
+    def __init__(self, workers, affinity, poll_interval, stdout):
+        self.workers = workers
+        self.affinity = affinity
+        self.poll_interval = poll_interval
+        self.stdout = stdout
+        self.processes = {}
+        self.assignment = []
+        self.stopping = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        while not self.stopping:
+            try:
+                self.tick()
+            except Exception:
+                # Redis or the database being briefly away must not take the workers down; retry next tick
+                logger.exception("Queue supervisor tick failed")
+            time.sleep(self.poll_interval)
+
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            process.join()
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def tick(self):
+        assignment = assign_queues(currency_cache.symbols(), self.workers, self.affinity)
+
+        for index in range(self.workers):
+            process = self.processes.get(index)
+
+            if process is not None and process.is_alive() and assignment[index] != self.assignment[index]:
+                self.stdout.write(f"Worker {index} now listens on {assignment[index]}, restarting it")
+                process.terminate()
+                process.join()
+                process = None
+            elif process is not None and not process.is_alive():
+                self.stdout.write(f"Worker {index} exited with code {process.exitcode}, restarting it")
+
+            if process is None or not process.is_alive():
+                self.processes[index] = self.spawn(index, assignment[index])
+
+        self.assignment = assignment
+
+    def spawn(self, index, queue_names):
+        # Children must open their own database connections instead of sharing the parent's sockets
+        connections.close_all()
+        process = multiprocessing.Process(target=work, args=(queue_names,), name=f"rq-worker-{index}")
+        process.start()
+        return process
 
 
 class Command(BaseCommand):
     help = "This command will process the queues"
 
-    def handle(self, *args, **options):
-        listen = ['default']
-        listen += CryptoCurrency.objects.values_list('symbol', flat=True)
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, "QUEUE_WORKERS", 1),
+                            help="Number of supervised worker processes.")
+        parser.add_argument('--affinity', default=getattr(settings, "QUEUE_WORKER_AFFINITY", ""),
+                            help='Pins symbols to workers, e.g. "BTC:0,ETH:1".')
 
-        redis_client = RedisClient()
-        conn = redis_client.client
-
-        queues = [Queue(name=q, connection=conn) for q in listen]
-        worker = Worker(queues, connection=conn)
-        worker.work()
+    def handle(self, *args, **options):
+        # Even a single worker is supervised, so it picks up newly listed symbols
+        supervisor = Supervisor(
+            max(options['workers'], 1),
+            parse_affinity(options['affinity']),
+            getattr(settings, "QUEUE_SUPERVISOR_POLL_INTERVAL", 5),
+            self.stdout,
+        )
+        supervisor.run()
@@ -0,0 +1,18 @@
+import asyncio
+from django.core.management.base import BaseCommand
+from app.benchmarks.stub_exchanger import StubExchanger
+
+
+class Command(BaseCommand):
+    help = "This command will serve a local stub exchanger for offline settlement benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8080)
+        parser.add_argument('--latency', type=float, default=0.05, help="Seconds to wait before answering.")
+        parser.add_argument('--failure-rate', type=float, default=0.0, help="Share of requests answered with 500.")
+
+    def handle(self, *args, **options):
+        stub = StubExchanger(options['host'], options['port'], options['latency'], options['failure_rate'])
+        self.stdout.write(f"Stub exchanger listening on {stub.url}")
+        asyncio.run(stub.serve())
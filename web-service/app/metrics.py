@@ -0,0 +1,246 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from django.conf import settings
+from redis.exceptions import RedisError
+from app.redis_client import RedisClient
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = 'metrics'
+
+# Every thread records into its own shard, so the measured paths never share a lock or a cache line with each
+# other. A shard holds running totals that only its thread writes; a flush ships what changed since the last one
+# to Redis, where the deltas of every process add up, and `/metrics` renders the sums. A thread flushes its own
+# shard at most every METRICS_FLUSH_INTERVAL seconds while it records, and a background thread flushes every
+# shard at that interval, so the last samples of an idle or finished thread are not held back.
+_local = threading.local()
+_shards = set()
+_shards_lock = threading.Lock()
+_flusher = None
+
+
+class Shard:
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.values = {}
+        self.shipped = {}
+        self.flushed = time.monotonic()
+        # Taken by flushes only; recording never waits on it
+        self.lock = threading.Lock()
+
+
+def shard():
+    current = getattr(_local, 'shard', None)
+    if current is None:
+        current = _local.shard = Shard()
+        with _shards_lock:
+            _shards.add(current)
+        ensure_flusher()
+    return current
+
+
+def add(field, amount):
+    current = shard()
+    current.values[field] = current.values.get(field, 0) + amount
+    if time.monotonic() - current.flushed >= getattr(settings, "METRICS_FLUSH_INTERVAL", 5):
+        flush()
+
+
+def flush(current=None):
+    """Ships what the current thread's shard recorded since its last flush to Redis"""
+    current = current or shard()
+    with current.lock:
+        current.flushed = time.monotonic()
+        # Copying a dict is atomic under the GIL, so the owning thread can keep recording meanwhile
+        values = current.values.copy()
+        deltas = {field: value - current.shipped.get(field, 0) for field, value in values.items()
+                  if value != current.shipped.get(field, 0)}
+        if not deltas:
+            return
+
+        try:
+            with RedisClient().pipelined() as pipeline:
+                for field, amount in deltas.items():
+                    pipeline.hincrbyfloat(METRICS_KEY, field, amount)
+        except RedisError:
+            # Kept for the next flush
+            logger.warning("Could not flush %s metric samples", len(deltas))
+            return
+        current.shipped = values
+
+
+def flush_all():
+    """Flushes the shard of every thread; shards of threads that have ended are dropped once flushed"""
+    with _shards_lock:
+        shards = list(_shards)
+    for current in shards:
+        flush(current)
+        if not current.thread.is_alive():
+            with _shards_lock:
+                _shards.discard(current)
+
+
+class MetricsFlusher(threading.Thread):
+    """Flushes every shard of the process every METRICS_FLUSH_INTERVAL seconds"""
+
+    def __init__(self):
+        super().__init__(name="metrics-flusher", daemon=True)
+        self.pid = os.getpid()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(max(getattr(settings, "METRICS_FLUSH_INTERVAL", 5), 0.1)):
+            flush_all()
+
+
+def forget_parent_samples():
+    """
+    A forked child inherits its parent's shards, whose samples the parent ships itself. The child keeps only the
+    forking thread's shard, counted as shipped, and starts its own flusher when it records.
+    """
+    global _shards_lock
+    _shards_lock = threading.Lock()
+    current = getattr(_local, 'shard', None)
+    _shards.clear()
+    if current is not None:
+        current.lock = threading.Lock()
+        current.shipped = current.values.copy()
+        _shards.add(current)
+
+
+os.register_at_fork(after_in_child=forget_parent_samples)
+
+
+def ensure_flusher():
+    """Starts the process's flusher thread, again in a forked child, where the parent's thread does not run"""
+    global _flusher
+    if _flusher is not None and _flusher.pid == os.getpid():
+        return
+    with _shards_lock:
+        if _flusher is None or _flusher.pid != os.getpid():
+            _flusher = MetricsFlusher()
+            _flusher.start()
+
+
+def label_string(labels):
+    return ','.join(f'{name}="{value}"' for name, value in sorted(labels.items()))
+
+
+class Metric:
+    type = None
+    registry = {}
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.fields = {}
+        Metric.registry[name] = self
+
+    def field(self, labels, sample):
+        return f"{self.name} {label_string(labels)} {sample}"
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        field = self.fields.get(key)
+        if field is None:
+            field = self.fields[key] = self.field(labels, 'total')
+        add(field, amount)
+
+    def samples(self, labels, values):
+        yield f"{self.name}_total", labels, values.get('total', 0)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets):
+        super().__init__(name, documentation)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        fields = self.fields.get(key)
+        if fields is None:
+            fields = self.fields[key] = [self.field(labels, f'bucket:{bucket}') for bucket in self.buckets] + [
+                self.field(labels, 'bucket:+Inf'), self.field(labels, 'sum'), self.field(labels, 'count')]
+
+        current = shard()
+        values = current.values
+        # Buckets are stored cumulative, as they are exposed
+        for field in fields[bisect_left(self.buckets, value):-2]:
+            values[field] = values.get(field, 0) + 1
+        values[fields[-2]] = values.get(fields[-2], 0) + value
+        add(fields[-1], 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self, labels, values):
+        for bucket in self.buckets + ['+Inf']:
+            le = f'le="{bucket}"'
+            yield f"{self.name}_bucket", f"{labels},{le}" if labels else le, values.get(f'bucket:{bucket}', 0)
+        yield f"{self.name}_sum", labels, values.get('sum', 0)
+        yield f"{self.name}_count", labels, values.get('count', 0)
+
+
+def format_value(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def render(gauges=()):
+    """
+    Renders the Prometheus text exposition of everything flushed so far, followed by `gauges`, an iterable of
+    (name, documentation, [(labels, value)]) measured at scrape time
+    """
+    series = {}
+    for field, value in RedisClient().client.hgetall(METRICS_KEY).items():
+        name, rest = field.decode().split(' ', 1)
+        labels, sample = rest.rsplit(' ', 1)
+        series.setdefault(name, {}).setdefault(labels, {})[sample] = float(value)
+
+    lines = []
+    for name in sorted(series):
+        metric = Metric.registry.get(name)
+        if metric is None:
+            continue
+        lines += [f"# HELP {name} {metric.documentation}", f"# TYPE {name} {metric.type}"]
+        for labels in sorted(series[name]):
+            for sample, sample_labels, value in metric.samples(labels, series[name][labels]):
+                lines.append(f"{sample}{{{sample_labels}}} {format_value(value)}" if sample_labels
+                             else f"{sample} {format_value(value)}")
+
+    for name, documentation, values in gauges:
+        lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+        for labels, value in values:
+            lines.append(f"{name}{{{label_string(labels)}}} {format_value(value)}" if labels
+                         else f"{name} {format_value(value)}")
+
+    return '\n'.join(lines) + '\n'
+
+
+SECONDS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+PURCHASES = Counter('purchases', "Purchase orders by outcome.")
+PURCHASE_SECONDS = Histogram('purchase_seconds', "Time to place a purchase, by path.", SECONDS)
+WALLET_LOCK_SECONDS = Histogram('wallet_lock_seconds', "Time a purchase holds the user's wallet lock.", SECONDS)
+BATCH_SECONDS = Histogram('batch_seconds', "Time to cut and enqueue the batches of a symbol.", SECONDS)
+BATCH_ORDERS = Histogram('batch_orders', "Orders per batch, by exchanger.",
+                         [1, 5, 10, 50, 100, 500, 1000, 5000, 10000])
+EXCHANGER_REQUEST_SECONDS = Histogram('exchanger_request_seconds', "Time waiting on the exchanger, by outcome.",
+                                      SECONDS)
+SETTLEMENTS = Counter('settlements', "Settlement attempts by outcome.")
+DB_QUERIES = Histogram('db_queries', "SQL statements per profiled request or job.",
+                       [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000])
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='reference',
+            field=models.CharField(blank=True, max_length=36, null=True, unique=True),
+        ),
+    ]
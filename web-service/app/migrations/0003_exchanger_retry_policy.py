@@ -0,0 +1,28 @@
+# Generated by Django 3.2 on 2026-10-18 16:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_transaction_reference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exchanger',
+            name='max_retries',
+            field=models.PositiveSmallIntegerField(default=3),
+        ),
+        migrations.AddField(
+            model_name='exchanger',
+            name='retry_base_delay',
+            field=models.PositiveIntegerField(default=30),
+        ),
+        migrations.AddField(
+            model_name='exchanger',
+            name='retry_max_delay',
+            field=models.PositiveIntegerField(default=600),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_exchanger_retry_policy'),
+    ]
+
+    operations = [
+        # State-only: the through table is unchanged
+        migrations.RenameField(
+            model_name='order',
+            old_name='exchange_transaction',
+            new_name='exchange_transactions',
+        ),
+        # Without the constraint, MySQL adds the nullable column and its index in place instead of copying the
+        # table; 0011 adds the constraint once 0005 has backfilled the column
+        migrations.AddField(
+            model_name='order',
+            name='exchange_transaction',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='batch_orders', to='app.exchangetransaction'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'crypto_currency'], name='order_status_currency_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at'], name='order_user_created_at_idx'),
+        ),
+    ]
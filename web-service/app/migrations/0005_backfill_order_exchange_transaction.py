@@ -0,0 +1,44 @@
+from django.db import migrations, transaction
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def backfill_order_exchange_transaction(apps, schema_editor):
+    """Copies each order's batch from the through table in short, keyset-paginated transactions"""
+    OrderExchangeTransaction = apps.get_model('app', 'OrderExchangeTransaction')
+    Order = apps.get_model('app', 'Order')
+
+    last_id = 0
+    while True:
+        links = list(
+            OrderExchangeTransaction.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', 'order_id', 'exchange_transaction_id')[:BACKFILL_CHUNK_SIZE]
+        )
+        if not links:
+            break
+
+        order_ids_of_batches = {}
+        for _, order_id, exchange_transaction_id in links:
+            order_ids_of_batches.setdefault(exchange_transaction_id, []).append(order_id)
+
+        with transaction.atomic():
+            for exchange_transaction_id, order_ids in order_ids_of_batches.items():
+                Order.objects.filter(id__in=order_ids, exchange_transaction__isnull=True).update(
+                    exchange_transaction_id=exchange_transaction_id
+                )
+
+        last_id = links[-1][0]
+
+
+class Migration(migrations.Migration):
+    # Each chunk commits on its own so the backfill never holds locks on the whole table
+    atomic = False
+
+    dependencies = [
+        ('app', '0004_order_exchange_transaction_fk'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_exchange_transaction, migrations.RunPython.noop),
+    ]
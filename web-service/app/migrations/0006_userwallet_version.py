@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 16:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_backfill_order_exchange_transaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userwallet',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2 on 2026-10-18 16:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('app', '0006_userwallet_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('account', models.CharField(choices=[('available', 'Available'), ('locked', 'Locked'), ('exchange', 'Exchange'), ('external', 'External')], max_length=10)),
+                ('kind', models.CharField(choices=[('opening', 'Opening'), ('lock', 'Lock'), ('settle', 'Settle'), ('release', 'Release')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=8, max_digits=18)),
+                ('reference', models.CharField(blank=True, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'app.ledger_entry',
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account', models.CharField(max_length=10)),
+                ('balance', models.DecimalField(decimal_places=8, default=0, max_digits=18)),
+                ('last_entry_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'app.ledger_checkpoint',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['user', 'account', 'id'], name='ledger_user_account_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ledgercheckpoint',
+            unique_together={('user', 'account')},
+        ),
+    ]
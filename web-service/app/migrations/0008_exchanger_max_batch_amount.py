@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 16:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exchanger',
+            name='max_batch_amount',
+            field=models.DecimalField(blank=True, decimal_places=8, max_digits=18, null=True),
+        ),
+    ]
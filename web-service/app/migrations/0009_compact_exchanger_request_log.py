@@ -0,0 +1,59 @@
+# Generated by Django 3.2 on 2026-10-18 17:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_exchanger_max_batch_amount'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='exchangerrequestlog',
+            name='updated_at',
+        ),
+        migrations.AddField(
+            model_name='exchangerrequestlog',
+            name='attempt',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='exchangerrequestlog',
+            name='error',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='exchangerrequestlog',
+            name='exchanger',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, to='app.exchanger'),
+        ),
+        migrations.AddField(
+            model_name='exchangerrequestlog',
+            name='latency_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exchangerrequestlog',
+            name='response_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='exchangerrequestlog',
+            name='response_size',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='exchangerrequestlog',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='exchangerrequestlog',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_compact_exchanger_request_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exchanger',
+            name='supports_multi_leg',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='exchangetransaction',
+            name='legs',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    # Adding a foreign key makes MySQL copy the order table while it checks the existing rows, so on a large
+    # table apply this ALTER with an online schema change tool (gh-ost, pt-online-schema-change) and then
+    # `migrate --fake` it; `sqlmigrate app 0011` prints the statement
+
+    dependencies = [
+        ('app', '0010_multi_leg_batches'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='exchange_transaction',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='batch_orders', to='app.exchangetransaction'),
+        ),
+    ]
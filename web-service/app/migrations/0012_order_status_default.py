@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The default was the 'Pending' label, which only matched the batch maker's 'pending' filter under MySQL's
+    # case-insensitive collation; state-only on MySQL, which does not store the default
+
+    dependencies = [
+        ('app', '0011_order_exchange_transaction_constraint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('canceled', 'Canceled')], default='pending', max_length=10),
+        ),
+    ]
@@ -8,3 +8,5 @@ from .exchanger_model import *
 from .transaction_model import *
 from .order_exchange_transaction_model import *
 from .exchanger_request_logs_model import *
+from .ledger_entry_model import *
+from .ledger_checkpoint_model import *
@@ -14,6 +14,8 @@ class ExchangeTransaction(models.Model):
     amount = models.DecimalField(max_digits=18, decimal_places=8)
     order = models.ManyToManyField('Order', through='OrderExchangeTransaction', related_name='orders')
     try_count = models.IntegerField(default=0)
+    # Netted amount per currency of a multi-leg batch, as sent upstream; None for a single-currency batch
+    legs = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now_add=True)
 
@@ -6,6 +6,13 @@ class Exchanger(models.Model):
     api_url = models.URLField()
     fee_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     is_active = models.BooleanField(default=True)
+    max_retries = models.PositiveSmallIntegerField(default=3)
+    retry_base_delay = models.PositiveIntegerField(default=30)
+    retry_max_delay = models.PositiveIntegerField(default=600)
+    # Largest amount sent in one request; bigger batches are split, None means unlimited
+    max_batch_amount = models.DecimalField(max_digits=18, decimal_places=8, null=True, blank=True)
+    # Accepts batches carrying several currencies as legs of one request
+    supports_multi_leg = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now_add=True)
 
@@ -1,15 +1,25 @@
 from django.db import models
+from django.utils import timezone
 
 
 class ExchangerRequestLog(models.Model):
+    """One exchanger call; written in bulk from the Redis buffer, so created_at is when the call was made"""
+
     request = models.TextField()
+    # First EXCHANGER_LOG_BODY_LIMIT characters of the response body
     response = models.TextField(null=True)
     exchange_transaction = models.ForeignKey('ExchangeTransaction', on_delete=models.RESTRICT)
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now_add=True)
+    exchanger = models.ForeignKey('Exchanger', on_delete=models.RESTRICT, null=True, blank=True)
+    attempt = models.PositiveSmallIntegerField(default=0)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    error = models.CharField(max_length=100, blank=True)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+    response_size = models.PositiveIntegerField(default=0)
+    response_hash = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
 
     class Meta:
         db_table = 'app.exchanger_request_log'
 
     def __str__(self):
-        return self.response
+        return f"{self.exchange_transaction_id} #{self.attempt}: {self.status_code or self.error}"
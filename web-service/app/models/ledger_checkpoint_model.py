@@ -0,0 +1,19 @@
+from django.db import models
+from django.contrib.auth.models import User
+
+
+class LedgerCheckpoint(models.Model):
+    """Balance of a user's ledger account summed up to and including entry `last_entry_id`"""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    account = models.CharField(max_length=10)
+    balance = models.DecimalField(max_digits=18, decimal_places=8, default=0)
+    last_entry_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'app.ledger_checkpoint'
+        unique_together = [('user', 'account')]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.account}: {self.balance} @ {self.last_entry_id}"
@@ -0,0 +1,40 @@
+from django.db import models
+from django.contrib.auth.models import User
+
+
+class LedgerEntry(models.Model):
+    """
+    One leg of a wallet movement. Every movement is written as legs summing to zero and entries are never
+    updated; legs of the exchange and external accounts belong to no user.
+    """
+
+    ACCOUNTS = [
+        ('available', 'Available'),
+        ('locked', 'Locked'),
+        ('exchange', 'Exchange'),
+        ('external', 'External'),
+    ]
+
+    KINDS = [
+        ('opening', 'Opening'),
+        ('lock', 'Lock'),
+        ('settle', 'Settle'),
+        ('release', 'Release'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    account = models.CharField(max_length=10, choices=ACCOUNTS)
+    kind = models.CharField(max_length=10, choices=KINDS)
+    amount = models.DecimalField(max_digits=18, decimal_places=8)
+    reference = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'app.ledger_entry'
+        indexes = [
+            models.Index(fields=['user', 'account', 'id'], name='ledger_user_account_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.account} - {self.kind} - {self.amount}"
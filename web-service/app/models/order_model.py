@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 
 
 class Order(models.Model):
+    PENDING = 'pending'
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('processing', 'Processing'),
@@ -13,15 +14,20 @@ class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     crypto_currency = models.ForeignKey('CryptoCurrency', on_delete=models.RESTRICT)
     transaction = models.ForeignKey('Transaction', on_delete=models.RESTRICT)
-    exchange_transaction = models.ManyToManyField('ExchangeTransaction', through='OrderExchangeTransaction', related_name='exchange_transactions')
+    exchange_transactions = models.ManyToManyField('ExchangeTransaction', through='OrderExchangeTransaction', related_name='exchange_transactions')
+    exchange_transaction = models.ForeignKey('ExchangeTransaction', on_delete=models.RESTRICT, null=True, blank=True, related_name='batch_orders')
     amount = models.DecimalField(max_digits=18, decimal_places=8)
     count = models.PositiveSmallIntegerField()
-    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'app.order'
+        indexes = [
+            models.Index(fields=['status', 'crypto_currency'], name='order_status_currency_idx'),
+            models.Index(fields=['user', 'created_at'], name='order_user_created_at_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.crypto_currency.symbol} - {self.amount} - {self.status}"
@@ -11,6 +11,7 @@ class Transaction(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=18, decimal_places=8)
     type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
+    reference = models.CharField(max_length=36, unique=True, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
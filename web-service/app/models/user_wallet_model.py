@@ -6,6 +6,8 @@ class UserWallet(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     balance = models.DecimalField(max_digits=18, decimal_places=8, default=0)
     locked_balance = models.DecimalField(max_digits=18, decimal_places=8, default=0)
+    # Bumped by every balance write so cached snapshots can be ordered
+    version = models.PositiveBigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now_add=True)
 
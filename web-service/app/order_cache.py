@@ -0,0 +1,74 @@
+import json
+from django.conf import settings
+from django.db import transaction
+from redis.exceptions import RedisError
+from app.redis_client import RedisClient, AsyncRedisClient
+
+VERSION_KEY = 'orders:version:{user_id}'
+PAGE_KEY = 'orders:{user_id}:{version}:{page}'
+
+
+class OrderCache:
+    """
+    Per-user cache of order read responses. Every write that changes a user's orders bumps the user's
+    version, which orphans all cached pages at once; orphans expire after ORDERS_CACHE_TTL seconds.
+    """
+
+    def __init__(self):
+        self.client = RedisClient().client
+
+    @property
+    def ttl(self):
+        return getattr(settings, "ORDERS_CACHE_TTL", 60)
+
+    def get(self, user_id, page):
+        """Returns (version, cached data or None); the version is passed back to set()"""
+        try:
+            version = int(self.client.get(VERSION_KEY.format(user_id=user_id)) or 0)
+            cached = self.client.get(PAGE_KEY.format(user_id=user_id, version=version, page=page))
+        except RedisError:
+            return None, None
+        return version, json.loads(cached) if cached is not None else None
+
+    async def aget(self, user_id, page):
+        client = AsyncRedisClient().client
+        try:
+            version = int(await client.get(VERSION_KEY.format(user_id=user_id)) or 0)
+            cached = await client.get(PAGE_KEY.format(user_id=user_id, version=version, page=page))
+        except RedisError:
+            return None, None
+        return version, json.loads(cached) if cached is not None else None
+
+    async def aset(self, user_id, version, page, data):
+        if version is None:
+            return
+        try:
+            await AsyncRedisClient().client.set(PAGE_KEY.format(user_id=user_id, version=version, page=page),
+                                                json.dumps(data), ex=self.ttl)
+        except RedisError:
+            pass
+
+    def set(self, user_id, version, page, data):
+        # Data read after a concurrent bump is stored under the old version and never served
+        if version is None:
+            return
+        try:
+            self.client.set(PAGE_KEY.format(user_id=user_id, version=version, page=page), json.dumps(data), ex=self.ttl)
+        except RedisError:
+            pass
+
+    def invalidate(self, user_ids):
+        try:
+            with RedisClient().pipelined() as pipeline:
+                for user_id in set(user_ids):
+                    pipeline.incr(VERSION_KEY.format(user_id=user_id))
+        except RedisError:
+            # Cached pages of these users stay stale until they expire
+            pass
+
+
+def invalidate_orders_on_commit(user_ids):
+    """Invalidates the users' cached orders once the surrounding transaction commits"""
+    user_ids = list(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: OrderCache().invalidate(user_ids))
@@ -0,0 +1,57 @@
+import json
+import logging
+from django.conf import settings
+from redis.exceptions import RedisError
+from app.redis_client import RedisClient
+
+logger = logging.getLogger(__name__)
+
+NEW_ORDER_CHANNEL = 'orders:new'
+ORDER_UPDATES_CHANNEL = 'orders:updates'
+ORDER_STREAM_KEY = 'orders:stream:{user_id}'
+
+# Appends the update to the user's capped stream, so reconnecting clients can catch up, and publishes it
+# with the stream id as its event id
+PUBLISH_UPDATE_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', 'data', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('PUBLISH', ARGV[4], '{"user_id":' .. ARGV[5] .. ',"id":"' .. id .. '","data":' .. ARGV[3] .. '}')
+return id
+"""
+
+
+def publish_new_order(crypto_currency_id, symbol, amount):
+    """
+    Tells the batch maker daemon that `amount` more is pending for a symbol. The order is already committed, so
+    this is best effort: a lost signal is caught up by the daemon's periodic scan of the pending orders.
+    """
+    try:
+        RedisClient().client.publish(NEW_ORDER_CHANNEL, json.dumps({
+            'crypto_currency_id': crypto_currency_id,
+            'symbol': symbol,
+            'amount': str(amount),
+        }))
+    except RedisError:
+        logger.exception("Could not signal %s pending for %s", amount, symbol)
+
+
+def publish_order_updates(updates):
+    """
+    Pushes order status changes to the users' streams; `updates` maps a user id to its event data.
+    Notifications are best effort: clients that miss one still see the change in /orders/.
+    """
+    client = RedisClient().client
+    publish_update = client.register_script(PUBLISH_UPDATE_SCRIPT)
+    maxlen = getattr(settings, "ORDER_EVENTS_MAXLEN", 100)
+    retention = getattr(settings, "ORDER_EVENTS_RETENTION", 3600)
+
+    try:
+        with RedisClient().pipelined() as pipeline:
+            for user_id, data in updates.items():
+                publish_update(
+                    keys=[ORDER_STREAM_KEY.format(user_id=user_id)],
+                    args=[maxlen, retention, json.dumps(data), ORDER_UPDATES_CHANNEL, int(user_id)],
+                    client=pipeline,
+                )
+    except RedisError:
+        logger.exception("Could not publish order updates for %d users", len(updates))
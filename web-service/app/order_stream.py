@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import weakref
+from urllib.parse import parse_qs
+from django.conf import settings
+from redis.exceptions import RedisError
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
+from app.authentication import authenticate_token_async
+from app.order_events import ORDER_UPDATES_CHANNEL, ORDER_STREAM_KEY
+from app.redis_client import AsyncRedisClient
+
+logger = logging.getLogger(__name__)
+
+ORDER_STREAM_PATH = '/api/orders/stream/'
+
+
+def stream_id_key(stream_id):
+    milliseconds, _, sequence = stream_id.partition('-')
+    return int(milliseconds), int(sequence or 0)
+
+
+def valid_stream_id(stream_id):
+    try:
+        stream_id_key(stream_id or '')
+    except ValueError:
+        return None
+    return stream_id
+
+
+class OrderEventHub:
+    """
+    Fans order updates out to the streams connected to this process. One Redis subscription per event
+    loop serves every client, so an idle client costs a queue and no Redis or database work.
+    """
+
+    _hubs = weakref.WeakKeyDictionary()
+
+    def __init__(self):
+        self.listeners = {}
+        self.reader = None
+
+    @classmethod
+    def for_loop(cls):
+        loop = asyncio.get_running_loop()
+        hub = cls._hubs.get(loop)
+        if hub is None:
+            hub = cls._hubs[loop] = cls()
+        return hub
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(maxsize=getattr(settings, "ORDER_STREAM_QUEUE_SIZE", 100))
+        self.listeners.setdefault(user_id, set()).add(queue)
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.ensure_future(self.read())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.listeners.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.listeners[user_id]
+
+    def dispatch(self, event):
+        for queue in self.listeners.get(event['user_id'], ()):
+            if queue.full():
+                # A stalled client loses its oldest update; it catches up from the stream when it reconnects
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def read(self):
+        while True:
+            pubsub = AsyncRedisClient().client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(ORDER_UPDATES_CHANNEL)
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self.dispatch(json.loads(message['data']))
+            except RedisError:
+                logger.exception("Order update subscription lost, resubscribing")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+
+def format_event(event_id, data):
+    return f"id: {event_id}\nevent: order_update\ndata: {json.dumps(data)}\n\n".encode()
+
+
+async def send_response(send, status, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(body).encode()})
+
+
+async def order_stream(scope, receive, send):
+    """
+    Raw ASGI app streaming the user's order updates as server-sent events. Browsers cannot set headers on
+    an EventSource, so the access token is also accepted as the `token` query parameter. A reconnecting
+    client sends Last-Event-ID and first gets the updates it missed from the user's capped stream.
+    """
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    query = parse_qs(scope.get('query_string', b'').decode())
+    authorization = headers.get('authorization') or (f"Bearer {query['token'][0]}" if 'token' in query else None)
+
+    try:
+        user = await authenticate_token_async(authorization)
+    except (NotAuthenticated, AuthenticationFailed) as e:
+        return await send_response(send, 401, {"detail": str(e.detail)})
+
+    hub = OrderEventHub.for_loop()
+    queue = hub.subscribe(user.id)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+
+        last_id = valid_stream_id(headers.get('last-event-id'))
+        if last_id:
+            last_id = await send_missed(send, user.id, last_id)
+
+        heartbeat = getattr(settings, "ORDER_STREAM_HEARTBEAT", 15)
+        while not disconnected.done():
+            next_event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait([next_event, disconnected], timeout=heartbeat,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if next_event not in done:
+                next_event.cancel()
+                if not disconnected.done():
+                    await send({'type': 'http.response.body', 'body': b': keep-alive\n\n', 'more_body': True})
+                continue
+
+            event = next_event.result()
+            # Skips live updates that were already sent while catching up
+            if last_id and stream_id_key(event['id']) <= stream_id_key(last_id):
+                continue
+            last_id = event['id']
+            await send({'type': 'http.response.body', 'body': format_event(event['id'], event['data']),
+                        'more_body': True})
+    finally:
+        hub.unsubscribe(user.id, queue)
+        disconnected.cancel()
+
+
+async def send_missed(send, user_id, last_id):
+    try:
+        entries = await AsyncRedisClient().client.xrange(ORDER_STREAM_KEY.format(user_id=user_id), min=last_id)
+    except RedisError:
+        return last_id
+
+    for entry_id, fields in entries:
+        if entry_id.decode() == last_id:
+            continue
+        last_id = entry_id.decode()
+        await send({'type': 'http.response.body', 'body': format_event(last_id, json.loads(fields[b'data'])),
+                    'more_body': True})
+    return last_id
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
@@ -0,0 +1,35 @@
+from decimal import Decimal
+from app.models import Transaction, Order
+
+
+def create_orders(orders):
+    """
+    Inserts a debit Transaction and an Order per item with two bulk inserts; must run inside an atomic block.
+    Items are dicts with reference, user_id, crypto_currency_id, count, price and amount.
+    """
+    Transaction.objects.bulk_create([
+        Transaction(
+            user_id=order['user_id'],
+            type=dict(Transaction.TRANSACTION_TYPES).get("debit"),
+            amount=Decimal(order['amount']),
+            reference=order['reference'],
+        )
+        for order in orders
+    ])
+    # bulk_create does not return primary keys on MySQL, so the transactions are found again by reference
+    transaction_ids = dict(
+        Transaction.objects.filter(reference__in=[order['reference'] for order in orders])
+        .values_list('reference', 'id')
+    )
+
+    Order.objects.bulk_create([
+        Order(
+            user_id=order['user_id'],
+            crypto_currency_id=order['crypto_currency_id'],
+            transaction_id=transaction_ids[order['reference']],
+            count=order['count'],
+            amount=Decimal(order['price']),
+            status=Order.PENDING,
+        )
+        for order in orders
+    ])
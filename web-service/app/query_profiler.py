@@ -0,0 +1,106 @@
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryProfile:
+    """Records the SQL statements of the current thread's connection while installed as an execute wrapper"""
+
+    def __init__(self, label=None):
+        self.label = label
+        self.queries = []
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def query_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def slowest(self, limit=None):
+        limit = limit or getattr(settings, "QUERY_PROFILING_SLOWEST", 5)
+        return sorted(self.queries, key=lambda query: query[1], reverse=True)[:limit]
+
+    def duplicates(self):
+        """Statements run more than once with only their parameters changing, the mark of an N+1"""
+        return [(sql, count) for sql, count in Counter(sql for sql, _ in self.queries).most_common() if count > 1]
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        metrics.DB_QUERIES.observe(self.count, target=self.label)
+
+        log = logger.warning if self.count > getattr(settings, "QUERY_PROFILING_MAX_QUERIES", 50) \
+            or self.duplicates() else logger.info
+        log("%s", self.report())
+
+    def report(self):
+        lines = [f"{self.label}: {self.count} queries in {self.query_time * 1000:.1f} ms"
+                 + (f" of {self.elapsed * 1000:.1f} ms" if self.elapsed is not None else "")]
+        lines += [f"  {count}x {sql}" for sql, count in self.duplicates()]
+        lines += [f"  {duration * 1000:.1f} ms {sql}" for sql, duration in self.slowest()]
+        return '\n'.join(lines)
+
+
+@contextmanager
+def profile(label):
+    """Profiles the queries of a job when QUERY_PROFILING is on; yields the profile, or None when it is off"""
+    if not getattr(settings, "QUERY_PROFILING", False):
+        yield None
+        return
+
+    query_profile = QueryProfile(label)
+    try:
+        with connection.execute_wrapper(query_profile):
+            yield query_profile
+    finally:
+        query_profile.finish()
+
+
+class QueryProfilingMiddleware:
+    """Profiles the queries of every request when QUERY_PROFILING is on, and reports them in response headers"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, "QUERY_PROFILING", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_profile = QueryProfile()
+        with connection.execute_wrapper(query_profile):
+            response = self.get_response(request)
+
+        resolver_match = request.resolver_match
+        query_profile.label = resolver_match.view_name if resolver_match else "unresolved"
+        query_profile.finish()
+
+        response['X-Query-Count'] = str(query_profile.count)
+        response['X-Query-Time'] = f"{query_profile.query_time * 1000:.1f}"
+        return response
+
+
+@contextmanager
+def query_budget(budget, label="block"):
+    """Test helper failing when the block runs more than `budget` queries; the failure lists repeated statements"""
+    query_profile = QueryProfile(label)
+    with connection.execute_wrapper(query_profile):
+        yield query_profile
+
+    if query_profile.count > budget:
+        raise AssertionError(f"{label} is over its budget of {budget} queries\n{query_profile.report()}")
@@ -1,8 +1,227 @@
+import asyncio
 import os
+import queue
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 import redis
+import redis.asyncio
+import redis.asyncio.connection
+import redis.connection
+from django.conf import settings
+from redis.exceptions import ConnectionError
+
+# Seconds between two looks at the budget while a pool waits for another one to give a connection up
+BUDGET_POLL_INTERVAL = 0.01
+
+
+def connection_kwargs(python_parser):
+    kwargs = {
+        'host': os.getenv('REDIS_HOST', 'redis'),
+        'port': os.getenv('REDIS_PORT', 6379),
+        'db': 0,
+        'max_connections': getattr(settings, "REDIS_MAX_CONNECTIONS", 50),
+        'timeout': getattr(settings, "REDIS_POOL_TIMEOUT", 20),
+        'health_check_interval': getattr(settings, "REDIS_HEALTH_CHECK_INTERVAL", 30),
+        'socket_keepalive': True,
+    }
+    # hiredis parses replies when it is installed, unless REDIS_HIREDIS turns it off
+    if not getattr(settings, "REDIS_HIREDIS", True):
+        kwargs['parser_class'] = python_parser
+    return kwargs
+
+
+class BudgetExhausted(Exception):
+    """Raised by make_connection when the process already has its REDIS_MAX_CONNECTIONS connections open"""
+
+
+class ConnectionBudget:
+    """
+    The REDIS_MAX_CONNECTIONS connections a process may have open, shared by the sync pool and the pool of every
+    event loop. A pool that needs a new connection once the budget is spent asks the other pools to close their
+    idle connections and waits for one to go.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.pools = weakref.WeakSet()
+
+    def open_connections(self):
+        return sum(pool.open_connections() for pool in list(self.pools))
+
+    def reclaim(self, requester):
+        for pool in list(self.pools):
+            if pool is not requester:
+                pool.close_idle_soon()
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def connection_budget():
+    global _budget
+    if _budget is None:
+        with _budget_lock:
+            if _budget is None:
+                _budget = ConnectionBudget(getattr(settings, "REDIS_MAX_CONNECTIONS", 50))
+    return _budget
+
+
+class BudgetedPool:
+    """Opens connections only while the process's ConnectionBudget has room; mixed into the blocking pools"""
+
+    def __init__(self, budget, **kwargs):
+        self.budget = budget
+        super().__init__(**kwargs)
+        budget.pools.add(self)
+
+    def open_connections(self):
+        # A pool inherited from the parent process is reset before it is used again
+        return len(self._connections) if self.pid == os.getpid() else 0
+
+    def make_connection(self):
+        with self.budget.lock:
+            if self.budget.open_connections() >= self.budget.limit:
+                raise BudgetExhausted()
+            return super().make_connection()
+
+    def deadline(self):
+        return None if self.timeout is None else time.monotonic() + self.timeout
+
+    def budget_wait_over(self, deadline):
+        """Puts back the placeholder make_connection could not fill; raises once the pool timeout has passed"""
+        self.pool.put_nowait(None)
+        if deadline is not None and time.monotonic() >= deadline:
+            raise ConnectionError("No connection available.")
+        self.budget.reclaim(self)
+
+
+class BlockingConnectionPool(BudgetedPool, redis.BlockingConnectionPool):
+    def get_connection(self, command_name, *keys, **options):
+        deadline = self.deadline()
+        while True:
+            try:
+                return super().get_connection(command_name, *keys, **options)
+            except BudgetExhausted:
+                self.budget_wait_over(deadline)
+                time.sleep(BUDGET_POLL_INTERVAL)
+
+    def close_idle_soon(self):
+        self.close_idle()
+
+    def close_idle(self):
+        """Closes the connections waiting in the pool, which gives their share of the budget back"""
+        self._checkpid()
+        taken = []
+        while True:
+            try:
+                taken.append(self.pool.get_nowait())
+            except queue.Empty:
+                break
+        for connection in taken:
+            if connection is not None:
+                self._connections.remove(connection)
+                connection.disconnect()
+            self.pool.put_nowait(None)
+
+
+class AsyncBlockingConnectionPool(BudgetedPool, redis.asyncio.BlockingConnectionPool):
+    def __init__(self, budget, loop, **kwargs):
+        self.loop = loop
+        self.closing = False
+        super().__init__(budget, **kwargs)
+
+    def open_connections(self):
+        # The connections of a closed loop can never be used again
+        return 0 if self.loop.is_closed() else super().open_connections()
+
+    async def get_connection(self, command_name, *keys, **options):
+        deadline = self.deadline()
+        while True:
+            try:
+                return await super().get_connection(command_name, *keys, **options)
+            except BudgetExhausted:
+                self.budget_wait_over(deadline)
+                await asyncio.sleep(BUDGET_POLL_INTERVAL)
+
+    def close_idle_soon(self):
+        """Connections belong to the pool's loop, so they are closed there; may be called from any thread"""
+        if self.closing or self.loop.is_closed():
+            return
+        self.closing = True
+        try:
+            asyncio.run_coroutine_threadsafe(self.close_idle(), self.loop)
+        except RuntimeError:
+            self.closing = False
+
+    async def close_idle(self):
+        try:
+            self._checkpid()
+            taken = []
+            while True:
+                try:
+                    taken.append(self.pool.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            for connection in taken:
+                if connection is not None:
+                    self._connections.remove(connection)
+                    await connection.disconnect()
+                self.pool.put_nowait(None)
+        finally:
+            self.closing = False
+
 
 class RedisClient:
+    """
+    Process-wide Redis client. Every instance shares one BlockingConnectionPool, whose connections and those of
+    every AsyncRedisClient loop come out of one ConnectionBudget: a process never has more than
+    REDIS_MAX_CONNECTIONS connections open, and callers wait for a free one instead of opening another.
+    redis-py resets the pool in a forked child, so RQ work horses get their own connections.
+    """
+
+    _client = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        cls = type(self)
+        if cls._client is None:
+            with cls._lock:
+                if cls._client is None:
+                    pool = BlockingConnectionPool(connection_budget(),
+                                                  **connection_kwargs(redis.connection.PythonParser))
+                    cls._client = redis.StrictRedis(connection_pool=pool)
+        self.client = cls._client
+
+    def pipeline(self, transaction=False):
+        """A pipeline whose commands go out in one round trip on execute(); MULTI/EXEC only when asked for"""
+        return self.client.pipeline(transaction=transaction)
+
+    @contextmanager
+    def pipelined(self, transaction=False):
+        """Yields a pipeline that is executed when the block exits without an error, for writes in bulk"""
+        with self.pipeline(transaction) as pipeline:
+            yield pipeline
+            pipeline.execute()
+
+
+class AsyncRedisClient:
+    """
+    Asyncio counterpart of RedisClient. Connections belong to an event loop, so every loop gets its own pool,
+    but the pools of every loop and the sync pool share the process's REDIS_MAX_CONNECTIONS budget.
+    """
+
+    _clients = weakref.WeakKeyDictionary()
+
     def __init__(self):
-        redis_host = os.getenv('REDIS_HOST', 'redis')
-        redis_port = os.getenv('REDIS_PORT', 6379)
-        self.client = redis.StrictRedis(host=redis_host, port=redis_port, db=0)
\ No newline at end of file
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            pool = AsyncBlockingConnectionPool(
+                connection_budget(), loop, **connection_kwargs(redis.asyncio.connection.PythonParser)
+            )
+            client = self._clients[loop] = redis.asyncio.StrictRedis(connection_pool=pool)
+        self.client = client
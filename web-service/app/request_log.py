@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from redis.exceptions import RedisError
+from app.models import ExchangerRequestLog
+from app.redis_client import RedisClient, AsyncRedisClient
+from app.wallet_reservation import CLAIM_SCRIPT
+
+logger = logging.getLogger(__name__)
+
+LOG_BUFFER_KEY = 'exchanger:request_logs'
+LOG_PROCESSING_KEY = 'exchanger:request_logs:processing'
+
+
+def request_log_record(exchange_transaction, request_data, latency, response=None, error=None):
+    """Summarizes one exchanger call: status, latency, and the size, hash and head of the response body"""
+    body = getattr(response, 'content', b'')
+    if not isinstance(body, bytes):
+        body = b''
+    return {
+        'exchange_transaction_id': exchange_transaction.id,
+        'exchanger_id': exchange_transaction.exchanger_id,
+        'attempt': exchange_transaction.try_count,
+        'request': json.dumps(request_data, separators=(',', ':')),
+        'status_code': response.status_code if response is not None else None,
+        'error': type(error).__name__ if error is not None else '',
+        'latency_ms': int(latency * 1000),
+        'response_size': len(body),
+        'response_hash': hashlib.sha256(body).hexdigest() if body else '',
+        'response': body[:getattr(settings, "EXCHANGER_LOG_BODY_LIMIT", 512)].decode('utf-8', 'replace'),
+        'created_at': timezone.now().isoformat(),
+    }
+
+
+class RequestLogBuffer:
+    """
+    Buffers exchanger request logs in a Redis list, so a settlement pays one RPUSH instead of two
+    writes to the database. `flush` moves them to the table with one bulk insert per batch; a batch stays
+    in a processing list until its insert is committed, so a failed insert or a crash never loses it.
+    """
+
+    def __init__(self):
+        self.redis_client = RedisClient()
+        self.client = self.redis_client.client
+        self.claim_script = self.client.register_script(CLAIM_SCRIPT)
+
+    def push(self, record):
+        try:
+            self.client.rpush(LOG_BUFFER_KEY, json.dumps(record))
+        except RedisError:
+            # A lost log line must never fail a settlement
+            logger.warning("Dropped the request log of exchange transaction %s", record['exchange_transaction_id'])
+
+    async def apush(self, record):
+        try:
+            await AsyncRedisClient().client.rpush(LOG_BUFFER_KEY, json.dumps(record))
+        except RedisError:
+            logger.warning("Dropped the request log of exchange transaction %s", record['exchange_transaction_id'])
+
+    def flush(self, batch_size=None):
+        """Writes up to batch_size buffered logs and returns how many were taken from the buffer"""
+        batch_size = batch_size or getattr(settings, "EXCHANGER_LOG_FLUSH_BATCH_SIZE", 1000)
+        items = self.claim_script(keys=[LOG_BUFFER_KEY, LOG_PROCESSING_KEY], args=[batch_size])
+        if not items:
+            return 0
+
+        logs = []
+        for item in items:
+            record = json.loads(item)
+            record['created_at'] = parse_datetime(record['created_at'])
+            logs.append(ExchangerRequestLog(**record))
+        try:
+            ExchangerRequestLog.objects.bulk_create(logs)
+        except DatabaseError:
+            self.release(items)
+            raise
+
+        with self.redis_client.pipelined(transaction=True) as pipeline:
+            for item in items:
+                pipeline.lrem(LOG_PROCESSING_KEY, 1, item)
+        return len(items)
+
+    def release(self, items):
+        """Puts a batch whose insert failed back in front of the buffer, in its order"""
+        with self.redis_client.pipelined(transaction=True) as pipeline:
+            for item in items:
+                pipeline.lrem(LOG_PROCESSING_KEY, 1, item)
+            pipeline.lpush(LOG_BUFFER_KEY, *reversed(items))
+
+    def recover(self):
+        """Puts the batches a crashed flusher left in processing back in front of the buffer"""
+        while self.client.rpoplpush(LOG_PROCESSING_KEY, LOG_BUFFER_KEY) is not None:
+            pass
+
+
+class RequestLogFlusher(threading.Thread):
+    """Background thread that drains the buffer every EXCHANGER_LOG_FLUSH_INTERVAL seconds until stopped"""
+
+    def __init__(self, buffer=None):
+        super().__init__(name="request-log-flusher", daemon=True)
+        self.buffer = buffer or RequestLogBuffer()
+        self.interval = getattr(settings, "EXCHANGER_LOG_FLUSH_INTERVAL", 1.0)
+        self.batch_size = getattr(settings, "EXCHANGER_LOG_FLUSH_BATCH_SIZE", 1000)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while True:
+            stopping = self.stopped.wait(self.interval)
+            self.drain()
+            if stopping:
+                break
+        connections.close_all()
+
+    def drain(self):
+        try:
+            while self.buffer.flush(self.batch_size) == self.batch_size:
+                pass
+        except (RedisError, DatabaseError):
+            logger.exception("Flushing exchanger request logs failed")
+
+    def stop(self):
+        """Flushes what is buffered and waits for the thread to finish"""
+        self.stopped.set()
+        self.join()
+
+
+def prune(days=None, chunk_size=1000):
+    """Deletes logs older than EXCHANGER_LOG_RETENTION_DAYS in short chunks; returns the number deleted"""
+    days = getattr(settings, "EXCHANGER_LOG_RETENTION_DAYS", 30) if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+
+    deleted = 0
+    while True:
+        ids = list(ExchangerRequestLog.objects.filter(created_at__lt=cutoff).order_by('id')
+                   .values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += ExchangerRequestLog.objects.filter(id__in=ids).delete()[0]
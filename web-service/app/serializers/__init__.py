@@ -2,3 +2,5 @@
 
 from .purchase_serializer import *
 from .signup_serializer import *
+from .order_serializer import *
+from .wallet_serializer import *
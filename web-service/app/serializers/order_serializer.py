@@ -0,0 +1,26 @@
+from rest_framework import serializers
+
+
+class OrderSerializer(serializers.Serializer):
+    """Serializes Order rows read with OrderSerializer.FIELDS through values()"""
+
+    FIELDS = ['id', 'crypto_currency__symbol', 'count', 'amount', 'status', 'exchange_transaction_id',
+              'exchange_transaction__status', 'created_at', 'updated_at']
+
+    id = serializers.IntegerField()
+    symbol = serializers.CharField(source='crypto_currency__symbol')
+    count = serializers.IntegerField()
+    price = serializers.DecimalField(source='amount', max_digits=18, decimal_places=8)
+    status = serializers.SerializerMethodField()
+    batch_id = serializers.IntegerField(source='exchange_transaction_id', allow_null=True)
+    batch_status = serializers.SerializerMethodField()
+    created_at = serializers.DateTimeField()
+    updated_at = serializers.DateTimeField()
+
+    # Statuses are stored both as choice keys and as labels; clients always get the key
+    def get_status(self, order):
+        return order['status'].lower()
+
+    def get_batch_status(self, order):
+        status = order['exchange_transaction__status']
+        return status.lower() if status else None
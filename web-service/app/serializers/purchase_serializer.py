@@ -1,5 +1,6 @@
+from django.conf import settings
 from rest_framework import serializers
-from app.models import CryptoCurrency
+from app.currency_cache import currency_cache
 
 
 class PurchaseSerializer(serializers.Serializer):
@@ -7,6 +8,19 @@ class PurchaseSerializer(serializers.Serializer):
     count = serializers.IntegerField(min_value=1, required=True)
 
     def validate_name(self, value):
-        if not CryptoCurrency.objects.filter(symbol=value.upper()).exists():
+        # Async views pass the symbols in, as reading the cache may need the database
+        symbols = self.context.get('symbols')
+        exists = value.upper() in symbols if symbols is not None else currency_cache.exists(value.upper())
+        if not exists:
             raise serializers.ValidationError("This symbol name does not exist")
         return value
+
+
+class BatchPurchaseSerializer(serializers.Serializer):
+    items = PurchaseSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, value):
+        max_items = getattr(settings, "PURCHASE_BATCH_MAX_ITEMS", 100)
+        if len(value) > max_items:
+            raise serializers.ValidationError(f"A batch can have at most {max_items} items")
+        return value
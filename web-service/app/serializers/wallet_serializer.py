@@ -0,0 +1,15 @@
+from rest_framework import serializers
+
+
+class WalletSerializer(serializers.Serializer):
+    """Serializes a wallet snapshot; the available balance is what the next purchase may spend"""
+
+    balance = serializers.DecimalField(max_digits=18, decimal_places=8)
+    locked_balance = serializers.DecimalField(max_digits=18, decimal_places=8)
+    available_balance = serializers.SerializerMethodField()
+    version = serializers.IntegerField()
+
+    def get_available_balance(self, wallet):
+        return serializers.DecimalField(max_digits=18, decimal_places=8).to_representation(
+            wallet['balance'] - wallet['locked_balance']
+        )
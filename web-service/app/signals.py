@@ -0,0 +1,26 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from app.models import CryptoCurrency
+from app.currency_cache import currency_cache
+from app.authentication import user_state, ACTIVE, INACTIVE
+
+
+@receiver([post_save, post_delete], sender=CryptoCurrency)
+def crypto_currency_changed(sender, **kwargs):
+    """Invalidates cached currencies; `QuerySet.update()` bypasses this, so price feeds must save() or publish"""
+    currency_cache.invalidate()
+    transaction.on_commit(currency_cache.publish_change)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    state = ACTIVE if instance.is_active else INACTIVE
+    transaction.on_commit(lambda: user_state.store(instance.id, state))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    user_id = instance.id
+    transaction.on_commit(lambda: user_state.store(user_id, INACTIVE))
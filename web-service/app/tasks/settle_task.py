@@ -1,90 +1,252 @@
 from rq import Queue
-from app.models import ExchangeTransaction, ExchangerRequestLog, Order, Transaction, UserWallet
+from app.models import ExchangeTransaction, Order, Transaction, UserWallet
 from app.redis_client import RedisClient
+from app.wallet_reservation import WalletReservation
+from app.order_cache import invalidate_orders_on_commit
+from app.wallet_cache import refresh_wallets_on_commit
+from app import ledger, metrics, query_profiler
+from app.order_events import publish_order_updates
+from app.exchanger_router import ExchangerRouter
+from app.circuit_breaker import CircuitBreaker
+from app.request_log import RequestLogBuffer, request_log_record
+from collections import defaultdict
+from django.conf import settings
+import logging
 import requests
+import random
 import time
-from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
 from django.db import transaction as db_transaction
+from django.db.models import Case, DecimalField, F, Value, When
 from decimal import Decimal
 
+logger = logging.getLogger(__name__)
+
 
 def update_user_wallets_and_orders(orders, status):
-    """Updates user wallets and order statuses"""
-    user_ids = orders.values_list('user_id', flat=True).distinct()
+    """
+    Moves the settled amounts out of the users' balances and updates order statuses. With the ledger on that is
+    one INSERT of ledger entries, otherwise one set-based UPDATE per chunk of wallets.
+    """
+    # The batch's orders are read once: the totals of the wallet update and the payload of the order events
+    total_sum_of_users = defaultdict(Decimal)
+    updates = defaultdict(lambda: {'status': status.lower(), 'order_ids': []})
+    for user_id, order_id, exchange_transaction_id, amount, count in orders.order_by('id').values_list(
+            'user_id', 'id', 'exchange_transaction_id', 'amount', 'count'):
+        total_sum_of_users[user_id] += amount * count
+        updates[user_id]['order_ids'].append(order_id)
+        updates[user_id]['batch_id'] = exchange_transaction_id
 
-    user_wallets = UserWallet.objects.select_for_update().filter(user_id__in=user_ids)
+    if not ledger.ledger_enabled():
+        update_user_wallets(total_sum_of_users, status)
 
-    total_sum_of_users = defaultdict(Decimal)
-    for order in orders:
-        total_sum_of_users[order.user_id] += order.amount * order.count
+    ledger.record([
+        ledger_entry for user_id, total_sum in total_sum_of_users.items()
+        for ledger_entry in ledger.settle_entries(user_id, total_sum, status, f"batch:{updates[user_id]['batch_id']}")
+    ])
 
-    for user_wallet in user_wallets:
-        user_wallet.locked_balance -= total_sum_of_users[user_wallet.user_id]
+    orders.update(status=status)
+    invalidate_orders_on_commit(total_sum_of_users)
+    db_transaction.on_commit(lambda: publish_order_updates(dict(updates)))
+
+
+def update_user_wallets(total_sum_of_users, status):
+    """Moves the settled amounts out of the wallet rows, when the ledger is not the balance"""
+    user_ids = sorted(total_sum_of_users)
+    chunk_size = getattr(settings, "WALLET_UPDATE_CHUNK_SIZE", 500)
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        total_sum = Case(
+            *[When(user_id=user_id, then=Value(total_sum_of_users[user_id])) for user_id in chunk],
+            output_field=DecimalField(max_digits=18, decimal_places=8),
+        )
+        wallet_updates = {'locked_balance': F('locked_balance') - total_sum, 'version': F('version') + 1}
         if status == 'Completed':
-            user_wallet.balance -= total_sum_of_users[user_wallet.user_id]
-        user_wallet.save()
+            wallet_updates['balance'] = F('balance') - total_sum
+        UserWallet.objects.filter(user_id__in=chunk).update(**wallet_updates)
 
-    orders.update(status=status)
+    if getattr(settings, "PURCHASE_RESERVATION_MODE", False):
+        wallet_reservation = WalletReservation()
+        for user_id, total_sum in total_sum_of_users.items():
+            balance_delta = -total_sum if status == 'Completed' else Decimal(0)
+            wallet_reservation.adjust(user_id, balance_delta, -total_sum)
+
+    refresh_wallets_on_commit(user_ids)
 
 
 def create_reverse_transactions(orders):
-    """Creates reverse transactions in case of failure"""
+    """
+    Reverses the debit transactions of failed orders with a credit of the same amount, so a user's
+    credits and debits net to zero for every order that failed
+    """
     transactions = Transaction.objects.filter(id__in=orders.values_list('transaction_id', flat=True))
     reverse_transactions_data = [
         Transaction(
-            user=transaction.user,
+            user_id=user_id,
             type="Credit",
-            amount=transaction.amount
+            amount=amount
         )
-        for transaction in transactions
+        for user_id, amount in transactions.values_list('user_id', 'amount')
     ]
     Transaction.objects.bulk_create(reverse_transactions_data)
 
 
-def settle(exchange_transaction_id: int, currency: str):
-    exchange_transaction = ExchangeTransaction.objects.get(id=exchange_transaction_id)
+def retry_delay(exchanger, try_count):
+    """Exponential backoff capped by the exchanger's policy, with equal jitter to spread retry storms"""
+    backoff = min(exchanger.retry_max_delay, exchanger.retry_base_delay * 2 ** (try_count - 1))
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+def admit_settlement(exchange_transaction, currency, schedule_retry):
+    """
+    Lets the attempt through when the exchanger's circuit is closed or can be probed, or else reroutes the batch
+    to an exchanger whose circuit is. With every circuit open the batch is scheduled for when its circuit allows
+    a probe, without spending an attempt.
+    """
+    breaker = CircuitBreaker()
+    if breaker.allow(exchange_transaction.exchanger_id):
+        return True
+
+    exchanger_id = exchange_transaction.exchanger_id
+    if ExchangerRouter().failover(exchange_transaction).id != exchanger_id \
+            and breaker.allow(exchange_transaction.exchanger_id):
+        return True
+
+    delay = max(breaker.retry_after(exchange_transaction.exchanger_id), 1)
+    logger.info("Circuit of exchanger %s is open, exchange transaction %s waits %.0f s",
+                exchange_transaction.exchanger_id, exchange_transaction.id, delay)
+    schedule_retry(exchange_transaction.id, currency, delay)
+    metrics.SETTLEMENTS.inc(status="deferred")
+    return False
+
+
+def start_settlement(exchange_transaction_id, currency, schedule_retry):
+    """
+    Counts the attempt and builds the request that is about to be sent to the exchanger. Returns None when
+    the exchanger's circuit is open and the batch was rescheduled instead.
+    """
+    exchange_transaction = ExchangeTransaction.objects.select_related('exchanger').get(id=exchange_transaction_id)
+    if not admit_settlement(exchange_transaction, currency, schedule_retry):
+        return None
+
     exchange_transaction.try_count += 1
     exchange_transaction.save()
 
-    request_data = {
-        'amount': exchange_transaction.amount,
+    return exchange_transaction, settlement_request(exchange_transaction, currency)
+
+
+def settlement_request(exchange_transaction, currency):
+    """A multi-leg batch lists the netted amount of every currency in place of a single currency"""
+    if exchange_transaction.legs:
+        return {
+            'amount': str(exchange_transaction.amount),
+            'legs': exchange_transaction.legs,
+        }
+
+    return {
+        'amount': str(exchange_transaction.amount),
         'currency': currency,
     }
 
-    exchanger_request_log = ExchangerRequestLog.objects.create(
-        request=str(request_data),
-        exchange_transaction=exchange_transaction
+
+@contextmanager
+def wallet_lock_timer(exchange_transaction, status):
+    """Reports how long a settlement transaction holds its wallet and order row locks"""
+    started = time.perf_counter()
+    yield
+    logger.info(
+        "Settlement of exchange transaction %s (%s) held wallet locks for %.1f ms",
+        exchange_transaction.id, status, (time.perf_counter() - started) * 1000,
     )
 
+
+def complete_settlement(exchange_transaction):
+    with wallet_lock_timer(exchange_transaction, "Completed"), ledger.atomic():
+        orders = Order.objects.filter(exchange_transaction=exchange_transaction)
+        update_user_wallets_and_orders(orders, status="Completed")
+
+        exchange_transaction.status = "Completed"
+        exchange_transaction.save()
+    metrics.SETTLEMENTS.inc(status="completed")
+
+
+def fail_settlement(exchange_transaction, currency, schedule_retry):
+    """Schedules a retry through `schedule_retry(id, currency, delay)` or fails the batch for good"""
+    exchanger = exchange_transaction.exchanger
+    if exchange_transaction.try_count < exchanger.max_retries:
+        ExchangerRouter().failover(exchange_transaction)
+        schedule_retry(exchange_transaction.id, currency, retry_delay(exchanger, exchange_transaction.try_count))
+        metrics.SETTLEMENTS.inc(status="retried")
+    else:
+        with wallet_lock_timer(exchange_transaction, "Failed"), ledger.atomic():
+            orders = Order.objects.filter(exchange_transaction=exchange_transaction)
+            update_user_wallets_and_orders(orders, status="Failed")
+
+            create_reverse_transactions(orders)
+
+            exchange_transaction.status = "Failed"
+            exchange_transaction.save()
+        metrics.SETTLEMENTS.inc(status="failed")
+
+
+def enqueue_retry(exchange_transaction_id, currency, delay):
+    # Scheduled by the worker's scheduler, so no worker is held while waiting; multi-leg batches have no
+    # currency and are settled from the default queue
+    queue = Queue(connection=RedisClient().client, name=currency or 'default')
+    queue.enqueue_in(timedelta(seconds=delay), settle, exchange_transaction_id, currency)
+
+
+def post_to_exchanger(exchange_transaction, request_data):
+    """Sends a batch to its exchanger; the outcome feeds the routing stats and the buffered request log"""
+    exchanger = exchange_transaction.exchanger
+    started = time.perf_counter()
     try:
-        response = requests.post(exchange_transaction.exchanger.api_url, json=request_data, timeout=60)
+        response = requests.post(
+            exchanger.api_url,
+            json=request_data,
+            timeout=getattr(settings, "EXCHANGER_REQUEST_TIMEOUT", 60),
+        )
+    except requests.RequestException as e:
+        latency = time.perf_counter() - started
+        ExchangerRouter().record(exchanger.id, latency, ok=False)
+        metrics.EXCHANGER_REQUEST_SECONDS.observe(latency, exchanger=exchanger.id, outcome="error")
+        RequestLogBuffer().push(request_log_record(exchange_transaction, request_data, latency, error=e))
+        raise
 
-        exchanger_request_log.response = str(response)
-        exchanger_request_log.save()
+    latency = time.perf_counter() - started
+    ExchangerRouter().record(exchanger.id, latency, ok=response.status_code == 200)
+    metrics.EXCHANGER_REQUEST_SECONDS.observe(latency, exchanger=exchanger.id, outcome=response_outcome(response))
+    RequestLogBuffer().push(request_log_record(exchange_transaction, request_data, latency, response=response))
+    return response
 
-        if response.status_code == 200:
-            with db_transaction.atomic():
-                orders = Order.objects.filter(exchange_transaction=exchange_transaction)
-                update_user_wallets_and_orders(orders, status="Completed")
 
-                exchange_transaction.status = "Completed"
-                exchange_transaction.save()
+def response_outcome(response):
+    return "ok" if response.status_code == 200 else "failed"
+
 
+def settle(exchange_transaction_id: int, currency: str):
+    try:
+        with query_profiler.profile("settle"):
+            settle_batch(exchange_transaction_id, currency)
+    finally:
+        # RQ runs every job in a forked work horse that exits right after it
+        metrics.flush()
+
+
+def settle_batch(exchange_transaction_id, currency):
+    started = start_settlement(exchange_transaction_id, currency, enqueue_retry)
+    if started is None:
+        return
+    exchange_transaction, request_data = started
+
+    try:
+        response = post_to_exchanger(exchange_transaction, request_data)
+
+        if response.status_code == 200:
+            complete_settlement(exchange_transaction)
         else:
             raise Exception("Exchanger request failed")
 
     except Exception as e:
-        if exchange_transaction.try_count < 3:
-            time.sleep(60)
-            queue = Queue(connection=RedisClient().client)
-            queue.enqueue(settle, exchange_transaction, currency)
-        else:
-            with db_transaction.atomic():
-                orders = Order.objects.filter(exchange_transaction=exchange_transaction)
-                update_user_wallets_and_orders(orders, status="Failed")
-
-                create_reverse_transactions(orders)
-
-                exchange_transaction.status = "Failed"
-                exchange_transaction.save()
-                # OR we can change the exchanger and send transaction with them
+        fail_settlement(exchange_transaction, currency, enqueue_retry)
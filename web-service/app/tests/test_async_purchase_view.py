@@ -0,0 +1,129 @@
+import asyncio
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from app.models import CryptoCurrency, UserWallet, Transaction, Order
+from app.idempotency import IDEMPOTENCY_KEY, REPLAYED_HEADER
+from app.redis_client import RedisClient
+from app.wallet_reservation import WalletReservation, WALLET_KEY, PENDING_KEY, PROCESSING_KEY
+
+
+class AsyncPurchaseTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.crypto = CryptoCurrency.objects.create(symbol="BTC", price=100)
+        self.wallet = UserWallet.objects.create(user=self.user, balance=1000, locked_balance=0)
+        self.authorization = f"Bearer {AccessToken.for_user(self.user)}"
+
+    def purchase(self, data, authorization=None, **headers):
+        # The async test client turns extra keyword arguments into request headers
+        return asyncio.run(self.async_client.post(
+            "/api/async/purchase/", data, content_type="application/json",
+            authorization=authorization or self.authorization, **headers,
+        ))
+
+    def test_retry_with_an_idempotency_key_replays_the_purchase(self):
+        redis_key = IDEMPOTENCY_KEY.format(user_id=self.user.id, key="async-key")
+        RedisClient().client.delete(redis_key)
+        try:
+            first = self.purchase({"name": "BTC", "count": 5}, idempotency_key="async-key")
+            second = self.purchase({"name": "BTC", "count": 5}, idempotency_key="async-key")
+            reused = self.purchase({"name": "BTC", "count": 2}, idempotency_key="async-key")
+        finally:
+            RedisClient().client.delete(redis_key)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second[REPLAYED_HEADER], "true")
+        self.assertEqual(reused.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.locked_balance, 500)
+
+    def test_idempotency_key_is_shared_with_the_sync_endpoint(self):
+        redis_key = IDEMPOTENCY_KEY.format(user_id=self.user.id, key="shared-key")
+        RedisClient().client.delete(redis_key)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        try:
+            first = client.post("/api/purchase/", {"name": "BTC", "count": 5}, format="json",
+                                HTTP_IDEMPOTENCY_KEY="shared-key")
+            second = self.purchase({"name": "BTC", "count": 5}, idempotency_key="shared-key")
+        finally:
+            RedisClient().client.delete(redis_key)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second[REPLAYED_HEADER], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_successful_purchase(self):
+        response = self.purchase({"name": "btc", "count": 5})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["message"], "Your order has been registered")
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.locked_balance, 500)
+        self.assertEqual(Transaction.objects.get().user_id, self.user.id)
+        self.assertEqual(Order.objects.get().count, 5)
+
+    def test_form_encoded_purchase(self):
+        response = asyncio.run(self.async_client.post(
+            "/api/async/purchase/", "name=BTC&count=2", content_type="application/x-www-form-urlencoded",
+            authorization=self.authorization
+        ))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_insufficient_balance(self):
+        response = self.purchase({"name": "BTC", "count": 20})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "Insufficient balance")
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_wallet_not_found(self):
+        self.wallet.delete()
+        response = self.purchase({"name": "BTC", "count": 5})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["error"], "User wallet not found")
+
+    def test_validation_errors(self):
+        response = self.purchase({"name": "ETH", "count": 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["name"][0], "This symbol name does not exist")
+        self.assertIn("count", response.json())
+
+    def test_unauthenticated_user(self):
+        response = asyncio.run(self.async_client.post(
+            "/api/async/purchase/", {"name": "BTC", "count": 5}, content_type="application/json"
+        ))
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_token_is_not_accepted(self):
+        refresh_token = RefreshToken.for_user(self.user)
+        response = self.purchase({"name": "BTC", "count": 5}, authorization=f"Bearer {refresh_token}")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_only_post_is_allowed(self):
+        response = asyncio.run(self.async_client.get("/api/async/purchase/", authorization=self.authorization))
+        self.assertEqual(response.status_code, 405)
+
+    @override_settings(PURCHASE_RESERVATION_MODE=True)
+    def test_reservation_mode(self):
+        redis = RedisClient().client
+        redis.delete(PENDING_KEY, PROCESSING_KEY, WALLET_KEY.format(user_id=self.user.id))
+        try:
+            self.assertEqual(self.purchase({"name": "BTC", "count": 6}).status_code, 201)
+            response = self.purchase({"name": "BTC", "count": 5})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()["error"], "Insufficient balance")
+
+            wallet_reservation = WalletReservation()
+            self.assertEqual(wallet_reservation.get_wallet(self.user.id)["locked_balance"], 600)
+            self.assertEqual(wallet_reservation.pending_count(), 1)
+            self.assertEqual(Order.objects.count(), 0)
+        finally:
+            redis.delete(PENDING_KEY, PROCESSING_KEY, WALLET_KEY.format(user_id=self.user.id))
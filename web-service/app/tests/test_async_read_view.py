@@ -0,0 +1,74 @@
+import asyncio
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from app.models import CryptoCurrency, Order, Transaction, UserWallet
+from app.order_cache import VERSION_KEY
+from app.redis_client import RedisClient
+from app.wallet_cache import SNAPSHOT_KEY
+
+
+class AsyncReadTestCase(TransactionTestCase):
+    def setUp(self):
+        self.redis = RedisClient().client
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.authorization = f"Bearer {AccessToken.for_user(self.user)}"
+        self.clear_cache()
+
+        self.crypto = CryptoCurrency.objects.create(symbol="BTC", price=100)
+        self.wallet = UserWallet.objects.create(user=self.user, balance=1000, locked_balance=300)
+        transaction = Transaction.objects.create(user=self.user, amount=300, type="Debit")
+        self.orders = [
+            Order.objects.create(transaction=transaction, user=self.user, crypto_currency=self.crypto, amount=100,
+                                 count=count)
+            for count in [1, 2]
+        ]
+
+    def tearDown(self):
+        self.clear_cache()
+
+    def clear_cache(self):
+        for key in self.redis.scan_iter(match=f"orders:{self.user.id}:*"):
+            self.redis.delete(key)
+        self.redis.delete(VERSION_KEY.format(user_id=self.user.id), SNAPSHOT_KEY.format(user_id=self.user.id))
+
+    def get(self, path, authorization=None):
+        return asyncio.run(self.async_client.get(path, authorization=authorization or self.authorization))
+
+    def test_orders_match_the_sync_endpoint(self):
+        response = self.get("/api/async/orders/?page_size=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order["id"] for order in response.json()["results"]], [self.orders[1].id])
+
+        cursor = response.json()["next_cursor"]
+        response = self.get(f"/api/async/orders/?page_size=1&cursor={cursor}")
+        self.assertEqual([order["id"] for order in response.json()["results"]], [self.orders[0].id])
+        self.assertIsNone(response.json()["next_cursor"])
+
+    def test_cached_page_is_served_without_the_database(self):
+        first = self.get("/api/async/orders/").json()
+        Order.objects.all().delete()
+        self.assertEqual(self.get("/api/async/orders/").json(), first)
+
+    def test_order_detail(self):
+        response = self.get(f"/api/async/orders/{self.orders[0].id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 1)
+        self.assertEqual(self.get("/api/async/orders/999999/").status_code, 404)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.get("/api/async/orders/?cursor=bogus").status_code, 400)
+
+    def test_wallet(self):
+        response = self.get("/api/async/wallet/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["available_balance"], "700.00000000")
+        self.assertTrue(self.redis.exists(SNAPSHOT_KEY.format(user_id=self.user.id)))
+
+        UserWallet.objects.all().delete()
+        self.assertEqual(self.get("/api/async/wallet/").json(), response.json())
+
+    def test_unauthenticated_and_wrong_method(self):
+        self.assertEqual(asyncio.run(self.async_client.get("/api/async/wallet/")).status_code, 401)
+        response = asyncio.run(self.async_client.post("/api/async/orders/", authorization=self.authorization))
+        self.assertEqual(response.status_code, 405)
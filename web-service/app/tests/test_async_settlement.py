@@ -0,0 +1,69 @@
+import asyncio
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase
+from app.async_settlement import AsyncSettlementWorker, enqueue_async_settle, QUEUE_KEY, DELAYED_KEY
+from app.benchmarks.stub_exchanger import StubExchanger
+from app.circuit_breaker import BREAKER_KEY
+from app.exchanger_router import STATS_KEY
+from app.models import (
+    Order, OrderExchangeTransaction, ExchangeTransaction, Exchanger, ExchangerRequestLog, UserWallet,
+    Transaction, CryptoCurrency
+)
+from app.redis_client import RedisClient
+from app.request_log import LOG_BUFFER_KEY
+
+
+class AsyncSettlementTestCase(TransactionTestCase):
+    def setUp(self):
+        self.redis = RedisClient().client
+        self.redis.delete(QUEUE_KEY, DELAYED_KEY, LOG_BUFFER_KEY)
+
+        self.stub = StubExchanger()
+        self.exchanger = Exchanger.objects.create(name="Stub Exchanger", api_url=self.stub.start_in_thread())
+        self.redis.delete(STATS_KEY.format(exchanger_id=self.exchanger.id),
+                          BREAKER_KEY.format(exchanger_id=self.exchanger.id))
+        self.user = User.objects.create(username="testuser")
+        self.crypto_currency = CryptoCurrency.objects.create(symbol="BTC", name="Bitcoin", price=50000)
+        self.wallet = UserWallet.objects.create(user=self.user, balance=1000, locked_balance=500)
+        self.transaction = Transaction.objects.create(user=self.user, amount=200, type="Debit")
+
+        self.exchange_transactions = []
+        for _ in range(3):
+            exchange_transaction = ExchangeTransaction.objects.create(exchanger=self.exchanger, amount=100)
+            order = Order.objects.create(transaction=self.transaction, user=self.user,
+                                         crypto_currency=self.crypto_currency, amount=50, count=2,
+                                         status="processing", exchange_transaction=exchange_transaction)
+            OrderExchangeTransaction.objects.create(exchange_transaction=exchange_transaction, order=order)
+            self.exchange_transactions.append(exchange_transaction)
+
+    def tearDown(self):
+        self.redis.delete(QUEUE_KEY, DELAYED_KEY, LOG_BUFFER_KEY)
+
+    def run_worker(self):
+        asyncio.run(AsyncSettlementWorker(concurrency=1).run(stop_when_idle=True))
+
+    def test_worker_settles_every_queued_batch_over_one_connection(self):
+        for exchange_transaction in self.exchange_transactions:
+            enqueue_async_settle(exchange_transaction.id, "BTC")
+
+        self.run_worker()
+
+        self.assertEqual(ExchangeTransaction.objects.filter(status="Completed").count(), 3)
+        self.assertEqual(Order.objects.filter(status="Completed").count(), 3)
+        self.assertEqual(ExchangerRequestLog.objects.count(), 3)
+        self.assertEqual(self.stub.requests, 3)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, 700)
+        self.assertEqual(self.wallet.locked_balance, 200)
+
+    def test_failed_batch_is_delayed_instead_of_blocking_the_worker(self):
+        self.stub.failure_rate = 1.0
+        enqueue_async_settle(self.exchange_transactions[0].id, "BTC")
+
+        self.run_worker()
+
+        exchange_transaction = ExchangeTransaction.objects.get(id=self.exchange_transactions[0].id)
+        self.assertEqual(exchange_transaction.try_count, 1)
+        self.assertEqual(exchange_transaction.status, "Pending")
+        self.assertEqual(self.redis.zcard(DELAYED_KEY), 1)
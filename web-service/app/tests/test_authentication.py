@@ -0,0 +1,172 @@
+import asyncio
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase
+from unittest.mock import patch
+from redis.exceptions import ConnectionError
+from rest_framework.test import APIClient
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from app.authentication import user_state, revoke_token, USER_STATE_KEY, REVOKED_TOKEN_KEY
+from app.currency_cache import currency_cache
+from app.models import CryptoCurrency, UserWallet, Order
+from app.redis_client import RedisClient
+
+
+class StatelessJWTAuthenticationTestCase(TestCase):
+    def setUp(self):
+        self.redis = RedisClient().client
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.redis_key = USER_STATE_KEY.format(user_id=self.user.id)
+        self.redis.delete(self.redis_key)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+        self.crypto = CryptoCurrency.objects.create(symbol="BTC", price=100)
+        self.wallet = UserWallet.objects.create(user=self.user, balance=1000, locked_balance=0)
+
+    def tearDown(self):
+        self.redis.delete(self.redis_key)
+
+    def purchase(self):
+        return self.client.post("/api/purchase/", {"name": "BTC", "count": 1})
+
+    def test_purchase_with_token(self):
+        response = self.purchase()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.get().user_id, self.user.id)
+
+    def test_user_row_is_not_loaded_once_the_state_is_cached(self):
+        self.purchase()
+        currency_cache.symbols()
+        # Savepoint, wallet lock and update, transaction and order inserts, release
+        with self.assertNumQueries(6):
+            response = self.purchase()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_state_miss_is_loaded_from_the_database_and_cached(self):
+        self.assertTrue(user_state.is_active(self.user.id))
+        self.assertEqual(self.redis.get(self.redis_key), b'1')
+        self.assertGreater(self.redis.ttl(self.redis_key), 0)
+
+    def test_deactivated_user_is_rejected(self):
+        self.purchase()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        response = self.purchase()
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_deleted_user_is_rejected(self):
+        self.purchase()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(id=self.user.id).delete()
+
+        self.assertEqual(self.purchase().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalid_token_is_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(self.purchase().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_database_is_used_when_redis_is_down(self):
+        with patch('app.authentication.RedisClient') as redis_client_mock:
+            redis_client_mock.return_value.client.mget.side_effect = ConnectionError
+            self.assertEqual(self.purchase().status_code, status.HTTP_201_CREATED)
+
+            User.objects.filter(id=self.user.id).update(is_active=False)
+            self.assertEqual(self.purchase().status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TokenRevocationTestCase(TestCase):
+    def setUp(self):
+        self.redis = RedisClient().client
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.refresh = RefreshToken.for_user(self.user)
+        self.access = self.refresh.access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        CryptoCurrency.objects.create(symbol="BTC", price=100)
+        UserWallet.objects.create(user=self.user, balance=1000, locked_balance=0)
+
+    def tearDown(self):
+        self.redis.delete(USER_STATE_KEY.format(user_id=self.user.id),
+                          REVOKED_TOKEN_KEY.format(jti=self.access['jti']),
+                          REVOKED_TOKEN_KEY.format(jti=self.refresh['jti']))
+
+    def purchase(self):
+        return self.client.post("/api/purchase/", {"name": "BTC", "count": 1})
+
+    def test_revoked_access_token_is_rejected(self):
+        response = self.client.post("/api/token/revoke/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.purchase()
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data["detail"].code, "token_revoked")
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.assertEqual(self.purchase().status_code, status.HTTP_201_CREATED)
+
+    def test_revocation_expires_with_the_token(self):
+        self.client.post("/api/token/revoke/", {"refresh": str(self.refresh)})
+
+        access_ttl = self.redis.ttl(REVOKED_TOKEN_KEY.format(jti=self.access['jti']))
+        refresh_ttl = self.redis.ttl(REVOKED_TOKEN_KEY.format(jti=self.refresh['jti']))
+        self.assertTrue(0 < access_ttl <= self.access.lifetime.total_seconds())
+        self.assertTrue(access_ttl < refresh_ttl <= self.refresh.lifetime.total_seconds())
+
+    def test_revoked_refresh_token_cannot_be_refreshed(self):
+        response = self.client.post("/api/token/refresh/", {"refresh": str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.post("/api/token/revoke/", {"refresh": str(self.refresh)})
+        response = self.client.post("/api/token/refresh/", {"refresh": str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_token_of_another_user_is_refused(self):
+        other = User.objects.create_user(username="other", password="testpass")
+        response = self.client.post("/api/token/revoke/", {"refresh": str(RefreshToken.for_user(other))})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.purchase().status_code, status.HTTP_201_CREATED)
+
+    def test_revocation_is_checked_in_the_user_state_round_trip(self):
+        self.purchase()
+        with patch('redis.StrictRedis.get') as get_mock:
+            self.assertEqual(self.purchase().status_code, status.HTTP_201_CREATED)
+        get_mock.assert_not_called()
+
+
+class AsyncAuthenticationTestCase(TransactionTestCase):
+    def setUp(self):
+        self.redis = RedisClient().client
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        CryptoCurrency.objects.create(symbol="BTC", price=100)
+        UserWallet.objects.create(user=self.user, balance=1000, locked_balance=0)
+
+    def tearDown(self):
+        self.redis.delete(USER_STATE_KEY.format(user_id=self.user.id))
+
+    def test_deactivated_user_is_rejected(self):
+        self.user.is_active = False
+        self.user.save()
+
+        response = asyncio.run(self.async_client.post(
+            "/api/async/purchase/", {"name": "BTC", "count": 1}, content_type="application/json",
+            authorization=f"Bearer {AccessToken.for_user(self.user)}",
+        ))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_revoked_token_is_rejected(self):
+        access = AccessToken.for_user(self.user)
+        revoke_token(access)
+        try:
+            response = asyncio.run(self.async_client.post(
+                "/api/async/purchase/", {"name": "BTC", "count": 1}, content_type="application/json",
+                authorization=f"Bearer {access}",
+            ))
+        finally:
+            self.redis.delete(REVOKED_TOKEN_KEY.format(jti=access['jti']))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(Order.objects.count(), 0)
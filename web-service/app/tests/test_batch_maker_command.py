@@ -29,15 +29,15 @@ class BatchOrdersTest(TestCase):
         order2 = Order.objects.create(transaction=self.transaction, user=self.user,
                                       crypto_currency=self.crypto_currency, amount=6, count=1,
                                       status='pending')
-        orders = [order1, order2]
 
-        exchange_transaction = self.command.create_exchange_transaction(orders, [order1.id, order2.id], 11)
+        exchange_transaction = self.command.create_exchange_transaction(self.crypto_currency.id, order2.id)
 
         self.assertEqual(ExchangeTransaction.objects.count(), 1)
         self.assertEqual(exchange_transaction.amount, 11)
         self.assertEqual(OrderExchangeTransaction.objects.count(), 2)
         self.assertEqual(Order.objects.get(id=order1.id).status, 'processing')
         self.assertEqual(Order.objects.get(id=order2.id).status, 'processing')
+        self.assertEqual(Order.objects.filter(exchange_transaction=exchange_transaction).count(), 2)
 
     @patch('app.redis_client.RedisClient')
     @patch('rq.Queue.enqueue')
@@ -74,7 +74,7 @@ class BatchOrdersTest(TestCase):
                                      status='pending')
 
         with self.assertRaises(ValueError) as context:
-            self.command.create_exchange_transaction([order], [order.id], 10)
+            self.command.create_exchange_transaction(self.crypto_currency.id, order.id)
         self.assertEqual(str(context.exception), "No exchanger found")
 
     def test_no_exchange_transaction_when_orders_below_min_batch_amount(self):
@@ -147,14 +147,97 @@ class BatchOrdersTest(TestCase):
                                       crypto_currency=self.crypto_currency,
                                       amount=6, count=1,
                                       status='processing')
-        orders = [order1, order2]
 
-        self.command.create_exchange_transaction(orders, [order1.id, order2.id], 11)
+        exchange_transaction = self.command.create_exchange_transaction(self.crypto_currency.id, order2.id)
 
         self.assertEqual(ExchangeTransaction.objects.count(), 1)
+        self.assertEqual(exchange_transaction.amount, 5)
+        self.assertEqual(OrderExchangeTransaction.objects.get().order_id, order1.id)
         self.assertEqual(Order.objects.get(id=order1.id).status, 'processing')
         self.assertEqual(Order.objects.get(id=order2.id).status, 'processing')
 
+    def test_orders_are_claimed_in_chunks(self):
+        self.command.chunk_size = 2
+        orders = [
+            Order.objects.create(transaction=self.transaction, user=self.user,
+                                 crypto_currency=self.crypto_currency, amount=amount, count=2,
+                                 status='pending')
+            for amount in [1, 2, 3, 4, 5]
+        ]
+
+        exchange_transaction = self.command.create_exchange_transaction(self.crypto_currency.id, orders[-1].id)
+
+        self.assertEqual(exchange_transaction.amount, 30)
+        self.assertEqual(OrderExchangeTransaction.objects.filter(exchange_transaction=exchange_transaction).count(), 5)
+        self.assertFalse(Order.objects.filter(status='pending').exists())
+
+    @patch('rq.Queue.enqueue')
+    def test_batches_are_capped_at_max_orders(self, enqueue_mock):
+        self.command.chunk_size = 2
+        self.command.max_orders = 3
+        orders = [
+            Order.objects.create(transaction=self.transaction, user=self.user,
+                                 crypto_currency=self.crypto_currency, amount=10, count=1, status='pending')
+            for _ in range(5)
+        ]
+
+        exchange_transactions = self.command.make_batch(self.crypto_currency.id, "BTC", orders[-1].id)
+
+        self.assertEqual([exchange_transaction.amount for exchange_transaction in exchange_transactions], [30, 20])
+        self.assertEqual(enqueue_mock.call_count, 2)
+        self.assertFalse(Order.objects.filter(status='pending').exists())
+
+    @patch('app.order_cache.OrderCache.invalidate')
+    def test_cached_orders_are_invalidated_per_chunk_on_commit(self, invalidate_mock):
+        self.command.chunk_size = 2
+        users = [User.objects.create(username=f"user-{index}") for index in range(3)]
+        orders = [
+            Order.objects.create(transaction=self.transaction, user=user, crypto_currency=self.crypto_currency,
+                                 amount=10, count=1, status='pending')
+            for user in users
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.command.create_exchange_transaction(self.crypto_currency.id, orders[-1].id)
+            invalidate_mock.assert_not_called()
+
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual([sorted(call.args[0]) for call in invalidate_mock.call_args_list],
+                         [[users[0].id, users[1].id], [users[2].id]])
+
+    def test_orders_after_max_order_id_are_left_for_next_batch(self):
+        order1 = Order.objects.create(transaction=self.transaction, user=self.user,
+                                      crypto_currency=self.crypto_currency, amount=12, count=1,
+                                      status='pending')
+        order2 = Order.objects.create(transaction=self.transaction, user=self.user,
+                                      crypto_currency=self.crypto_currency, amount=13, count=1,
+                                      status='pending')
+
+        exchange_transaction = self.command.create_exchange_transaction(self.crypto_currency.id, order1.id)
+
+        self.assertEqual(exchange_transaction.amount, 12)
+        self.assertEqual(Order.objects.get(id=order2.id).status, 'pending')
+
+    def test_no_exchange_transaction_when_orders_already_claimed(self):
+        order = Order.objects.create(transaction=self.transaction, user=self.user,
+                                     crypto_currency=self.crypto_currency, amount=12, count=1,
+                                     status='processing')
+
+        self.assertIsNone(self.command.create_exchange_transaction(self.crypto_currency.id, order.id))
+        self.assertEqual(ExchangeTransaction.objects.count(), 0)
+
+    def test_pending_totals_are_aggregated_per_symbol(self):
+        Order.objects.create(transaction=self.transaction, user=self.user,
+                             crypto_currency=self.crypto_currency, amount=3, count=2, status='pending')
+        Order.objects.create(transaction=self.transaction, user=self.user,
+                             crypto_currency=self.crypto_currency, amount=4, count=1, status='pending')
+        Order.objects.create(transaction=self.transaction, user=self.user,
+                             crypto_currency=self.ethereum, amount=5, count=1, status='pending')
+
+        totals = {row['crypto_currency__symbol']: row['sum_amount'] for row in self.command.pending_totals()}
+
+        self.assertEqual(totals, {'BTC': 10, 'ETH': 5})
+
     def test_batch_processing_with_mixed_order_amounts(self):
         Order.objects.create(transaction=self.transaction,
                              user=self.user,
@@ -186,3 +269,91 @@ class BatchOrdersTest(TestCase):
         enqueue_mock.assert_any_call(settle, 2, 'ETH')
 
         self.assertEqual(enqueue_mock.call_count, 2)
+
+    @patch('rq.Queue.enqueue')
+    def test_symbols_are_netted_into_one_multi_leg_batch(self, enqueue_mock):
+        Exchanger.objects.filter(id=self.exchanger.id).update(supports_multi_leg=True)
+        for symbol, amount in [(self.crypto_currency, 5), (self.ethereum, 7), (self.crypto_currency, 6)]:
+            Order.objects.create(transaction=self.transaction, user=self.user,
+                                 crypto_currency=symbol, amount=amount, count=2, status='pending')
+
+        call_command('batch_maker_command')
+
+        exchange_transaction = ExchangeTransaction.objects.get()
+        self.assertEqual(exchange_transaction.amount, 36)
+        self.assertEqual(exchange_transaction.legs, [{'currency': 'BTC', 'amount': '22.00000000'},
+                                                     {'currency': 'ETH', 'amount': '14.00000000'}])
+        self.assertEqual(Order.objects.filter(exchange_transaction=exchange_transaction).count(), 3)
+        enqueue_mock.assert_called_once_with(settle, exchange_transaction.id, None)
+
+    @patch('rq.Queue.enqueue')
+    def test_multi_leg_batches_are_capped_without_splitting_orders(self, enqueue_mock):
+        Exchanger.objects.filter(id=self.exchanger.id).update(supports_multi_leg=True, max_batch_amount=25)
+        for symbol, amount in [(self.crypto_currency, 10), (self.crypto_currency, 10), (self.ethereum, 10),
+                               (self.ethereum, 10)]:
+            Order.objects.create(transaction=self.transaction, user=self.user,
+                                 crypto_currency=symbol, amount=amount, count=1, status='pending')
+
+        call_command('batch_maker_command')
+
+        self.assertEqual([(batch.amount, batch.legs) for batch in ExchangeTransaction.objects.order_by('id')], [
+            (20, [{'currency': 'BTC', 'amount': '20.00000000'}]),
+            (20, [{'currency': 'ETH', 'amount': '20.00000000'}]),
+        ])
+        self.assertEqual(enqueue_mock.call_count, 2)
+
+
+class BatchMakerDaemonTest(TestCase):
+    def setUp(self):
+        self.command = Command()
+        self.command.min_batch_amount = 10
+        self.command.max_latency = 1.0
+        self.user = User.objects.create(username="testuser")
+        self.crypto_currency = CryptoCurrency.objects.create(symbol="BTC", name="Bitcoin", price=50000)
+        self.exchanger = Exchanger.objects.create(name="Test Exchanger", api_url="https://api.test.com")
+        self.transaction = Transaction.objects.create(user=self.user, amount=100, type="credit")
+
+    def create_order(self, amount):
+        return Order.objects.create(transaction=self.transaction, user=self.user,
+                                    crypto_currency=self.crypto_currency, amount=amount, count=1,
+                                    status='pending')
+
+    def signal(self, amount):
+        return {'crypto_currency_id': self.crypto_currency.id, 'symbol': 'BTC', 'amount': str(amount)}
+
+    @patch('rq.Queue.enqueue')
+    def test_batch_is_cut_as_soon_as_min_amount_is_reached(self, enqueue_mock):
+        pending = {}
+
+        self.create_order(4)
+        self.command.on_new_order(pending, self.signal(4))
+        self.assertEqual(ExchangeTransaction.objects.count(), 0)
+
+        self.create_order(6)
+        self.command.on_new_order(pending, self.signal(6))
+
+        self.assertEqual(ExchangeTransaction.objects.get().amount, 10)
+        self.assertEqual(pending, {})
+        enqueue_mock.assert_called_once_with(settle, ANY, 'BTC')
+
+    @patch('rq.Queue.enqueue')
+    def test_batch_below_min_amount_is_cut_when_window_expires(self, enqueue_mock):
+        self.create_order(3)
+        pending = {}
+        self.command.on_new_order(pending, self.signal(3))
+
+        self.command.cut_expired(pending, pending[self.crypto_currency.id]['since'] + 0.5)
+        self.assertEqual(ExchangeTransaction.objects.count(), 0)
+
+        self.command.cut_expired(pending, pending[self.crypto_currency.id]['since'] + 1.0)
+        self.assertEqual(ExchangeTransaction.objects.get().amount, 3)
+        self.assertEqual(pending, {})
+
+    def test_reconcile_seeds_pending_from_database(self):
+        self.create_order(3)
+        self.create_order(4)
+
+        pending = self.command.reconcile()
+
+        self.assertEqual(pending[self.crypto_currency.id]['amount'], 7)
+        self.assertEqual(pending[self.crypto_currency.id]['symbol'], 'BTC')
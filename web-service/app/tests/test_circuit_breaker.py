@@ -0,0 +1,124 @@
+import time
+from django.test import TestCase, override_settings
+from unittest.mock import patch, MagicMock, ANY
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from app.circuit_breaker import CircuitBreaker, BREAKER_KEY
+from app.exchanger_router import ExchangerRouter, STATS_KEY
+from app.models import Exchanger, ExchangeTransaction, ExchangerRequestLog
+from app.redis_client import RedisClient
+from app.tasks import settle
+
+
+@override_settings(EXCHANGER_BREAKER_FAILURES=3, EXCHANGER_BREAKER_COOLDOWN=30)
+class CircuitBreakerTestCase(TestCase):
+    def setUp(self):
+        self.redis = RedisClient().client
+        self.router = ExchangerRouter()
+        self.breaker = CircuitBreaker()
+        self.exchanger = Exchanger.objects.create(name="Exchanger", api_url="http://exchanger", fee_percentage=0.1)
+        self.backup = Exchanger.objects.create(name="Backup", api_url="http://backup", fee_percentage=0.2,
+                                               is_active=False)
+        self.clear_state()
+
+    def tearDown(self):
+        self.clear_state()
+
+    def clear_state(self):
+        for exchanger in (self.exchanger, self.backup):
+            self.redis.delete(STATS_KEY.format(exchanger_id=exchanger.id),
+                              BREAKER_KEY.format(exchanger_id=exchanger.id))
+
+    def fail(self, times):
+        for _ in range(times):
+            self.router.record(self.exchanger.id, 1.0, ok=False)
+
+    def later(self, seconds):
+        return patch('app.circuit_breaker.time.time', return_value=time.time() + seconds)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        self.fail(2)
+        self.router.record(self.exchanger.id, 0.1, ok=True)
+        self.fail(2)
+        self.assertTrue(self.breaker.allow(self.exchanger.id))
+
+        self.fail(1)
+        self.assertFalse(self.breaker.allow(self.exchanger.id))
+        self.assertAlmostEqual(self.breaker.retry_after(self.exchanger.id), 30, delta=1)
+
+    def test_half_open_circuit_lets_one_probe_through(self):
+        self.fail(3)
+
+        with self.later(31):
+            self.assertTrue(self.breaker.allow(self.exchanger.id))
+            self.assertFalse(self.breaker.allow(self.exchanger.id))
+
+        self.router.record(self.exchanger.id, 0.1, ok=True)
+        self.assertTrue(self.breaker.allow(self.exchanger.id))
+
+    def test_failed_probe_reopens_the_circuit(self):
+        self.fail(3)
+        with self.later(31):
+            self.assertTrue(self.breaker.allow(self.exchanger.id))
+            self.fail(1)
+            self.assertFalse(self.breaker.allow(self.exchanger.id))
+
+        state = self.router.stats([self.exchanger])[self.exchanger.id]['breaker']
+        self.assertEqual(state['state'], 'open')
+        self.assertEqual(state['opened'], 2)
+
+    @patch('rq.Queue.enqueue_in')
+    @patch('requests.post')
+    def test_settle_fails_fast_while_the_circuit_is_open(self, post_mock, enqueue_in_mock):
+        exchange_transaction = ExchangeTransaction.objects.create(exchanger=self.exchanger, amount=10)
+        self.fail(3)
+
+        settle(exchange_transaction.id, "BTC")
+
+        post_mock.assert_not_called()
+        exchange_transaction.refresh_from_db()
+        self.assertEqual(exchange_transaction.try_count, 0)
+        self.assertFalse(ExchangerRequestLog.objects.exists())
+        delay = enqueue_in_mock.call_args.args[0]
+        self.assertAlmostEqual(delay.total_seconds(), 30, delta=1)
+        enqueue_in_mock.assert_called_once_with(ANY, settle, exchange_transaction.id, "BTC")
+
+    @patch('requests.post')
+    def test_settle_is_rerouted_while_the_circuit_is_open(self, post_mock):
+        Exchanger.objects.filter(id=self.backup.id).update(is_active=True)
+        post_mock.return_value = MagicMock(status_code=200)
+        exchange_transaction = ExchangeTransaction.objects.create(exchanger=self.exchanger, amount=10)
+        self.fail(3)
+
+        settle(exchange_transaction.id, "BTC")
+
+        post_mock.assert_called_once_with("http://backup", json=ANY, timeout=ANY)
+        exchange_transaction.refresh_from_db()
+        self.assertEqual(exchange_transaction.exchanger_id, self.backup.id)
+        self.assertEqual(exchange_transaction.status, "Completed")
+
+    def test_health_endpoint_exposes_breaker_state(self):
+        self.fail(3)
+        self.breaker.allow(self.exchanger.id)
+
+        staff = User.objects.create_user(username="staff", password="staffpass", is_staff=True)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(staff)}")
+        response = client.get("/api/exchangers/health/")
+
+        self.assertEqual(response.status_code, 200)
+        health = response.data["exchangers"][0]
+        self.assertEqual(health["id"], self.exchanger.id)
+        self.assertFalse(health["healthy"])
+        self.assertEqual(health["samples"], 3)
+        self.assertEqual(health["circuit"]["state"], "open")
+        self.assertEqual(health["circuit"]["rejected"], 1)
+
+    def test_health_endpoint_is_staff_only(self):
+        self.assertEqual(APIClient().get("/api/exchangers/health/").status_code, 401)
+
+        user = User.objects.create_user(username="user", password="userpass")
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        self.assertEqual(client.get("/api/exchangers/health/").status_code, 403)
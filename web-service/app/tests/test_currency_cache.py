@@ -0,0 +1,71 @@
+import time
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from app.models import CryptoCurrency
+from app.currency_cache import CurrencyCache, currency_cache, VERSION_KEY, INVALIDATION_CHANNEL
+
+
+class CurrencyCacheTestCase(TestCase):
+    def setUp(self):
+        self.bitcoin = CryptoCurrency.objects.create(symbol="BTC", name="Bitcoin", price=50000)
+        self.ethereum = CryptoCurrency.objects.create(symbol="ETH", name="Ethereum", price=3000)
+
+    def test_lookups_are_served_without_queries(self):
+        currency_cache.get("BTC")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(currency_cache.get("BTC").price, 50000)
+            self.assertEqual(currency_cache.get("ETH").id, self.ethereum.id)
+            self.assertTrue(currency_cache.exists("ETH"))
+            self.assertFalse(currency_cache.exists("XRP"))
+            self.assertEqual(sorted(currency_cache.symbols()), ["BTC", "ETH"])
+
+    def test_unknown_symbol_raises_does_not_exist(self):
+        with self.assertRaises(CryptoCurrency.DoesNotExist):
+            currency_cache.get("XRP")
+
+    def test_save_invalidates_cached_price(self):
+        currency_cache.get("BTC")
+
+        self.bitcoin.price = 51000
+        self.bitcoin.save()
+
+        self.assertEqual(currency_cache.get("BTC").price, 51000)
+
+    def test_change_published_by_another_process_invalidates_snapshot(self):
+        currency_cache.get("BTC")
+        CryptoCurrency.objects.filter(id=self.bitcoin.id).update(price=52000)
+
+        client = currency_cache.redis_client.client
+        client.publish(INVALIDATION_CHANNEL, client.incr(VERSION_KEY))
+
+        deadline = time.monotonic() + 2
+        while currency_cache.get("BTC").price != 52000 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(currency_cache.get("BTC").price, 52000)
+
+    @override_settings(CURRENCY_CACHE_TTL=0)
+    def test_price_is_never_older_than_ttl(self):
+        currency_cache.get("BTC")
+        CryptoCurrency.objects.filter(id=self.bitcoin.id).update(price=53000)
+        time.sleep(0.01)
+
+        self.assertEqual(currency_cache.get("BTC").price, 53000)
+
+    @patch('app.currency_cache.CurrencyCache._listen')
+    @patch('app.currency_cache.os.getpid')
+    def test_listener_is_restarted_in_a_forked_process(self, getpid_mock, listen_mock):
+        cache = CurrencyCache()
+        getpid_mock.return_value = 100
+        cache.get("BTC")
+        parent_listener = cache._listener
+
+        cache.get("BTC")
+        self.assertIs(cache._listener, parent_listener)
+
+        getpid_mock.return_value = 101
+        cache.get("BTC")
+        self.assertIsNot(cache._listener, parent_listener)
+        parent_listener.join()
+        cache._listener.join()
+        self.assertEqual(listen_mock.call_count, 2)
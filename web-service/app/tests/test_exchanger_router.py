@@ -0,0 +1,109 @@
+import requests
+from django.contrib.auth.models import User
+from django.test import TestCase
+from unittest.mock import patch, ANY
+from app.circuit_breaker import BREAKER_KEY
+from app.exchanger_router import ExchangerRouter, STATS_KEY
+from app.management.commands.batch_maker_command import Command
+from app.models import CryptoCurrency, Exchanger, ExchangeTransaction, Order, Transaction
+from app.redis_client import RedisClient
+from app.tasks import settle
+from app.tasks.settle_task import fail_settlement
+
+
+class ExchangerRouterTestCase(TestCase):
+    def setUp(self):
+        self.redis = RedisClient().client
+        self.router = ExchangerRouter()
+        self.cheap = Exchanger.objects.create(name="Cheap", api_url="http://cheap", fee_percentage=0.1)
+        self.pricey = Exchanger.objects.create(name="Pricey", api_url="http://pricey", fee_percentage=0.2)
+        Exchanger.objects.create(name="Inactive", api_url="http://inactive", fee_percentage=0, is_active=False)
+        self.clear_stats()
+
+        self.user = User.objects.create(username="testuser")
+        self.crypto_currency = CryptoCurrency.objects.create(symbol="BTC", price=10)
+        self.transaction = Transaction.objects.create(user=self.user, amount=100, type="Debit")
+
+    def tearDown(self):
+        self.clear_stats()
+
+    def clear_stats(self):
+        for exchanger in Exchanger.objects.all():
+            self.redis.delete(STATS_KEY.format(exchanger_id=exchanger.id),
+                              BREAKER_KEY.format(exchanger_id=exchanger.id))
+
+    def fail(self, exchanger, times=5):
+        for _ in range(times):
+            self.router.record(exchanger.id, 1.0, ok=False)
+
+    def create_order(self, amount):
+        return Order.objects.create(transaction=self.transaction, user=self.user, crypto_currency=self.crypto_currency,
+                                    amount=amount, count=1, status='pending')
+
+    def test_cheapest_active_exchanger_is_chosen(self):
+        self.assertEqual(self.router.choose(), self.cheap)
+
+    def test_unhealthy_exchanger_is_routed_around_until_its_stats_expire(self):
+        self.fail(self.cheap, times=4)
+        self.assertEqual(self.router.choose(), self.cheap)
+
+        self.fail(self.cheap, times=1)
+        self.assertEqual(self.router.choose(), self.pricey)
+
+        self.clear_stats()
+        self.assertEqual(self.router.choose(), self.cheap)
+
+    def test_latency_breaks_fee_ties(self):
+        Exchanger.objects.filter(id=self.pricey.id).update(fee_percentage=0.1)
+        self.router.record(self.cheap.id, 2.0, ok=True)
+        self.router.record(self.pricey.id, 0.1, ok=True)
+        self.assertEqual(self.router.choose().id, self.pricey.id)
+
+    def test_no_active_exchanger(self):
+        Exchanger.objects.update(is_active=False)
+        with self.assertRaises(ValueError):
+            self.router.choose()
+
+    @patch('rq.Queue.enqueue')
+    def test_oversized_batch_is_split_across_exchangers(self, enqueue_mock):
+        Exchanger.objects.update(max_batch_amount=25)
+        orders = [self.create_order(amount) for amount in [10, 10, 10, 10, 30]]
+
+        exchange_transactions = Command().make_batch(self.crypto_currency.id, "BTC", orders[-1].id)
+
+        self.assertEqual([(batch.exchanger_id, batch.amount) for batch in exchange_transactions],
+                         [(self.cheap.id, 20), (self.pricey.id, 20), (self.cheap.id, 30)])
+        self.assertFalse(Order.objects.filter(status='pending').exists())
+        self.assertEqual(enqueue_mock.call_count, 3)
+        enqueue_mock.assert_called_with(settle, exchange_transactions[-1].id, "BTC")
+
+    @patch('rq.Queue.enqueue_in')
+    def test_retry_fails_over_to_another_exchanger(self, enqueue_in_mock):
+        exchange_transaction = ExchangeTransaction.objects.create(exchanger=self.cheap, amount=10, try_count=1)
+
+        fail_settlement(exchange_transaction, "BTC", lambda *args: None)
+
+        exchange_transaction.refresh_from_db()
+        self.assertEqual(exchange_transaction.exchanger, self.pricey)
+
+    def test_multi_leg_batch_only_fails_over_to_a_multi_leg_exchanger(self):
+        Exchanger.objects.filter(id=self.cheap.id).update(supports_multi_leg=True)
+        exchange_transaction = ExchangeTransaction.objects.create(exchanger=self.cheap, amount=10, try_count=1,
+                                                                  legs=[{'currency': 'BTC', 'amount': '10'}])
+
+        self.assertEqual(self.router.failover(exchange_transaction), self.cheap)
+
+        Exchanger.objects.filter(id=self.pricey.id).update(supports_multi_leg=True)
+        self.assertEqual(self.router.failover(exchange_transaction), self.pricey)
+
+    @patch('requests.post', side_effect=requests.Timeout)
+    @patch('rq.Queue.enqueue_in')
+    def test_settle_records_exchanger_errors(self, enqueue_in_mock, post_mock):
+        exchange_transaction = ExchangeTransaction.objects.create(exchanger=self.cheap, amount=10)
+
+        settle(exchange_transaction.id, "BTC")
+
+        stats = self.router.stats([self.cheap])[self.cheap.id]
+        self.assertEqual(stats['samples'], 1)
+        self.assertEqual(stats['error_rate'], 1)
+        enqueue_in_mock.assert_called_once_with(ANY, settle, exchange_transaction.id, "BTC")
@@ -0,0 +1,171 @@
+import json
+import threading
+import time
+from django.contrib.auth.models import User
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from unittest.mock import patch
+from redis.exceptions import ConnectionError
+from rest_framework.test import APIClient
+from rest_framework import status
+from app.models import CryptoCurrency, UserWallet, Order
+from app.currency_cache import currency_cache
+from app.redis_client import RedisClient
+from app.idempotency import IDEMPOTENCY_KEY, InFlightRefresher, request_fingerprint
+
+
+@override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0.2, IDEMPOTENCY_POLL_INTERVAL=0.01)
+class IdempotencyTestCase(TestCase):
+    def setUp(self):
+        self.redis = RedisClient().client
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.client.force_authenticate(user=self.user)
+
+        self.crypto = CryptoCurrency.objects.create(symbol="BTC", price=100)
+        self.wallet = UserWallet.objects.create(user=self.user, balance=1000, locked_balance=0)
+        self.redis_key = IDEMPOTENCY_KEY.format(user_id=self.user.id, key="key-1")
+        self.redis.delete(self.redis_key)
+
+    def tearDown(self):
+        self.redis.delete(self.redis_key)
+
+    def purchase(self, count=5, key="key-1"):
+        return self.client.post("/api/purchase/", {"name": "BTC", "count": count}, HTTP_IDEMPOTENCY_KEY=key)
+
+    @patch('redis.StrictRedis.publish', side_effect=ConnectionError("down"))
+    @patch('django.db.transaction.on_commit', side_effect=lambda func: func())
+    def test_failed_new_order_signal_is_not_a_failed_purchase(self, on_commit_mock, publish_mock):
+        with self.assertLogs('app.order_events', level='ERROR'):
+            first = self.purchase()
+        second = self.purchase()
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 1)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.locked_balance, 500)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.purchase()
+        second = self.purchase()
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.locked_balance, 500)
+
+    def test_replay_does_not_touch_the_database(self):
+        self.purchase()
+        currency_cache.symbols()
+        with self.assertNumQueries(0):
+            self.purchase()
+
+    def test_client_errors_are_replayed(self):
+        self.assertEqual(self.purchase(count=20).status_code, status.HTTP_400_BAD_REQUEST)
+        self.wallet.balance = 5000
+        self.wallet.save()
+
+        response = self.purchase(count=20)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["error"], "Insufficient balance")
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_key_reused_for_a_different_request_is_rejected(self):
+        self.purchase(count=5)
+        response = self.purchase(count=6)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_keys_are_scoped_per_user(self):
+        self.purchase()
+        other = User.objects.create_user(username="other", password="testpass")
+        UserWallet.objects.create(user=other, balance=1000, locked_balance=0)
+        self.client.force_authenticate(user=other)
+
+        response = self.purchase()
+        self.redis.delete(IDEMPOTENCY_KEY.format(user_id=other.id, key="key-1"))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_requests_without_a_key_are_not_deduplicated(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 1})
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 1})
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_duplicate_waits_for_the_in_flight_execution(self):
+        first = self.purchase()
+        stored = self.redis.get(self.redis_key)
+        entry = json.loads(stored)
+        # Pretend the first request is still running and finishes shortly
+        self.redis.set(self.redis_key, json.dumps({'state': 'in_flight', 'fingerprint': entry['fingerprint'],
+                                                   'token': 'other'}))
+        timer = threading.Timer(0.05, self.redis.set, args=(self.redis_key, stored))
+        timer.start()
+
+        response = self.purchase()
+        timer.join()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, first.data)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_duplicate_gives_up_while_the_execution_is_still_running(self):
+        self.purchase()
+        entry = json.loads(self.redis.get(self.redis_key))
+        self.redis.set(self.redis_key, json.dumps({'state': 'in_flight', 'fingerprint': entry['fingerprint'],
+                                                   'token': 'other'}))
+
+        response = self.purchase()
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Order.objects.count(), 1)
+
+    @patch('app.views.purchase_view.currency_cache')
+    def test_server_errors_are_not_stored(self, currency_cache_mock):
+        currency_cache_mock.get.side_effect = Exception("boom")
+        self.assertEqual(self.purchase().status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertIsNone(self.redis.get(self.redis_key))
+
+    @patch('app.idempotency.IdempotencyStore.claim', side_effect=ConnectionError)
+    def test_requests_are_served_without_redis(self, claim_mock):
+        response = self.purchase()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_batch_purchase_is_idempotent(self):
+        items = {"items": [{"name": "BTC", "count": 1}, {"name": "BTC", "count": 2}]}
+        self.client.post("/api/purchase/batch/", items, format="json", HTTP_IDEMPOTENCY_KEY="key-1")
+        response = self.client.post("/api/purchase/batch/", items, format="json", HTTP_IDEMPOTENCY_KEY="key-1")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_form_and_json_payloads_fingerprint_alike(self):
+        form = QueryDict(mutable=True)
+        form.update({"name": "BTC", "count": "5"})
+
+        self.assertEqual(request_fingerprint("POST", form), request_fingerprint("POST", {"count": "5", "name": "BTC"}))
+        self.assertNotEqual(request_fingerprint("POST", form), request_fingerprint("POST", {"name": "BTC"}))
+
+    @override_settings(IDEMPOTENCY_LOCK_TIMEOUT=0.3)
+    def test_in_flight_marker_is_kept_alive_while_the_request_runs(self):
+        self.redis.set(self.redis_key, "marker", px=300)
+        refresher = InFlightRefresher()
+        refresher.markers[self.redis_key] = "marker"
+        refresher.start()
+        try:
+            time.sleep(0.6)
+            self.assertEqual(self.redis.get(self.redis_key), b"marker")
+
+            refresher.markers.clear()
+            time.sleep(0.6)
+            self.assertIsNone(self.redis.get(self.redis_key))
+        finally:
+            refresher.stopped.set()
+            refresher.join()
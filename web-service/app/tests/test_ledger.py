@@ -0,0 +1,166 @@
+import time
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from app import ledger
+from app.redis_client import RedisClient
+from app.models import CryptoCurrency, Exchanger, ExchangeTransaction, LedgerCheckpoint, LedgerEntry, Order, UserWallet
+from app.tasks.settle_task import update_user_wallets_and_orders
+
+
+@override_settings(LEDGER_ENABLED=True)
+class LedgerTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.client.force_authenticate(user=self.user)
+        self.crypto = CryptoCurrency.objects.create(symbol="BTC", price=100)
+        self.wallet = UserWallet.objects.create(user=self.user, balance=1000, locked_balance=0)
+        with self.settings(LEDGER_ENABLED=False):
+            ledger.open_wallets()
+
+        self.redis = RedisClient().client
+        self.redis.delete(ledger.WRITERS_KEY, ledger.SPENDING_LOCK_KEY.format(user_id=self.user.id))
+
+    def tearDown(self):
+        self.redis.delete(ledger.WRITERS_KEY, ledger.SPENDING_LOCK_KEY.format(user_id=self.user.id))
+
+    def settle(self, status):
+        exchanger = Exchanger.objects.get_or_create(name="Exchanger", api_url="http://exchanger")[0]
+        exchange_transaction = ExchangeTransaction.objects.create(exchanger=exchanger, amount=0)
+        Order.objects.filter(status=Order.PENDING).update(status="processing", exchange_transaction=exchange_transaction)
+        update_user_wallets_and_orders(Order.objects.filter(exchange_transaction=exchange_transaction), status)
+
+    def assertBalances(self, balance, locked_balance):
+        self.assertEqual(ledger.balances([self.user.id])[self.user.id],
+                         {'balance': balance, 'locked_balance': locked_balance})
+
+    def assertWalletUntouched(self):
+        self.wallet.refresh_from_db()
+        self.assertEqual((self.wallet.balance, self.wallet.locked_balance, self.wallet.version), (1000, 0, 0))
+
+    def test_opening_brings_the_ledger_to_the_wallet(self):
+        self.assertBalances(1000, 0)
+        with self.settings(LEDGER_ENABLED=False):
+            self.assertEqual(ledger.open_wallets(), 0)
+
+    def test_opening_is_refused_once_the_ledger_is_on(self):
+        with self.assertRaises(CommandError):
+            call_command('ledger_command', '--open', stdout=StringIO())
+
+    def test_purchases_lock_funds_in_the_ledger_only(self):
+        response = self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post("/api/purchase/batch/", {"items": [{"name": "BTC", "count": 9},
+                                                                       {"name": "BTC", "count": 1}]}, format="json")
+        self.assertEqual([result['status'] for result in response.data['results']], ["rejected", "registered"])
+        response = self.client.post("/api/purchase/", {"name": "BTC", "count": 8})
+        self.assertEqual(response.status_code, 400)
+
+        self.assertBalances(1000, 300)
+        self.assertWalletUntouched()
+
+    def test_purchase_waits_for_the_users_spending_lock(self):
+        self.redis.set(ledger.SPENDING_LOCK_KEY.format(user_id=self.user.id), 'other', ex=10)
+        with self.settings(LEDGER_SPENDING_WAIT=0.1):
+            response = self.client.post("/api/purchase/", {"name": "BTC", "count": 1})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.data["error"], "The wallet is busy, try again")
+        self.assertFalse(Order.objects.exists())
+        self.assertBalances(1000, 0)
+
+    def test_wallet_is_served_from_the_ledger(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+
+        response = self.client.get("/api/wallet/")
+        self.assertEqual(response.data["balance"], "1000.00000000")
+        self.assertEqual(response.data["locked_balance"], "200.00000000")
+        self.assertEqual(response.data["version"], LedgerEntry.objects.filter(user=self.user).latest('id').id)
+
+    def test_every_movement_is_balanced(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+        self.client.post("/api/purchase/batch/", {"items": [{"name": "BTC", "count": 1}]}, format="json")
+        self.settle("Completed")
+
+        references = LedgerEntry.objects.values_list('reference', flat=True).distinct()
+        for reference in references:
+            self.assertEqual(sum(LedgerEntry.objects.filter(reference=reference).values_list('amount', flat=True)), 0)
+        self.assertEqual(LedgerEntry.objects.filter(kind='lock').count(), 4)
+
+    def test_completed_and_failed_batches(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+        self.settle("Completed")
+        self.assertBalances(800, 0)
+
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 3})
+        self.settle("Failed")
+        self.assertBalances(800, 0)
+        self.assertWalletUntouched()
+        self.assertEqual(list(ledger.reconcile()), [])
+        self.assertEqual(ledger.imbalance(), 0)
+
+    def test_settlement_is_one_insert(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 1})
+        with CaptureQueriesContext(connection) as queries:
+            self.settle("Completed")
+        inserts = [query for query in queries
+                   if query['sql'].startswith('INSERT') and 'app.ledger_entry' in query['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertFalse([query for query in queries if 'app.user_wallet' in query['sql']])
+
+    def test_nothing_is_recorded_when_disabled(self):
+        entries = LedgerEntry.objects.count()
+        with self.settings(LEDGER_ENABLED=False):
+            self.client.post("/api/purchase/", {"name": "BTC", "count": 1})
+        self.assertEqual(LedgerEntry.objects.count(), entries)
+
+    def test_compaction_keeps_balances(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+
+        self.assertEqual(ledger.compact(), 2)
+        self.assertEqual(LedgerCheckpoint.objects.get(user=self.user, account='locked').balance, 200)
+        self.assertBalances(1000, 200)
+
+        # A second run only folds what is new
+        self.assertEqual(ledger.compact(), 0)
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 1})
+        self.assertEqual(ledger.compact(), 2)
+        self.assertEqual(LedgerCheckpoint.objects.get(user=self.user, account='locked').balance, 300)
+        self.assertBalances(1000, 300)
+
+    def test_compaction_waits_for_open_ledger_transactions(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+
+        with ledger.writing():
+            # The open transaction may still commit an id below the horizon
+            self.assertEqual(ledger.compact(wait=0.1), 0)
+        self.assertFalse(LedgerCheckpoint.objects.filter(account='locked').exists())
+
+        self.assertEqual(ledger.compact(wait=0.1), 2)
+        self.assertBalances(1000, 200)
+
+    def test_compaction_ignores_the_mark_of_a_dead_writer(self):
+        self.redis.zadd(ledger.WRITERS_KEY, {'dead': time.time() - 1})
+
+        self.assertEqual(ledger.compact(wait=0), 2)
+        self.assertEqual(self.redis.zcard(ledger.WRITERS_KEY), 0)
+
+    def test_balances_are_two_queries(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+        ledger.compact()
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 1})
+        with self.assertNumQueries(2):
+            ledger.balances([self.user.id])
+
+    def test_reconciliation_reports_accounts_below_zero(self):
+        LedgerEntry.objects.bulk_create(ledger.lock_entries(self.user.id, 1500))
+        out = StringIO()
+        call_command('ledger_command', '--reconcile', stdout=out)
+        self.assertIn("Ledger imbalance: 0", out.getvalue())
+        self.assertIn(f"User {self.user.id}", out.getvalue())
+        self.assertIn("1 users have an account below zero", out.getvalue())
@@ -0,0 +1,153 @@
+import threading
+import time
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from unittest.mock import patch, MagicMock
+from rest_framework.test import APIClient
+from rq import Queue
+from app import metrics
+from app.async_settlement import QUEUE_KEY
+from app.circuit_breaker import BREAKER_KEY
+from app.exchanger_router import STATS_KEY
+from app.models import CryptoCurrency, Exchanger, ExchangeTransaction, UserWallet
+from app.redis_client import RedisClient
+from app.request_log import LOG_BUFFER_KEY
+from app.tasks import settle
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.redis = RedisClient().client
+        metrics.flush()
+        self.redis.delete(metrics.METRICS_KEY, QUEUE_KEY, LOG_BUFFER_KEY)
+
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        CryptoCurrency.objects.create(symbol="BTC", price=100)
+        UserWallet.objects.create(user=self.user, balance=250, locked_balance=0)
+
+    def tearDown(self):
+        self.redis.delete(metrics.METRICS_KEY, QUEUE_KEY, LOG_BUFFER_KEY, Queue(name="BTC", connection=self.redis).key)
+
+    def scrape(self):
+        metrics.flush()
+        response = APIClient().get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        return response.content.decode().splitlines()
+
+    def test_histogram_buckets_are_cumulative(self):
+        for seconds in (0.003, 0.003, 0.2, 100):
+            metrics.BATCH_SECONDS.observe(seconds, symbol="BTC")
+
+        lines = self.scrape()
+
+        self.assertIn("# TYPE batch_seconds histogram", lines)
+        self.assertIn('batch_seconds_bucket{symbol="BTC",le="0.001"} 0', lines)
+        self.assertIn('batch_seconds_bucket{symbol="BTC",le="0.005"} 2', lines)
+        self.assertIn('batch_seconds_bucket{symbol="BTC",le="0.25"} 3', lines)
+        self.assertIn('batch_seconds_bucket{symbol="BTC",le="60"} 3', lines)
+        self.assertIn('batch_seconds_bucket{symbol="BTC",le="+Inf"} 4', lines)
+        self.assertIn('batch_seconds_count{symbol="BTC"} 4', lines)
+        self.assertIn('batch_seconds_sum{symbol="BTC"} 100.206', lines)
+
+    def test_every_thread_records_into_its_own_shard(self):
+        def record():
+            for _ in range(1000):
+                metrics.SETTLEMENTS.inc(status="completed")
+            metrics.flush()
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIn('settlements_total{status="completed"} 4000', self.scrape())
+
+    @override_settings(METRICS_FLUSH_INTERVAL=0.05)
+    def test_idle_thread_is_flushed_in_the_background(self):
+        recorded, release = threading.Event(), threading.Event()
+
+        def record():
+            metrics.SETTLEMENTS.inc(status="failed")
+            recorded.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=record)
+        thread.start()
+        recorded.wait(5)
+        flusher = metrics.MetricsFlusher()
+        flusher.start()
+        try:
+            field = metrics.SETTLEMENTS.field({'status': 'failed'}, 'total')
+            deadline = time.monotonic() + 5
+            while self.redis.hget(metrics.METRICS_KEY, field) is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(self.redis.hget(metrics.METRICS_KEY, field), b'1')
+        finally:
+            flusher.stopped.set()
+            release.set()
+            thread.join()
+            flusher.join()
+
+    def test_samples_of_a_finished_thread_are_flushed(self):
+        thread = threading.Thread(target=lambda: metrics.SETTLEMENTS.inc(3, status="retried"))
+        thread.start()
+        thread.join()
+
+        metrics.flush_all()
+
+        self.assertIn('settlements_total{status="retried"} 3', self.scrape())
+        self.assertFalse([shard for shard in metrics._shards if shard.thread is thread])
+
+    def test_flush_ships_only_what_changed(self):
+        metrics.PURCHASES.inc(status="registered")
+        metrics.flush()
+        metrics.flush()
+        metrics.PURCHASES.inc(status="registered")
+        metrics.flush()
+
+        self.assertIn('purchases_total{status="registered"} 2', self.scrape())
+
+    @override_settings(METRICS_FLUSH_INTERVAL=0)
+    def test_shard_is_flushed_once_the_interval_passes(self):
+        metrics.PURCHASES.inc(status="registered")
+        self.assertEqual(self.redis.hlen(metrics.METRICS_KEY), 1)
+
+    def test_purchases_record_the_wallet_lock(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 1})
+
+        lines = self.scrape()
+
+        self.assertIn('purchases_total{status="registered"} 1', lines)
+        self.assertIn('purchases_total{status="rejected"} 1', lines)
+        self.assertIn('wallet_lock_seconds_count{path="purchase"} 2', lines)
+        self.assertIn('purchase_seconds_count{path="purchase"} 2', lines)
+
+    @patch('requests.post')
+    def test_settle_records_the_exchanger_call(self, post_mock):
+        post_mock.return_value = MagicMock(status_code=200)
+        exchanger = Exchanger.objects.create(name="Exchanger", api_url="http://exchanger")
+        self.redis.delete(STATS_KEY.format(exchanger_id=exchanger.id), BREAKER_KEY.format(exchanger_id=exchanger.id))
+        exchange_transaction = ExchangeTransaction.objects.create(exchanger=exchanger, amount=10)
+
+        settle(exchange_transaction.id, "BTC")
+
+        # settle flushes on its own, since RQ work horses exit after each job
+        lines = APIClient().get("/metrics").content.decode().splitlines()
+        self.assertIn(f'exchanger_request_seconds_count{{exchanger="{exchanger.id}",outcome="ok"}} 1', lines)
+        self.assertIn('settlements_total{status="completed"} 1', lines)
+
+    def test_queue_depths_are_measured_at_scrape_time(self):
+        self.redis.rpush(Queue(name="BTC", connection=self.redis).key, "job-1", "job-2")
+        self.redis.rpush(QUEUE_KEY, "batch")
+
+        lines = self.scrape()
+
+        self.assertIn('rq_queue_depth{queue="default"} 0', lines)
+        self.assertIn('rq_queue_depth{queue="BTC"} 2', lines)
+        self.assertIn('async_settle_queue_depth{state="ready"} 1', lines)
+        self.assertIn('exchanger_request_log_buffer 0', lines)
@@ -0,0 +1,136 @@
+import asyncio
+import time
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from unittest.mock import patch
+from rest_framework_simplejwt.tokens import AccessToken
+from app.authentication import USER_STATE_KEY
+from app.models import CryptoCurrency, Exchanger, ExchangeTransaction, Order, Transaction, UserWallet
+from app.order_events import ORDER_UPDATES_CHANNEL, ORDER_STREAM_KEY, publish_order_updates
+from app.order_stream import OrderEventHub, order_stream
+from app.redis_client import RedisClient
+from app.tasks.settle_task import update_user_wallets_and_orders
+
+
+class OrderStreamTestCase(SimpleTestCase):
+    user_id = 990001
+
+    def setUp(self):
+        self.redis = RedisClient().client
+        self.redis.set(USER_STATE_KEY.format(user_id=self.user_id), b'1')
+        self.redis.delete(ORDER_STREAM_KEY.format(user_id=self.user_id))
+        token = AccessToken()
+        token['user_id'] = self.user_id
+        self.authorization = f"Bearer {token}".encode()
+
+    def tearDown(self):
+        self.redis.delete(USER_STATE_KEY.format(user_id=self.user_id), ORDER_STREAM_KEY.format(user_id=self.user_id))
+
+    def stream(self, headers, until, before_disconnect=None):
+        """Runs the stream until a body chunk contains `until`; returns every ASGI message sent"""
+        async def run():
+            sent = []
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {'type': 'http', 'path': '/api/orders/stream/', 'headers': headers, 'query_string': b''}
+            task = asyncio.ensure_future(order_stream(scope, receive, send))
+
+            deadline = time.monotonic() + 5
+            while not any(until in message.get('body', b'') for message in sent):
+                self.assertLess(time.monotonic(), deadline, f"stream never sent {until!r}: {sent}")
+                if task.done():
+                    break
+                if before_disconnect:
+                    before_disconnect()
+                await asyncio.sleep(0.01)
+
+            disconnect.set()
+            await asyncio.wait_for(task, 5)
+            self.assertEqual(OrderEventHub.for_loop().listeners, {})
+            return sent
+
+        return asyncio.run(run())
+
+    def test_live_updates_are_pushed(self):
+        def publish_once_subscribed():
+            if self.redis.pubsub_numsub(ORDER_UPDATES_CHANNEL)[0][1] and not published:
+                publish_order_updates({self.user_id: {'status': 'completed', 'order_ids': [1, 2], 'batch_id': 7}})
+                published.append(True)
+
+        published = []
+        sent = self.stream([(b'authorization', self.authorization)], b'order_update', publish_once_subscribed)
+
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), sent[0]['headers'])
+        body = b''.join(message.get('body', b'') for message in sent)
+        self.assertIn(b'event: order_update\ndata: {"status": "completed", "order_ids": [1, 2], "batch_id": 7}', body)
+
+    def test_reconnecting_client_gets_missed_updates(self):
+        publish_order_updates({self.user_id: {'status': 'completed', 'order_ids': [1], 'batch_id': 1}})
+        publish_order_updates({self.user_id: {'status': 'failed', 'order_ids': [2], 'batch_id': 2}})
+        first_id, second_id = [entry_id for entry_id, _ in
+                               self.redis.xrange(ORDER_STREAM_KEY.format(user_id=self.user_id))]
+
+        sent = self.stream([(b'authorization', self.authorization), (b'last-event-id', first_id)], b'failed')
+
+        body = b''.join(message.get('body', b'') for message in sent)
+        self.assertIn(b'id: ' + second_id, body)
+        self.assertNotIn(b'"completed"', body)
+
+    @override_settings(ORDER_STREAM_HEARTBEAT=0.01)
+    def test_idle_stream_sends_keep_alives(self):
+        sent = self.stream([(b'authorization', self.authorization)], b': keep-alive')
+        self.assertEqual(sent[0]['status'], 200)
+
+    def test_token_query_parameter(self):
+        async def run():
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {'type': 'http', 'path': '/api/orders/stream/', 'headers': [],
+                     'query_string': b'token=' + self.authorization[len(b'Bearer '):]}
+            receive = asyncio.Queue()
+            receive.put_nowait({'type': 'http.disconnect'})
+            await order_stream(scope, receive.get, send)
+            return sent
+
+        self.assertEqual(asyncio.run(run())[0]['status'], 200)
+
+    def test_unauthenticated_client_is_rejected(self):
+        sent = self.stream([], b'')
+        self.assertEqual(sent[0]['status'], 401)
+
+
+class SettlementUpdatesTestCase(TestCase):
+    @patch('app.tasks.settle_task.publish_order_updates')
+    def test_settlement_publishes_status_changes_per_user_after_commit(self, publish_mock):
+        exchanger = Exchanger.objects.create(name="Exchanger", api_url="http://exchanger")
+        exchange_transaction = ExchangeTransaction.objects.create(exchanger=exchanger, amount=300)
+        crypto = CryptoCurrency.objects.create(symbol="BTC", price=100)
+
+        expected = {}
+        for username in ["first", "second"]:
+            user = User.objects.create(username=username)
+            UserWallet.objects.create(user=user, balance=1000, locked_balance=100)
+            trx = Transaction.objects.create(user=user, amount=100, type="Debit")
+            order = Order.objects.create(user=user, crypto_currency=crypto, transaction=trx, amount=100, count=1,
+                                         status="processing", exchange_transaction=exchange_transaction)
+            expected[user.id] = {'status': 'completed', 'order_ids': [order.id], 'batch_id': exchange_transaction.id}
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            update_user_wallets_and_orders(Order.objects.filter(exchange_transaction=exchange_transaction),
+                                           "Completed")
+        publish_mock.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        publish_mock.assert_called_once_with(expected)
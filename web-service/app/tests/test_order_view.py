@@ -0,0 +1,121 @@
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+from app.models import CryptoCurrency, Exchanger, ExchangeTransaction, Order, Transaction, UserWallet
+from app.redis_client import RedisClient
+from app.tasks.settle_task import update_user_wallets_and_orders
+from app.order_cache import VERSION_KEY, PAGE_KEY
+
+
+class OrderViewTestCase(TestCase):
+    def setUp(self):
+        self.redis = RedisClient().client
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.other_user = User.objects.create_user(username="otheruser", password="testpass")
+        self.client.force_authenticate(user=self.user)
+        self.clear_cache()
+
+        self.crypto = CryptoCurrency.objects.create(symbol="BTC", price=100)
+        UserWallet.objects.create(user=self.user, balance=10000, locked_balance=1000)
+        self.transaction = Transaction.objects.create(user=self.user, amount=100, type="Debit")
+
+        # Five orders a minute apart; the last two share a timestamp
+        now = timezone.now()
+        self.orders = []
+        for minutes in [4, 3, 2, 1, 1]:
+            order = self.create_order(self.user)
+            Order.objects.filter(id=order.id).update(created_at=now - timedelta(minutes=minutes))
+            self.orders.append(order)
+        self.create_order(self.other_user)
+
+    def tearDown(self):
+        self.clear_cache()
+
+    def clear_cache(self):
+        for user in (self.user, self.other_user):
+            self.redis.delete(VERSION_KEY.format(user_id=user.id))
+            for key in self.redis.scan_iter(match=PAGE_KEY.format(user_id=user.id, version='*', page='*')):
+                self.redis.delete(key)
+
+    def create_order(self, user, **kwargs):
+        return Order.objects.create(user=user, crypto_currency=self.crypto, transaction=self.transaction,
+                                    amount=100, count=1, **kwargs)
+
+    def test_orders_are_listed_newest_first(self):
+        response = self.client.get("/api/orders/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The tie on created_at is broken by id
+        expected = [self.orders[i].id for i in [4, 3, 2, 1, 0]]
+        self.assertEqual([order["id"] for order in response.data["results"]], expected)
+        self.assertIsNone(response.data["next_cursor"])
+        self.assertEqual(response.data["results"][0]["symbol"], "BTC")
+        self.assertEqual(response.data["results"][0]["status"], "pending")
+
+    def test_cursor_pagination_visits_every_order_once(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {"page_size": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.client.get("/api/orders/", params)
+            seen += [order["id"] for order in response.data["results"]]
+            cursor = response.data["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, [self.orders[i].id for i in [4, 3, 2, 1, 0]])
+
+    def test_page_is_one_query_and_cached_afterwards(self):
+        with self.assertNumQueries(1):
+            self.client.get("/api/orders/", {"page_size": 2})
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/orders/", {"page_size": 2})
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_settlement_invalidates_cached_orders(self):
+        exchanger = Exchanger.objects.create(name="Exchanger", api_url="http://exchanger")
+        exchange_transaction = ExchangeTransaction.objects.create(exchanger=exchanger, amount=100)
+        Order.objects.filter(id=self.orders[4].id).update(status="processing",
+                                                          exchange_transaction=exchange_transaction)
+        self.client.get("/api/orders/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_user_wallets_and_orders(Order.objects.filter(exchange_transaction=exchange_transaction),
+                                           "Completed")
+
+        response = self.client.get("/api/orders/")
+        self.assertEqual(response.data["results"][0]["status"], "completed")
+        self.assertEqual(response.data["results"][0]["batch_id"], exchange_transaction.id)
+
+    def test_purchase_invalidates_cached_orders(self):
+        self.client.get("/api/orders/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/purchase/", {"name": "BTC", "count": 1})
+
+        response = self.client.get("/api/orders/")
+        self.assertEqual(len(response.data["results"]), 6)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/orders/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_order_detail(self):
+        response = self.client.get(f"/api/orders/{self.orders[0].id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["id"], self.orders[0].id)
+        self.assertIsNone(response.data["batch_status"])
+
+    def test_order_of_another_user_is_not_found(self):
+        other_order = Order.objects.get(user=self.other_user)
+        response = self.client.get(f"/api/orders/{other_order.id}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unauthenticated_user(self):
+        self.client.logout()
+        self.assertEqual(self.client.get("/api/orders/").status_code, status.HTTP_401_UNAUTHORIZED)
@@ -1,8 +1,10 @@
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from unittest.mock import patch
 from rest_framework.test import APIClient
 from rest_framework import status
 from app.models import CryptoCurrency, UserWallet, Transaction, Order
+from app.currency_cache import currency_cache
 
 
 class PurchaseTestCase(TestCase):
@@ -82,3 +84,102 @@ class PurchaseTestCase(TestCase):
 
         self.assertEqual(Transaction.objects.count(), initial_trx_count)
         self.assertEqual(Order.objects.count(), initial_order_count)
+
+    @patch('app.views.purchase_view.publish_new_order')
+    def test_new_order_is_signalled_after_commit(self, publish_mock):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/purchase/", {"name": "BTC", "count": 5})
+
+        publish_mock.assert_called_once_with(self.crypto.id, "BTC", 500)
+
+
+class BatchPurchaseTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.client.force_authenticate(user=self.user)
+
+        self.btc = CryptoCurrency.objects.create(symbol="BTC", price=100)
+        self.eth = CryptoCurrency.objects.create(symbol="ETH", price=10)
+        self.wallet = UserWallet.objects.create(user=self.user, balance=1000, locked_balance=0)
+
+    def post(self, items):
+        return self.client.post("/api/purchase/batch/", {"items": items}, format="json")
+
+    def test_successful_batch(self):
+        response = self.post([{"name": "BTC", "count": 5}, {"name": "eth", "count": 3}])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([result["status"] for result in response.data["results"]], ["registered", "registered"])
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.locked_balance, 530)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(
+            sorted(Order.objects.values_list("crypto_currency__symbol", "count", "transaction__amount")),
+            [("BTC", 5, 500), ("ETH", 3, 30)],
+        )
+
+    def test_items_the_balance_cannot_cover_are_rejected(self):
+        response = self.post([
+            {"name": "BTC", "count": 8},
+            {"name": "BTC", "count": 3},
+            {"name": "ETH", "count": 20},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = response.data["results"]
+        self.assertEqual([result["status"] for result in results], ["registered", "rejected", "registered"])
+        self.assertEqual(results[1]["error"], "Insufficient balance")
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.locked_balance, 1000)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_nothing_is_written_when_every_item_is_rejected(self):
+        response = self.post([{"name": "BTC", "count": 11}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["results"][0]["error"], "Insufficient balance")
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.locked_balance, 0)
+        self.assertEqual(Transaction.objects.count(), 0)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_invalid_item_rejects_the_whole_batch(self):
+        response = self.post([{"name": "BTC", "count": 1}, {"name": "DOGE", "count": 1}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["items"][1]["name"][0], "This symbol name does not exist")
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_empty_batch(self):
+        response = self.post([])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(PURCHASE_BATCH_MAX_ITEMS=2)
+    def test_too_many_items(self):
+        response = self.post([{"name": "BTC", "count": 1}] * 3)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("items", response.data)
+
+    def test_wallet_not_found(self):
+        self.wallet.delete()
+        response = self.post([{"name": "BTC", "count": 1}])
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data["error"], "User wallet not found")
+
+    def test_wallet_is_locked_once_and_rows_are_bulk_inserted(self):
+        items = [{"name": "ETH", "count": 1}] * 20
+        currency_cache.symbols()
+        # Savepoint, wallet lock and update, transaction insert and id lookup, order insert, release
+        with self.assertNumQueries(7):
+            response = self.post(items)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 20)
+
+    @patch('app.views.purchase_view.publish_new_order')
+    def test_new_orders_are_signalled_per_symbol_after_commit(self, publish_mock):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post([{"name": "BTC", "count": 1}, {"name": "BTC", "count": 2}, {"name": "ETH", "count": 1}])
+
+        publish_mock.assert_any_call(self.btc.id, "BTC", 300)
+        publish_mock.assert_any_call(self.eth.id, "ETH", 10)
+        self.assertEqual(publish_mock.call_count, 2)
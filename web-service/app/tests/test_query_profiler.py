@@ -0,0 +1,122 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from unittest.mock import patch, MagicMock
+from rest_framework.test import APIClient
+from app.circuit_breaker import BREAKER_KEY
+from app.exchanger_router import STATS_KEY
+from app.management.commands.batch_maker_command import Command
+from app.models import CryptoCurrency, Exchanger, ExchangeTransaction, Order, Transaction, UserWallet
+from app.query_profiler import profile, query_budget
+from app.redis_client import RedisClient
+from app.tasks import settle
+from app.wallet_cache import SNAPSHOT_KEY
+
+# Queries each hot path may run, whatever the number of orders and users it touches
+PURCHASE_BUDGET = 7
+BATCH_MAKER_BUDGET = 9
+SETTLE_BUDGET = 8
+FAILED_SETTLE_BUDGET = 10
+
+
+class QueryProfilerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.crypto_currency = CryptoCurrency.objects.create(symbol="BTC", price=10)
+        UserWallet.objects.create(user=self.user, balance=1000, locked_balance=0)
+
+        self.exchanger = Exchanger.objects.create(name="Exchanger", api_url="http://exchanger", max_retries=1)
+        RedisClient().client.delete(STATS_KEY.format(exchanger_id=self.exchanger.id),
+                                    BREAKER_KEY.format(exchanger_id=self.exchanger.id))
+
+    def create_orders(self, users_count, status="pending"):
+        orders = []
+        for index in range(users_count):
+            user = User.objects.create(username=f"user-{index}")
+            UserWallet.objects.create(user=user, balance=1000, locked_balance=100)
+            transaction = Transaction.objects.create(user=user, amount=100, type="Debit")
+            for count in [3, 7]:
+                orders.append(Order.objects.create(transaction=transaction, user=user,
+                                                   crypto_currency=self.crypto_currency, amount=10, count=count,
+                                                   status=status))
+        return orders
+
+    def create_batch(self, users_count):
+        exchange_transaction = ExchangeTransaction.objects.create(exchanger=self.exchanger, amount=100)
+        for order in self.create_orders(users_count, status="processing"):
+            order.exchange_transaction = exchange_transaction
+            order.save()
+        return exchange_transaction
+
+    def test_profile_is_off_by_default(self):
+        with profile("job") as query_profile:
+            User.objects.count()
+        self.assertIsNone(query_profile)
+
+    @override_settings(QUERY_PROFILING=True)
+    def test_profile_reports_repeated_statements(self):
+        with self.assertLogs('app.query_profiler', level='WARNING') as logs:
+            with profile("job") as query_profile:
+                for user_id in range(3):
+                    User.objects.filter(id=user_id).exists()
+
+        self.assertEqual(query_profile.count, 3)
+        self.assertEqual(len(query_profile.duplicates()), 1)
+        self.assertEqual(query_profile.duplicates()[0][1], 3)
+        self.assertIn("job: 3 queries", logs.output[0])
+
+    @override_settings(QUERY_PROFILING=True)
+    def test_middleware_reports_queries_per_request(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        RedisClient().client.delete(SNAPSHOT_KEY.format(user_id=self.user.id))
+
+        with self.assertLogs('app.query_profiler', level='INFO') as logs:
+            response = client.get("/api/wallet/")
+
+        self.assertEqual(response["X-Query-Count"], "1")
+        self.assertIn("wallet: 1 queries", logs.output[0])
+
+    def test_query_budget_fails_with_the_repeated_statements(self):
+        with self.assertRaisesRegex(AssertionError, r"over its budget of 2 queries\n.*\n  3x SELECT"):
+            with query_budget(2, "loop"):
+                for user_id in range(3):
+                    User.objects.filter(id=user_id).exists()
+
+    def test_purchase_budget(self):
+        with query_budget(PURCHASE_BUDGET, "purchase"):
+            response = self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+        self.assertEqual(response.status_code, 201)
+
+    @patch('rq.Queue.enqueue')
+    def test_batch_maker_budget(self, enqueue_mock):
+        orders = self.create_orders(10)
+
+        with query_budget(BATCH_MAKER_BUDGET, "batch_maker"):
+            Command().make_batch(self.crypto_currency.id, "BTC", orders[-1].id)
+
+        self.assertFalse(Order.objects.filter(status="pending").exists())
+
+    @patch('requests.post')
+    def test_settle_budget(self, post_mock):
+        post_mock.return_value = MagicMock(status_code=200)
+        exchange_transaction = self.create_batch(10)
+
+        with query_budget(SETTLE_BUDGET, "settle"):
+            settle(exchange_transaction.id, "BTC")
+
+        exchange_transaction.refresh_from_db()
+        self.assertEqual(exchange_transaction.status, "Completed")
+
+    @patch('requests.post')
+    def test_failed_settle_budget(self, post_mock):
+        post_mock.return_value = MagicMock(status_code=500)
+        exchange_transaction = self.create_batch(10)
+
+        with query_budget(FAILED_SETTLE_BUDGET, "failed settle"):
+            settle(exchange_transaction.id, "BTC")
+
+        exchange_transaction.refresh_from_db()
+        self.assertEqual(exchange_transaction.status, "Failed")
+        self.assertEqual(Transaction.objects.filter(type="Credit").count(), 10)
@@ -0,0 +1,80 @@
+from io import StringIO
+from django.test import SimpleTestCase
+from unittest.mock import patch, MagicMock
+from redis.exceptions import ConnectionError
+from app.management.commands.queues_worker_command import Command, Supervisor, assign_queues, parse_affinity
+
+
+class QueuesWorkerSupervisorTest(SimpleTestCase):
+    def setUp(self):
+        self.supervisor = Supervisor(workers=2, affinity={'BTC': 1, 'ETH': 0}, poll_interval=0, stdout=StringIO())
+        self.spawned = []
+        spawn_patcher = patch.object(Supervisor, 'spawn', side_effect=self.spawn)
+        spawn_patcher.start()
+        self.addCleanup(spawn_patcher.stop)
+
+    def spawn(self, index, queue_names):
+        process = MagicMock()
+        process.is_alive.return_value = True
+        self.spawned.append((index, queue_names))
+        return process
+
+    def test_symbols_are_spread_over_workers_with_pinned_affinity(self):
+        assignment = assign_queues(['BTC', 'ETH', 'XRP', 'LTC'], 2, {'BTC': 1, 'ETH': 0})
+
+        self.assertEqual(len(assignment), 2)
+        self.assertTrue(all(queues[0] == 'default' for queues in assignment))
+        self.assertIn('BTC', assignment[1])
+        self.assertIn('ETH', assignment[0])
+        self.assertEqual(sorted(sum((queues[1:] for queues in assignment), [])), ['BTC', 'ETH', 'LTC', 'XRP'])
+        self.assertEqual(assignment, assign_queues(['LTC', 'XRP', 'ETH', 'BTC'], 2, {'BTC': 1, 'ETH': 0}))
+
+    def test_parse_affinity(self):
+        self.assertEqual(parse_affinity("btc:0, ETH:1"), {'BTC': 0, 'ETH': 1})
+        self.assertEqual(parse_affinity(""), {})
+
+    @patch('app.management.commands.queues_worker_command.currency_cache')
+    def test_crashed_worker_is_restarted(self, currency_cache_mock):
+        currency_cache_mock.symbols.return_value = ['BTC']
+        self.supervisor.tick()
+        self.assertEqual(len(self.spawned), 2)
+
+        self.supervisor.processes[0].is_alive.return_value = False
+        self.supervisor.tick()
+
+        self.assertEqual(len(self.spawned), 3)
+        self.assertEqual(self.spawned[-1], (0, ['default']))
+
+    @patch('app.management.commands.queues_worker_command.currency_cache')
+    def test_new_symbol_restarts_only_the_worker_it_is_assigned_to(self, currency_cache_mock):
+        currency_cache_mock.symbols.return_value = ['ETH']
+        self.supervisor.tick()
+        first_worker = self.supervisor.processes[1]
+
+        currency_cache_mock.symbols.return_value = ['ETH', 'BTC']
+        self.supervisor.tick()
+
+        first_worker.terminate.assert_called_once()
+        self.assertEqual(self.spawned[-1][0], 1)
+        self.assertIn('BTC', self.spawned[-1][1])
+        self.assertEqual(len(self.spawned), 3)
+
+    @patch('app.management.commands.queues_worker_command.signal.signal')
+    @patch('app.management.commands.queues_worker_command.time.sleep')
+    @patch('app.management.commands.queues_worker_command.currency_cache')
+    def test_failed_tick_is_logged_and_retried(self, currency_cache_mock, sleep_mock, signal_mock):
+        currency_cache_mock.symbols.side_effect = [ConnectionError("down"), ['BTC']]
+        sleep_mock.side_effect = lambda interval: self.supervisor.stop() if self.spawned else None
+
+        with self.assertLogs('app.management.commands.queues_worker_command', level='ERROR'):
+            self.supervisor.run()
+
+        self.assertEqual(len(self.spawned), 2)
+
+    @patch('app.management.commands.queues_worker_command.Supervisor.run')
+    def test_a_single_worker_is_supervised(self, run_mock):
+        with patch('app.management.commands.queues_worker_command.Supervisor.__init__', return_value=None) as init:
+            Command().handle(workers=1, affinity="")
+
+        self.assertEqual(init.call_args.args[0], 1)
+        run_mock.assert_called_once()
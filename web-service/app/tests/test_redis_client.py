@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import redis
+import redis.asyncio.connection
+import redis.connection
+from django.test import SimpleTestCase
+from app.redis_client import RedisClient, AsyncRedisClient, AsyncBlockingConnectionPool, BlockingConnectionPool, \
+    ConnectionBudget, connection_kwargs
+
+TEST_KEY = 'test:redis_client'
+
+
+class RedisClientTestCase(SimpleTestCase):
+    def setUp(self):
+        self.client = RedisClient().client
+        self.client.delete(TEST_KEY)
+
+    def tearDown(self):
+        self.client.delete(TEST_KEY)
+
+    def test_every_instance_shares_one_bounded_pool(self):
+        self.assertIs(RedisClient().client, RedisClient().client)
+
+        pool = self.client.connection_pool
+        self.assertIsInstance(pool, redis.BlockingConnectionPool)
+        self.assertEqual(pool.max_connections, 50)
+        self.assertEqual(pool.connection_kwargs['health_check_interval'], 30)
+
+    def test_pipelined_sends_the_block_in_one_round_trip(self):
+        with RedisClient().pipelined() as pipeline:
+            pipeline.rpush(TEST_KEY, 'a')
+            pipeline.rpush(TEST_KEY, 'b')
+            self.assertEqual(self.client.llen(TEST_KEY), 0)
+
+        self.assertEqual(self.client.lrange(TEST_KEY, 0, -1), [b'a', b'b'])
+
+    def test_pipelined_discards_the_block_on_error(self):
+        with self.assertRaises(ValueError):
+            with RedisClient().pipelined() as pipeline:
+                pipeline.rpush(TEST_KEY, 'a')
+                raise ValueError
+
+        self.assertEqual(self.client.llen(TEST_KEY), 0)
+
+    def test_async_clients_share_a_pool_per_event_loop(self):
+        async def clients():
+            return AsyncRedisClient().client, AsyncRedisClient().client
+
+        first, second = asyncio.run(clients())
+        self.assertIs(first, second)
+        self.assertIsInstance(first.connection_pool, redis.asyncio.BlockingConnectionPool)
+
+        other, _ = asyncio.run(clients())
+        self.assertIsNot(other, first)
+        self.assertIs(first.connection_pool.budget, RedisClient().client.connection_pool.budget)
+
+
+class ConnectionBudgetTestCase(SimpleTestCase):
+    def setUp(self):
+        self.budget = ConnectionBudget(1)
+        self.sync_pool = BlockingConnectionPool(self.budget, **self.kwargs(redis.connection.PythonParser))
+
+    def tearDown(self):
+        self.sync_pool.disconnect()
+
+    def kwargs(self, parser):
+        return dict(connection_kwargs(parser), timeout=0.2)
+
+    def async_pool(self, loop):
+        return AsyncBlockingConnectionPool(self.budget, loop, **self.kwargs(redis.asyncio.connection.PythonParser))
+
+    def test_event_loops_wait_for_connections_in_use_elsewhere(self):
+        connection = self.sync_pool.get_connection('PING')
+
+        async def get_connection():
+            return await self.async_pool(asyncio.get_running_loop()).get_connection('PING')
+
+        with self.assertRaises(redis.ConnectionError):
+            asyncio.run(get_connection())
+        self.sync_pool.release(connection)
+
+    def test_idle_connections_are_closed_for_a_pool_that_waits(self):
+        self.sync_pool.release(self.sync_pool.get_connection('PING'))
+
+        async def ping():
+            pool = self.async_pool(asyncio.get_running_loop())
+            connection = await pool.get_connection('PING')
+            await pool.release(connection)
+            await pool.disconnect()
+
+        asyncio.run(ping())
+        self.assertEqual(self.sync_pool.open_connections(), 0)
+
+    def test_idle_connections_of_another_loop_are_closed_on_that_loop(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            async_pool = self.async_pool(loop)
+
+            async def ping():
+                await async_pool.release(await async_pool.get_connection('PING'))
+
+            asyncio.run_coroutine_threadsafe(ping(), loop).result(1)
+            self.assertEqual(async_pool.open_connections(), 1)
+
+            connection = self.sync_pool.get_connection('PING')
+            self.sync_pool.release(connection)
+            self.assertEqual(async_pool.open_connections(), 0)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
@@ -0,0 +1,124 @@
+import hashlib
+from datetime import timedelta
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from unittest.mock import patch, MagicMock
+from app.circuit_breaker import BREAKER_KEY
+from app.exchanger_router import STATS_KEY
+from app.models import Exchanger, ExchangeTransaction, ExchangerRequestLog
+from app.redis_client import RedisClient
+from app.request_log import LOG_BUFFER_KEY, LOG_PROCESSING_KEY, RequestLogBuffer, RequestLogFlusher, request_log_record, prune
+from app.tasks import settle
+
+
+@override_settings(EXCHANGER_LOG_BODY_LIMIT=8)
+class RequestLogTestCase(TestCase):
+    def setUp(self):
+        self.redis = RedisClient().client
+        self.buffer = RequestLogBuffer()
+        self.exchanger = Exchanger.objects.create(name="Exchanger", api_url="http://exchanger", fee_percentage=0.1)
+        self.exchange_transaction = ExchangeTransaction.objects.create(exchanger=self.exchanger, amount=10,
+                                                                       try_count=2)
+        self.redis.delete(LOG_BUFFER_KEY, LOG_PROCESSING_KEY, STATS_KEY.format(exchanger_id=self.exchanger.id),
+                          BREAKER_KEY.format(exchanger_id=self.exchanger.id))
+
+    def tearDown(self):
+        self.redis.delete(LOG_BUFFER_KEY, LOG_PROCESSING_KEY)
+
+    def push(self, count=1):
+        for _ in range(count):
+            self.buffer.push(request_log_record(self.exchange_transaction, {'amount': 10}, 0.25,
+                                                response=MagicMock(status_code=200, content=b'{"ok": true}')))
+
+    def test_record_keeps_a_digest_of_the_response(self):
+        record = request_log_record(self.exchange_transaction, {'amount': 10}, 0.25,
+                                    response=MagicMock(status_code=200, content=b'{"ok": true}'))
+
+        self.assertEqual(record['exchanger_id'], self.exchanger.id)
+        self.assertEqual(record['attempt'], 2)
+        self.assertEqual(record['request'], '{"amount":10}')
+        self.assertEqual(record['status_code'], 200)
+        self.assertEqual(record['latency_ms'], 250)
+        self.assertEqual(record['response_size'], 12)
+        self.assertEqual(record['response_hash'], hashlib.sha256(b'{"ok": true}').hexdigest())
+        self.assertEqual(record['response'], '{"ok": t')
+
+    def test_failed_call_records_the_error(self):
+        record = request_log_record(self.exchange_transaction, {}, 1.0, error=TimeoutError())
+
+        self.assertIsNone(record['status_code'])
+        self.assertEqual(record['error'], 'TimeoutError')
+        self.assertEqual(record['response_size'], 0)
+
+    def test_flush_writes_buffered_logs_in_one_insert(self):
+        self.push(3)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.buffer.flush(), 3)
+
+        self.assertEqual(ExchangerRequestLog.objects.filter(exchange_transaction=self.exchange_transaction,
+                                                            status_code=200).count(), 3)
+        self.assertEqual(self.redis.llen(LOG_BUFFER_KEY), 0)
+        self.assertEqual(self.redis.llen(LOG_PROCESSING_KEY), 0)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_failed_insert_puts_the_batch_back(self):
+        self.push(3)
+        items = self.redis.lrange(LOG_BUFFER_KEY, 0, -1)
+
+        with patch('app.request_log.ExchangerRequestLog.objects.bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush(2)
+
+        self.assertEqual(self.redis.lrange(LOG_BUFFER_KEY, 0, -1), items)
+        self.assertEqual(self.redis.llen(LOG_PROCESSING_KEY), 0)
+        self.assertEqual(self.buffer.flush(), 3)
+
+    def test_recover_requeues_what_a_crashed_flusher_claimed(self):
+        self.push(3)
+        self.buffer.claim_script(keys=[LOG_BUFFER_KEY, LOG_PROCESSING_KEY], args=[2])
+
+        call_command('exchanger_log_command', '--recover', stdout=MagicMock())
+
+        self.assertEqual(self.redis.llen(LOG_PROCESSING_KEY), 0)
+        self.assertEqual(ExchangerRequestLog.objects.count(), 3)
+
+    def test_stopping_the_flusher_drains_the_buffer(self):
+        self.push(5)
+
+        flusher = RequestLogFlusher(self.buffer)
+        flusher.batch_size = 2
+        flusher.interval = 60
+        flusher.stopped.set()
+        # Run on this thread, so the inserts land in the test transaction
+        with patch('app.request_log.connections.close_all'):
+            flusher.run()
+
+        self.assertEqual(self.redis.llen(LOG_BUFFER_KEY), 0)
+        self.assertEqual(ExchangerRequestLog.objects.count(), 5)
+
+    def test_prune_deletes_logs_past_retention(self):
+        self.push(3)
+        self.buffer.flush()
+        ExchangerRequestLog.objects.filter(id__in=ExchangerRequestLog.objects.values('id')[:2]).update(
+            created_at=timezone.now() - timedelta(days=31))
+
+        self.assertEqual(prune(30, chunk_size=1), 2)
+        self.assertEqual(ExchangerRequestLog.objects.count(), 1)
+
+    @patch('requests.post')
+    def test_settle_buffers_its_request_log(self, post_mock):
+        post_mock.return_value = MagicMock(status_code=200, content=b'{}')
+        self.exchange_transaction.try_count = 0
+        self.exchange_transaction.save()
+
+        settle(self.exchange_transaction.id, "BTC")
+
+        self.assertFalse(ExchangerRequestLog.objects.exists())
+        self.assertEqual(self.redis.llen(LOG_BUFFER_KEY), 1)
+
+        call_command('exchanger_log_command', stdout=MagicMock())
+        log = ExchangerRequestLog.objects.get()
+        self.assertEqual((log.exchanger_id, log.attempt, log.status_code), (self.exchanger.id, 1, 200))
@@ -1,10 +1,15 @@
+from django.db import connection
 from django.test import TestCase
-from unittest.mock import patch, MagicMock
+from django.test.utils import CaptureQueriesContext
+from unittest.mock import patch, MagicMock, ANY
 from app.tasks import settle
-import requests
+from app.tasks.settle_task import retry_delay, complete_settlement
+from app.circuit_breaker import BREAKER_KEY
+from app.exchanger_router import STATS_KEY
+from app.redis_client import RedisClient
 from django.contrib.auth.models import User
 from app.models import (
-    Order, OrderExchangeTransaction, ExchangeTransaction, Exchanger, ExchangerRequestLog, UserWallet,
+    Order, OrderExchangeTransaction, ExchangeTransaction, Exchanger, UserWallet,
     Transaction, CryptoCurrency
 )
 
@@ -17,6 +22,8 @@ class SettleTestCase(TestCase):
         self.exchanger = Exchanger.objects.create(
             name="Test Exchanger", api_url="https://api.test.com"
         )
+        RedisClient().client.delete(STATS_KEY.format(exchanger_id=self.exchanger.id),
+                                    BREAKER_KEY.format(exchanger_id=self.exchanger.id))
         self.crypto_currency = CryptoCurrency.objects.create(
             symbol="BTC", name="Bitcoin", price=50000
         )
@@ -33,9 +40,11 @@ class SettleTestCase(TestCase):
         self.exchange_transaction = ExchangeTransaction.objects.create(
             exchanger=self.exchanger, amount=500, status="Pending"
         )
-        self.order_exchange_transaction = OrderExchangeTransaction.objects.create(
-            exchange_transaction=self.exchange_transaction, order=self.order
-        )
+        self.order_exchange_transaction = self.add_to_batch(self.exchange_transaction, self.order)
+
+    def add_to_batch(self, exchange_transaction, order):
+        Order.objects.filter(id=order.id).update(exchange_transaction=exchange_transaction)
+        return OrderExchangeTransaction.objects.create(exchange_transaction=exchange_transaction, order=order)
 
     @patch('requests.post')
     def test_settle_successful(self, mock_post):
@@ -60,6 +69,26 @@ class SettleTestCase(TestCase):
         self.order.refresh_from_db()
         self.assertEqual(self.order.status, "Completed")
 
+    @patch('requests.post')
+    def test_multi_leg_batch_settles_every_symbol_in_one_request(self, mock_post):
+        mock_post.return_value = MagicMock(status_code=200)
+        ethereum = CryptoCurrency.objects.create(symbol="ETH", name="Ethereum", price=3000)
+        ethereum_order = Order.objects.create(transaction=self.transaction, user=self.user, crypto_currency=ethereum,
+                                              amount=25, count=2, status="Pending")
+        self.add_to_batch(self.exchange_transaction, ethereum_order)
+        legs = [{'currency': 'BTC', 'amount': '200'}, {'currency': 'ETH', 'amount': '50'}]
+        ExchangeTransaction.objects.filter(id=self.exchange_transaction.id).update(amount=250, legs=legs)
+
+        settle(self.exchange_transaction.id, None)
+
+        mock_post.assert_called_once_with("https://api.test.com", json={'amount': '250.00000000', 'legs': legs},
+                                          timeout=ANY)
+        self.assertEqual(Order.objects.filter(exchange_transaction=self.exchange_transaction,
+                                              status="Completed").count(), 2)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, 750)
+        self.assertEqual(self.wallet.locked_balance, 250)
+
     @patch('requests.post')
     def test_settle_failure_retries(self, mock_post):
         # Mocking a failed response from the exchange API
@@ -74,6 +103,41 @@ class SettleTestCase(TestCase):
         self.exchange_transaction.refresh_from_db()
         self.assertEqual(self.exchange_transaction.try_count, 1)
 
+    @patch('rq.Queue.enqueue_in')
+    @patch('requests.post')
+    def test_failed_settle_is_scheduled_by_id_instead_of_sleeping(self, mock_post, mock_enqueue_in):
+        mock_post.return_value = MagicMock(status_code=500)
+
+        settle(self.exchange_transaction.id, self.crypto_currency.symbol)
+
+        mock_enqueue_in.assert_called_once()
+        delay, func, exchange_transaction_id, currency = mock_enqueue_in.call_args.args
+        self.assertEqual(func, settle)
+        self.assertEqual(exchange_transaction_id, self.exchange_transaction.id)
+        self.assertEqual(currency, "BTC")
+        self.assertTrue(15 <= delay.total_seconds() <= 30)
+
+    @patch('rq.Queue.enqueue_in')
+    @patch('requests.post')
+    def test_exchanger_retry_policy_limits_attempts(self, mock_post, mock_enqueue_in):
+        mock_post.return_value = MagicMock(status_code=500)
+        self.exchanger.max_retries = 1
+        self.exchanger.save()
+
+        settle(self.exchange_transaction.id, self.crypto_currency.symbol)
+
+        mock_enqueue_in.assert_not_called()
+        self.exchange_transaction.refresh_from_db()
+        self.assertEqual(self.exchange_transaction.status, "Failed")
+
+    def test_retry_delay_backs_off_exponentially_up_to_max_delay(self):
+        self.exchanger.retry_base_delay = 10
+        self.exchanger.retry_max_delay = 60
+
+        for try_count, backoff in [(1, 10), (2, 20), (3, 40), (4, 60), (10, 60)]:
+            delay = retry_delay(self.exchanger, try_count)
+            self.assertTrue(backoff / 2 <= delay <= backoff)
+
     @patch('requests.post')
     def test_settle_failed_after_retries(self, mock_post):
         # Mocking a failed response after 3 attempts
@@ -137,8 +201,9 @@ class SettleTestCase(TestCase):
         for _ in range(3):
             settle(self.exchange_transaction.id, self.crypto_currency.symbol)
 
-        # Check that reverse transactions are created
-        self.assertEqual(Transaction.objects.filter(user=self.user, type="Credit").count(), 1)
+        # Check that reverse transactions are created, cancelling the debit with a credit of the same amount
+        self.assertEqual(Transaction.objects.filter(user=self.user, type="Credit", amount=200).count(), 1)
+        self.assertFalse(Transaction.objects.filter(user=self.user, amount__lt=0).exists())
 
         # Ensure that the exchange transaction status is updated to 'Failed'
         self.exchange_transaction.refresh_from_db()
@@ -186,11 +251,11 @@ class SettleTestCase(TestCase):
             user=user2, crypto_currency=self.crypto_currency, amount=100, count=7, status="Pending",
         )
 
-        OrderExchangeTransaction.objects.create(exchange_transaction=exchange_transaction, order=order1)
-        OrderExchangeTransaction.objects.create(exchange_transaction=exchange_transaction, order=order2)
-        OrderExchangeTransaction.objects.create(exchange_transaction=exchange_transaction, order=order3)
-        OrderExchangeTransaction.objects.create(exchange_transaction=exchange_transaction, order=order4)
-        OrderExchangeTransaction.objects.create(exchange_transaction=exchange_transaction, order=order5)
+        self.add_to_batch(exchange_transaction, order1)
+        self.add_to_batch(exchange_transaction, order2)
+        self.add_to_batch(exchange_transaction, order3)
+        self.add_to_batch(exchange_transaction, order4)
+        self.add_to_batch(exchange_transaction, order5)
 
         # Call the settle task
         settle(exchange_transaction.id, self.crypto_currency.symbol)
@@ -262,11 +327,11 @@ class SettleTestCase(TestCase):
             user=user2, crypto_currency=self.crypto_currency, amount=100, count=7, status="Pending",
         )
 
-        OrderExchangeTransaction.objects.create(exchange_transaction=exchange_transaction, order=order1)
-        OrderExchangeTransaction.objects.create(exchange_transaction=exchange_transaction, order=order2)
-        OrderExchangeTransaction.objects.create(exchange_transaction=exchange_transaction, order=order3)
-        OrderExchangeTransaction.objects.create(exchange_transaction=exchange_transaction, order=order4)
-        OrderExchangeTransaction.objects.create(exchange_transaction=exchange_transaction, order=order5)
+        self.add_to_batch(exchange_transaction, order1)
+        self.add_to_batch(exchange_transaction, order2)
+        self.add_to_batch(exchange_transaction, order3)
+        self.add_to_batch(exchange_transaction, order4)
+        self.add_to_batch(exchange_transaction, order5)
 
         # Call the settle task 3 times, simulating retries
         for _ in range(3):
@@ -289,8 +354,8 @@ class SettleTestCase(TestCase):
         reverse_transactions_user1 = Transaction.objects.filter(user=user1, type="Credit")
         reverse_transactions_user2 = Transaction.objects.filter(user=user2, type="Credit")
 
-        self.assertEqual(Transaction.objects.filter(user=user1, type="Credit").count(), 2)
-        self.assertEqual(Transaction.objects.filter(user=user2, type="Credit").count(), 3)
+        self.assertEqual(reverse_transactions_user1.count(), 2)
+        self.assertEqual(reverse_transactions_user2.count(), 3)
 
         self.assertEqual(sum(tx.amount for tx in reverse_transactions_user1), 260)
         self.assertEqual(sum(tx.amount for tx in reverse_transactions_user2), 1500)
@@ -310,3 +375,32 @@ class SettleTestCase(TestCase):
 
         order5.refresh_from_db()
         self.assertEqual(order5.status, "Failed")
+
+    def create_batch(self, users_count):
+        exchange_transaction = ExchangeTransaction.objects.create(exchanger=self.exchanger, amount=0)
+        wallets = []
+        for index in range(users_count):
+            user = User.objects.create(username=f"batch-{users_count}-{index}")
+            wallets.append(UserWallet.objects.create(user=user, balance=1000, locked_balance=100))
+            for amount in [30, 20]:
+                order = Order.objects.create(
+                    transaction=self.transaction, user=user, crypto_currency=self.crypto_currency,
+                    amount=amount, count=1, status="processing",
+                )
+                self.add_to_batch(exchange_transaction, order)
+        return exchange_transaction, wallets
+
+    def test_completing_a_batch_takes_the_same_queries_for_any_number_of_users(self):
+        small_batch, _ = self.create_batch(2)
+        large_batch, wallets = self.create_batch(20)
+
+        with CaptureQueriesContext(connection) as small_batch_queries:
+            complete_settlement(small_batch)
+        with CaptureQueriesContext(connection) as large_batch_queries:
+            complete_settlement(large_batch)
+
+        self.assertEqual(len(small_batch_queries), len(large_batch_queries))
+        for wallet in wallets:
+            wallet.refresh_from_db()
+            self.assertEqual(wallet.balance, 950)
+            self.assertEqual(wallet.locked_balance, 50)
@@ -0,0 +1,140 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from unittest.mock import patch
+from redis.exceptions import ConnectionError
+from rest_framework.test import APIClient
+from rest_framework import status
+from app.models import CryptoCurrency, UserWallet, Transaction, Order
+from app.redis_client import RedisClient
+from app.wallet_reservation import WalletReservation, WALLET_KEY, PENDING_KEY, PROCESSING_KEY, REBUILD_KEY
+
+
+@override_settings(PURCHASE_RESERVATION_MODE=True)
+class WalletReservationTestCase(TestCase):
+    def setUp(self):
+        self.redis = RedisClient().client
+        self.clear_redis()
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.client.force_authenticate(user=self.user)
+
+        self.crypto = CryptoCurrency.objects.create(symbol="BTC", price=100)
+        self.wallet = UserWallet.objects.create(user=self.user, balance=1000, locked_balance=0)
+        self.wallet_reservation = WalletReservation()
+
+    def tearDown(self):
+        self.clear_redis()
+
+    def clear_redis(self):
+        self.redis.delete(PENDING_KEY, PROCESSING_KEY, REBUILD_KEY)
+        for key in self.redis.scan_iter(match=WALLET_KEY.format(user_id='*')):
+            self.redis.delete(key)
+
+    def test_purchase_reserves_without_writing_rows(self):
+        response = self.client.post("/api/purchase/", {"name": "BTC", "count": 5})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(self.wallet_reservation.get_wallet(self.user.id)["locked_balance"], 500)
+        self.assertEqual(self.wallet_reservation.pending_count(), 1)
+        self.assertEqual(Order.objects.count(), 0)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.locked_balance, 0)
+
+    def test_insufficient_balance(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 6})
+        response = self.client.post("/api/purchase/", {"name": "BTC", "count": 5})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["error"], "Insufficient balance")
+        self.assertEqual(self.wallet_reservation.get_wallet(self.user.id)["locked_balance"], 600)
+        self.assertEqual(self.wallet_reservation.pending_count(), 1)
+
+    def test_wallet_not_found(self):
+        self.wallet.delete()
+        response = self.client.post("/api/purchase/", {"name": "BTC", "count": 5})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data["error"], "User wallet not found")
+
+    def test_flush_writes_transactions_orders_and_locked_balance(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 3})
+
+        self.assertEqual(self.wallet_reservation.flush(), 2)
+
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(sorted(Order.objects.values_list("count", flat=True)), [2, 3])
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.locked_balance, 500)
+        self.assertEqual(self.wallet_reservation.pending_count(), 0)
+
+    def test_flush_completes_when_the_new_order_signal_fails(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+
+        with patch('redis.StrictRedis.publish', side_effect=ConnectionError("down")):
+            with self.assertLogs('app.order_events', level='ERROR'):
+                self.assertEqual(self.wallet_reservation.flush(), 1)
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.wallet_reservation.pending_count(), 0)
+
+    def test_replayed_reservations_are_not_written_twice(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+        item = self.redis.lindex(PENDING_KEY, 0)
+
+        self.wallet_reservation.flush()
+        # Simulate a flusher that crashed after committing but before acknowledging the batch
+        self.redis.rpush(PROCESSING_KEY, item)
+        self.wallet_reservation.recover()
+        self.wallet_reservation.flush()
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.locked_balance, 200)
+
+    def test_rebuild_restores_wallets_from_mysql_and_unflushed_reservations(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+        self.wallet_reservation.flush()
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 3})
+
+        self.redis.delete(WALLET_KEY.format(user_id=self.user.id))
+        self.wallet_reservation.rebuild()
+
+        wallet = self.wallet_reservation.get_wallet(self.user.id)
+        self.assertEqual(wallet["balance"], 1000)
+        self.assertEqual(wallet["locked_balance"], 500)
+
+    def test_rebuild_overwrites_stale_wallets_in_place(self):
+        self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+        wallet_key = WALLET_KEY.format(user_id=self.user.id)
+        self.redis.hset(wallet_key, mapping={'balance': 1, 'locked_balance': 1})
+
+        self.wallet_reservation.rebuild()
+
+        wallet = self.wallet_reservation.get_wallet(self.user.id)
+        self.assertEqual(wallet["balance"], 1000)
+        self.assertEqual(wallet["locked_balance"], 200)
+        self.assertFalse(self.redis.exists(REBUILD_KEY))
+
+    def test_purchases_are_refused_while_wallets_are_rebuilt(self):
+        self.redis.set(REBUILD_KEY, 1)
+
+        response = self.client.post("/api/purchase/", {"name": "BTC", "count": 2})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["error"], "Wallets are being rebuilt, try again")
+        self.assertEqual(self.wallet_reservation.pending_count(), 0)
+        self.assertIsNone(self.wallet_reservation.get_wallet(self.user.id))
+
+    def test_batch_purchase_reserves_every_item_it_can_cover(self):
+        response = self.client.post("/api/purchase/batch/", {"items": [
+            {"name": "BTC", "count": 6},
+            {"name": "BTC", "count": 5},
+            {"name": "BTC", "count": 4},
+        ]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([result["status"] for result in response.data["results"]],
+                         ["registered", "rejected", "registered"])
+
+        self.assertEqual(self.wallet_reservation.get_wallet(self.user.id)["locked_balance"], 1000)
+        self.assertEqual(self.wallet_reservation.pending_count(), 2)
@@ -0,0 +1,95 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework import status
+from app.currency_cache import currency_cache
+from app.models import CryptoCurrency, Exchanger, ExchangeTransaction, Order, UserWallet
+from app.redis_client import RedisClient
+from app.tasks.settle_task import update_user_wallets_and_orders
+from app.wallet_cache import WalletCache, SNAPSHOT_KEY
+from app.wallet_reservation import WalletReservation, WALLET_KEY, PENDING_KEY, PROCESSING_KEY
+
+
+class WalletViewTestCase(TestCase):
+    def setUp(self):
+        self.redis = RedisClient().client
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.client.force_authenticate(user=self.user)
+        self.snapshot_key = SNAPSHOT_KEY.format(user_id=self.user.id)
+        self.redis.delete(self.snapshot_key)
+
+        self.crypto = CryptoCurrency.objects.create(symbol="BTC", price=100)
+        self.wallet = UserWallet.objects.create(user=self.user, balance=1000, locked_balance=0)
+
+    def tearDown(self):
+        self.redis.delete(self.snapshot_key)
+
+    def test_wallet_is_read_once_then_served_from_the_snapshot(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/wallet/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["balance"], "1000.00000000")
+        self.assertEqual(response.data["available_balance"], "1000.00000000")
+        self.assertEqual(response.data["version"], 0)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/wallet/").data, response.data)
+
+    def test_purchase_refreshes_the_snapshot(self):
+        self.client.get("/api/wallet/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/purchase/", {"name": "BTC", "count": 3})
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/wallet/")
+        self.assertEqual(response.data["locked_balance"], "300.00000000")
+        self.assertEqual(response.data["available_balance"], "700.00000000")
+        self.assertEqual(response.data["version"], 1)
+
+    def test_settlement_refreshes_the_snapshot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/purchase/", {"name": "BTC", "count": 3})
+        exchanger = Exchanger.objects.create(name="Exchanger", api_url="http://exchanger")
+        exchange_transaction = ExchangeTransaction.objects.create(exchanger=exchanger, amount=300)
+        Order.objects.update(status="processing", exchange_transaction=exchange_transaction)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_user_wallets_and_orders(Order.objects.filter(exchange_transaction=exchange_transaction),
+                                           "Completed")
+
+        response = self.client.get("/api/wallet/")
+        self.assertEqual(response.data["balance"], "700.00000000")
+        self.assertEqual(response.data["locked_balance"], "0.00000000")
+        self.assertEqual(response.data["version"], 2)
+
+    def test_older_snapshot_never_replaces_a_newer_one(self):
+        wallet_cache = WalletCache()
+        wallet_cache.store([{'user_id': self.user.id, 'version': 5, 'balance': 900, 'locked_balance': 100}])
+        wallet_cache.store([{'user_id': self.user.id, 'version': 4, 'balance': 1000, 'locked_balance': 0}])
+
+        snapshot = wallet_cache.get(self.user.id)
+        self.assertEqual(snapshot["version"], 5)
+        self.assertEqual(snapshot["balance"], 900)
+
+    def test_wallet_not_found(self):
+        self.wallet.delete()
+        response = self.client.get("/api/wallet/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data["error"], "User wallet not found")
+
+    @override_settings(PURCHASE_RESERVATION_MODE=True)
+    def test_reservations_are_counted_before_they_are_flushed(self):
+        keys = [PENDING_KEY, PROCESSING_KEY, WALLET_KEY.format(user_id=self.user.id)]
+        self.redis.delete(*keys)
+        try:
+            WalletReservation().reserve(self.user.id, currency_cache.get("BTC"), 2, 200)
+            response = self.client.get("/api/wallet/")
+            self.assertEqual(response.data["locked_balance"], "200.00000000")
+            self.assertEqual(response.data["available_balance"], "800.00000000")
+        finally:
+            self.redis.delete(*keys)
+
+    def test_unauthenticated_user(self):
+        self.client.logout()
+        self.assertEqual(self.client.get("/api/wallet/").status_code, status.HTTP_401_UNAUTHORIZED)
@@ -1,10 +1,22 @@
 from django.urls import path
-from .views import purchase, signup
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .views import purchase, purchase_batch, async_purchase, orders, order_detail, wallet, exchanger_health, signup
+from .views import revoke, RevocableTokenRefreshView
+from .views import async_orders, async_order_detail, async_wallet
+from rest_framework_simplejwt.views import TokenObtainPairView
 
 urlpatterns = [
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', RevocableTokenRefreshView.as_view(), name='token_refresh'),
+    path('token/revoke/', revoke, name='token_revoke'),
     path('purchase/', purchase, name='purchase'),
+    path('purchase/batch/', purchase_batch, name='purchase_batch'),
+    path('async/purchase/', async_purchase, name='async_purchase'),
+    path('async/orders/', async_orders, name='async_orders'),
+    path('async/orders/<int:order_id>/', async_order_detail, name='async_order_detail'),
+    path('async/wallet/', async_wallet, name='async_wallet'),
+    path('orders/', orders, name='orders'),
+    path('orders/<int:order_id>/', order_detail, name='order_detail'),
+    path('wallet/', wallet, name='wallet'),
+    path('exchangers/health/', exchanger_health, name='exchanger_health'),
     path('signup/', signup, name='signup'),
 ]
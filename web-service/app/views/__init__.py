@@ -2,3 +2,9 @@
 
 from .purchase_view import *
 from .auth_view import *
+from .async_purchase_view import *
+from .async_read_view import *
+from .order_view import *
+from .wallet_view import *
+from .exchanger_view import *
+from .metrics_view import *
@@ -0,0 +1,82 @@
+import functools
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
+from app.async_db import database_sync_to_async
+from app.authentication import authenticate_async
+from app.currency_cache import currency_cache
+from app.idempotency import async_idempotent, request_payload
+from app import metrics
+from app.models import CryptoCurrency, UserWallet
+from app.serializers import PurchaseSerializer
+from app.views.purchase_view import lock_purchase
+from app.wallet_reservation import AsyncWalletReservation
+
+
+def async_api_view(method):
+    """Serves an async view for one HTTP method to an authenticated user; the view is called with (request, user)"""
+
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != method:
+                return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+            try:
+                user = await authenticate_async(request)
+            except (NotAuthenticated, AuthenticationFailed) as e:
+                return JsonResponse({"detail": str(e.detail)}, status=401)
+
+            return await view(request, user, *args, **kwargs)
+
+        # csrf_exempt is not async-aware in Django 3.2; tokens are authenticated from the header, not from cookies
+        wrapper.csrf_exempt = True
+        return wrapper
+
+    return decorator
+
+
+@async_api_view("POST")
+@async_idempotent
+async def async_purchase(request, user):
+    """
+    Same contract as purchase, served natively under ASGI: authentication, validation and Redis
+    run on the event loop and only the wallet transaction is handed to a worker thread.
+    """
+    try:
+        data = request_payload(request)
+    except ValueError:
+        return JsonResponse({"detail": "JSON parse error"}, status=400)
+
+    serializer = PurchaseSerializer(data=data, context={'symbols': set(await currency_cache.asymbols())})
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    count = serializer.validated_data.get('count')
+    name = serializer.validated_data.get('name').upper()
+
+    try:
+        crypto_currency = await currency_cache.aget(name)
+
+        total_amount = crypto_currency.price * count
+
+        with metrics.PURCHASE_SECONDS.time(path="async"):
+            if getattr(settings, "PURCHASE_RESERVATION_MODE", False):
+                await AsyncWalletReservation().reserve(user.id, crypto_currency, count, total_amount)
+            else:
+                await database_sync_to_async(lock_purchase)(user.id, crypto_currency, count, total_amount)
+
+        metrics.PURCHASES.inc(status="registered")
+        return JsonResponse({"message": "Your order has been registered"}, status=201)
+
+    except ValueError as e:
+        metrics.PURCHASES.inc(status="rejected")
+        return JsonResponse({"error": str(e)}, status=400)
+    except CryptoCurrency.DoesNotExist:
+        return JsonResponse({"error": "CryptoCurrency not found"}, status=404)
+    except UserWallet.DoesNotExist:
+        return JsonResponse({"error": "User wallet not found"}, status=404)
+    except Exception as e:
+        metrics.PURCHASES.inc(status="error")
+        return JsonResponse({"error": str(e)}, status=500)
+
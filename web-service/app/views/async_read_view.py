@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.http import JsonResponse
+from app.async_db import database_sync_to_async
+from app.order_cache import OrderCache
+from app.serializers import WalletSerializer
+from app.views.async_purchase_view import async_api_view
+from app.views.order_view import decode_cursor, order_page, order_row, page_size_param
+from app.views.wallet_view import load_snapshot
+from app.wallet_cache import WalletCache
+from app.wallet_reservation import AsyncWalletReservation
+from app import ledger
+
+
+@async_api_view("GET")
+async def async_orders(request, user):
+    """Same contract as orders; a cached page is served from Redis on the event loop, a miss reads in a thread"""
+    cursor = request.GET.get('cursor')
+    try:
+        page_size = page_size_param(request.GET)
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    order_cache = OrderCache()
+    page = f"list:{page_size}:{cursor or ''}"
+    version, data = await order_cache.aget(user.id, page)
+    if data is not None:
+        return JsonResponse(data)
+
+    data = await database_sync_to_async(order_page)(user.id, position, page_size)
+    await order_cache.aset(user.id, version, page, data)
+    return JsonResponse(data)
+
+
+@async_api_view("GET")
+async def async_order_detail(request, user, order_id):
+    order_cache = OrderCache()
+    page = f"order:{order_id}"
+    version, data = await order_cache.aget(user.id, page)
+    if data is not None:
+        return JsonResponse(data)
+
+    data = await database_sync_to_async(order_row)(user.id, order_id)
+    if data is None:
+        return JsonResponse({"error": "Order not found"}, status=404)
+
+    await order_cache.aset(user.id, version, page, data)
+    return JsonResponse(data)
+
+
+@async_api_view("GET")
+async def async_wallet(request, user):
+    """Same contract as wallet; the snapshot and the reservations are read from Redis on the event loop"""
+    if ledger.ledger_enabled():
+        snapshot = await database_sync_to_async(ledger.wallet)(user.id)
+        return JsonResponse(WalletSerializer(snapshot).data)
+
+    snapshot = await WalletCache().aget(user.id) or await database_sync_to_async(load_snapshot)(user.id)
+    if snapshot is None:
+        return JsonResponse({"error": "User wallet not found"}, status=404)
+
+    if getattr(settings, "PURCHASE_RESERVATION_MODE", False):
+        reserved = await AsyncWalletReservation().get_wallet(user.id)
+        if reserved is not None:
+            snapshot = dict(snapshot, **reserved)
+
+    return JsonResponse(WalletSerializer(snapshot).data)
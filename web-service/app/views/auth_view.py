@@ -1,7 +1,13 @@
-from rest_framework.decorators import api_view
+from redis.exceptions import RedisError
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.views import TokenRefreshView
 
+from app.authentication import revoke_token, RevocableTokenRefreshSerializer
 from app.models import UserWallet
 from app.serializers import SignupSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -20,4 +26,31 @@ def signup(request):
             "refresh": str(refresh)
         }, status=status.HTTP_201_CREATED)
 
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class RevocableTokenRefreshView(TokenRefreshView):
+    serializer_class = RevocableTokenRefreshSerializer
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def revoke(request):
+    """Logs out: revokes the access token the request was made with and the refresh token in the body, if any"""
+    tokens = [request.auth]
+    if request.data.get("refresh"):
+        try:
+            refresh = RefreshToken(request.data["refresh"])
+        except TokenError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if refresh[api_settings.USER_ID_CLAIM] != request.user.id:
+            return Response({"error": "The refresh token belongs to another user"}, status=status.HTTP_400_BAD_REQUEST)
+        tokens.append(refresh)
+
+    try:
+        for token in tokens:
+            revoke_token(token)
+    except RedisError:
+        return Response({"error": "Could not revoke the token, try again"},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(status=status.HTTP_204_NO_CONTENT)
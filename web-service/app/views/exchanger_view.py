@@ -0,0 +1,32 @@
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from app.circuit_breaker import is_open
+from app.exchanger_router import ExchangerRouter
+from app.models import Exchanger
+
+
+@api_view(["GET"])
+# Staff only; the full User is loaded, since token claims do not carry is_staff
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAdminUser])
+def exchanger_health(request):
+    """Routing stats and circuit breaker state of every exchanger, as the workers share them in Redis"""
+    router = ExchangerRouter()
+    exchangers = list(Exchanger.objects.order_by('id'))
+    stats = router.stats(exchangers)
+
+    return Response({"exchangers": [
+        {
+            "id": exchanger.id,
+            "name": exchanger.name,
+            "is_active": exchanger.is_active,
+            "healthy": router.is_healthy(stats[exchanger.id]) and not is_open(stats[exchanger.id]['breaker']),
+            "latency": stats[exchanger.id]['latency'],
+            "error_rate": stats[exchanger.id]['error_rate'],
+            "samples": stats[exchanger.id]['samples'],
+            "circuit": stats[exchanger.id]['breaker'],
+        }
+        for exchanger in exchangers
+    ]})
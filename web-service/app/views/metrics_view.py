@@ -0,0 +1,37 @@
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rq import Queue
+from app import metrics
+from app.async_settlement import QUEUE_KEY, DELAYED_KEY
+from app.currency_cache import currency_cache
+from app.redis_client import RedisClient
+from app.request_log import LOG_BUFFER_KEY
+
+
+def queue_gauges():
+    """Depths of the RQ queues, the async settlement queue and the request log buffer, in one round trip"""
+    client = RedisClient().client
+    queue_names = ['default'] + sorted(currency_cache.symbols())
+
+    pipeline = RedisClient().pipeline()
+    for name in queue_names:
+        pipeline.llen(Queue(name=name, connection=client).key)
+    pipeline.llen(QUEUE_KEY)
+    pipeline.zcard(DELAYED_KEY)
+    pipeline.llen(LOG_BUFFER_KEY)
+    depths = pipeline.execute()
+
+    ready, delayed, buffered = depths[len(queue_names):]
+    return [
+        ('rq_queue_depth', "Jobs waiting in each RQ queue.",
+         [({'queue': name}, depth) for name, depth in zip(queue_names, depths)]),
+        ('async_settle_queue_depth', "Batches waiting for the async settlement worker.",
+         [({'state': 'ready'}, ready), ({'state': 'delayed'}, delayed)]),
+        ('exchanger_request_log_buffer', "Exchanger request logs waiting to be written.", [({}, buffered)]),
+    ]
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus scrape endpoint"""
+    return HttpResponse(metrics.render(queue_gauges()), content_type="text/plain; version=0.0.4; charset=utf-8")
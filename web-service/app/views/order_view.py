@@ -0,0 +1,96 @@
+import base64
+import json
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
+from app.models import Order
+from app.order_cache import OrderCache
+from app.serializers import OrderSerializer
+
+
+def encode_cursor(order):
+    position = json.dumps([order['created_at'].isoformat(), order['id']])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Returns the (created_at, id) position of a cursor; raises ValueError on a malformed cursor"""
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    created_at = parse_datetime(created_at) if isinstance(created_at, str) else None
+    if created_at is None or not isinstance(order_id, int):
+        raise ValueError("Invalid cursor")
+    return created_at, order_id
+
+
+def page_size_param(params):
+    page_size = int(params.get('page_size', getattr(settings, "ORDERS_PAGE_SIZE", 20)))
+    return min(max(page_size, 1), getattr(settings, "ORDERS_MAX_PAGE_SIZE", 100))
+
+
+def order_page(user_id, position, page_size):
+    """Reads one page of the user's orders after `position` and serializes it with the cursor of the next page"""
+    queryset = Order.objects.filter(user_id=user_id)
+    if position:
+        created_at, order_id = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=order_id))
+    rows = list(queryset.order_by('-created_at', '-id').values(*OrderSerializer.FIELDS)[:page_size + 1])
+
+    return {
+        "results": OrderSerializer(rows[:page_size], many=True).data,
+        "next_cursor": encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None,
+    }
+
+
+def order_row(user_id, order_id):
+    """Serializes one of the user's orders, or returns None"""
+    row = Order.objects.filter(user_id=user_id, id=order_id).values(*OrderSerializer.FIELDS).first()
+    return OrderSerializer(row).data if row is not None else None
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def orders(request):
+    """
+    Lists the user's orders, newest first. Pages are cut by keyset on (created_at, id), which the
+    (user, created_at) index serves directly, so a page costs the same however many orders the user has.
+    """
+    cursor = request.query_params.get('cursor')
+    try:
+        page_size = page_size_param(request.query_params)
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    order_cache = OrderCache()
+    page = f"list:{page_size}:{cursor or ''}"
+    version, data = order_cache.get(request.user.id, page)
+    if data is not None:
+        return Response(data)
+
+    data = order_page(request.user.id, position, page_size)
+    order_cache.set(request.user.id, version, page, data)
+    return Response(data)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def order_detail(request, order_id):
+    order_cache = OrderCache()
+    page = f"order:{order_id}"
+    version, data = order_cache.get(request.user.id, page)
+    if data is not None:
+        return Response(data)
+
+    data = order_row(request.user.id, order_id)
+    if data is None:
+        return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    order_cache.set(request.user.id, version, page, data)
+    return Response(data)
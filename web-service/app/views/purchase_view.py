@@ -1,15 +1,29 @@
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+from django.conf import settings
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from app.redis_client import RedisClient
-from app.serializers import PurchaseSerializer
+from app.serializers import PurchaseSerializer, BatchPurchaseSerializer
 from app.models import UserWallet, Order, CryptoCurrency, Transaction
+from app.wallet_reservation import WalletReservation
+from app.currency_cache import currency_cache
+from app.idempotency import idempotent
+from app.order_events import publish_new_order
+from app.order_writer import create_orders
+from app.order_cache import invalidate_orders_on_commit
+from app.wallet_cache import store_wallets_on_commit
+from app import ledger, metrics
 from django.db import transaction
 
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@idempotent
 def purchase(request):
     serializer = PurchaseSerializer(data=request.data)
     if not serializer.is_valid():
@@ -19,40 +33,192 @@ def purchase(request):
     name = serializer.validated_data.get('name').upper()
 
     try:
-        with transaction.atomic():
-            crypto_currency = CryptoCurrency.objects.get(symbol=name)
+        crypto_currency = currency_cache.get(name)
 
-            total_amount = crypto_currency.price * count
+        total_amount = crypto_currency.price * count
 
-            user_wallet = UserWallet.objects.select_for_update().get(user_id=request.user.id)
+        with metrics.PURCHASE_SECONDS.time(path="purchase"):
+            if getattr(settings, "PURCHASE_RESERVATION_MODE", False):
+                WalletReservation().reserve(request.user.id, crypto_currency, count, total_amount)
+            else:
+                lock_purchase(request.user.id, crypto_currency, count, total_amount)
 
-            if user_wallet.balance < total_amount + user_wallet.locked_balance:
-                raise ValueError("Insufficient balance")
+        metrics.PURCHASES.inc(status="registered")
+        return Response({"message": "Your order has been registered"}, status=status.HTTP_201_CREATED)
 
-            user_wallet.locked_balance += total_amount
-            user_wallet.save()
+    except ValueError as e:
+        metrics.PURCHASES.inc(status="rejected")
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except CryptoCurrency.DoesNotExist:
+        return Response({"error": "CryptoCurrency not found"}, status=status.HTTP_404_NOT_FOUND)
+    except UserWallet.DoesNotExist:
+        return Response({"error": "User wallet not found"}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        metrics.PURCHASES.inc(status="error")
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            trx = Transaction.objects.create(
-                user=request.user,
-                type=dict(Transaction.TRANSACTION_TYPES).get("debit"),
-                amount=total_amount
-            )
 
-            Order.objects.create(
-                user=request.user,
-                crypto_currency=crypto_currency,
-                transaction=trx,
-                count=count,
-                amount=crypto_currency.price
-            )
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+@idempotent
+def purchase_batch(request):
+    """Places many orders under one wallet lock; items the balance cannot cover are rejected, in order"""
+    serializer = BatchPurchaseSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({"message": "Your order has been registered"}, status=status.HTTP_201_CREATED)
+    items = [(item['name'].upper(), item['count']) for item in serializer.validated_data['items']]
+
+    try:
+        with metrics.PURCHASE_SECONDS.time(path="batch"):
+            if getattr(settings, "PURCHASE_RESERVATION_MODE", False):
+                results = reserve_batch(request.user.id, items)
+            else:
+                results = lock_batch(request.user.id, items)
 
-    except ValueError as e:
-        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except CryptoCurrency.DoesNotExist:
         return Response({"error": "CryptoCurrency not found"}, status=status.HTTP_404_NOT_FOUND)
     except UserWallet.DoesNotExist:
         return Response({"error": "User wallet not found"}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
+        metrics.PURCHASES.inc(len(items), status="error")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    registered = sum(result['status'] == "registered" for result in results)
+    metrics.PURCHASES.inc(registered, status="registered")
+    metrics.PURCHASES.inc(len(results) - registered, status="rejected")
+    return Response(
+        {"results": results},
+        status=status.HTTP_201_CREATED if registered else status.HTTP_400_BAD_REQUEST,
+    )
+
+
+class WalletFunds:
+    """The available balance of a wallet row locked for update; amounts locked through it are saved together"""
+
+    def __init__(self, user_wallet):
+        self.user_wallet = user_wallet
+        self.available = user_wallet.balance - user_wallet.locked_balance
+        self.locked = Decimal(0)
+
+    def lock(self, amount, reference=''):
+        self.available -= amount
+        self.locked += amount
+
+    def save(self):
+        if not self.locked:
+            return
+        self.user_wallet.locked_balance += self.locked
+        self.user_wallet.version += 1
+        self.user_wallet.save()
+        store_wallets_on_commit([self.user_wallet])
+
+
+@contextmanager
+def locked_funds(user_id, path):
+    """
+    Yields the user's funds inside a transaction that serializes their purchases. With the ledger on, that is
+    the user's spending lock and the locked amounts are appended as ledger entries; otherwise the wallet row is
+    locked and updated.
+    """
+    with metrics.WALLET_LOCK_SECONDS.time(path=path):
+        if ledger.ledger_enabled():
+            with ledger.spending(user_id) as funds:
+                yield funds
+            return
+
+        with transaction.atomic():
+            funds = WalletFunds(UserWallet.objects.select_for_update().get(user_id=user_id))
+            yield funds
+            funds.save()
+
+
+def lock_purchase(user_id, crypto_currency, count, total_amount):
+    """Places one order under the user's wallet lock"""
+    with locked_funds(user_id, "purchase") as funds:
+        if funds.available < total_amount:
+            raise ValueError("Insufficient balance")
+
+        trx = Transaction.objects.create(
+            user_id=user_id,
+            type=dict(Transaction.TRANSACTION_TYPES).get("debit"),
+            amount=total_amount,
+            reference=str(uuid.uuid4()),
+        )
+        funds.lock(total_amount, trx.reference)
+
+        Order.objects.create(
+            user_id=user_id,
+            crypto_currency_id=crypto_currency.id,
+            transaction=trx,
+            count=count,
+            amount=crypto_currency.price
+        )
+
+        transaction.on_commit(lambda: publish_new_order(crypto_currency.id, crypto_currency.symbol, total_amount))
+        invalidate_orders_on_commit([user_id])
+
+
+def batch_result(name, count, amount, error=None):
+    return {
+        "name": name,
+        "count": count,
+        "amount": str(amount),
+        "status": "rejected" if error else "registered",
+        "error": error,
+    }
+
+
+def reserve_batch(user_id, items):
+    wallet_reservation = WalletReservation()
+    results = []
+    for name, count in items:
+        crypto_currency = currency_cache.get(name)
+        total_amount = crypto_currency.price * count
+        try:
+            wallet_reservation.reserve(user_id, crypto_currency, count, total_amount)
+            results.append(batch_result(name, count, total_amount))
+        except ValueError as e:
+            results.append(batch_result(name, count, total_amount, str(e)))
+    return results
+
+
+def lock_batch(user_id, items):
+    results = []
+    orders = []
+    total_sum_of_symbols = defaultdict(Decimal)
+
+    with locked_funds(user_id, "batch") as funds:
+        for name, count in items:
+            crypto_currency = currency_cache.get(name)
+            total_amount = crypto_currency.price * count
+
+            if total_amount > funds.available:
+                results.append(batch_result(name, count, total_amount, "Insufficient balance"))
+                continue
+
+            reference = str(uuid.uuid4())
+            funds.lock(total_amount, reference)
+            total_sum_of_symbols[(crypto_currency.id, name)] += total_amount
+            orders.append({
+                'reference': reference,
+                'user_id': user_id,
+                'crypto_currency_id': crypto_currency.id,
+                'count': count,
+                'price': crypto_currency.price,
+                'amount': total_amount,
+            })
+            results.append(batch_result(name, count, total_amount))
+
+        if orders:
+            create_orders(orders)
+
+            transaction.on_commit(lambda: publish_new_orders(total_sum_of_symbols))
+            invalidate_orders_on_commit([user_id])
+
+    return results
+
+
+def publish_new_orders(total_sum_of_symbols):
+    for (crypto_currency_id, symbol), total_sum in total_sum_of_symbols.items():
+        publish_new_order(crypto_currency_id, symbol, total_sum)
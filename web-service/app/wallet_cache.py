@@ -0,0 +1,93 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from redis.exceptions import RedisError
+from app.models import UserWallet
+from app.redis_client import RedisClient, AsyncRedisClient
+
+SNAPSHOT_KEY = 'wallet:snapshot:{user_id}'
+
+# Writes the snapshot only if it is newer than the cached one, so a slow writer never overwrites a newer balance
+STORE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'version')
+if current and tonumber(current) >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'version', ARGV[1], 'balance', ARGV[2], 'locked_balance', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+class WalletCache:
+    """
+    Versioned snapshots of wallet balances in Redis. Every balance write bumps UserWallet.version and stores
+    the new snapshot after commit, so reads are served without touching the row that purchases lock.
+    """
+
+    def __init__(self):
+        self.client = RedisClient().client
+        self.store_script = self.client.register_script(STORE_SCRIPT)
+
+    @property
+    def ttl(self):
+        return getattr(settings, "WALLET_SNAPSHOT_TTL", 3600)
+
+    def get(self, user_id):
+        try:
+            values = self.client.hmget(SNAPSHOT_KEY.format(user_id=user_id), 'version', 'balance', 'locked_balance')
+        except RedisError:
+            return None
+        return parse_snapshot(values)
+
+    async def aget(self, user_id):
+        try:
+            values = await AsyncRedisClient().client.hmget(SNAPSHOT_KEY.format(user_id=user_id),
+                                                           'version', 'balance', 'locked_balance')
+        except RedisError:
+            return None
+        return parse_snapshot(values)
+
+    def store(self, wallets):
+        """Stores snapshots of the given `{'user_id', 'version', 'balance', 'locked_balance'}` rows"""
+        try:
+            with RedisClient().pipelined() as pipeline:
+                for wallet in wallets:
+                    self.store_script(
+                        keys=[SNAPSHOT_KEY.format(user_id=wallet['user_id'])],
+                        args=[wallet['version'], str(wallet['balance']), str(wallet['locked_balance']), self.ttl],
+                        client=pipeline,
+                    )
+        except RedisError:
+            # Reads fall back to the database until the next write or the old snapshot expires
+            pass
+
+    def refresh(self, user_ids):
+        """Reloads the users' snapshots from the database, for writes that updated balances in SQL"""
+        self.store(UserWallet.objects.filter(user_id__in=list(user_ids))
+                   .values('user_id', 'version', 'balance', 'locked_balance'))
+
+
+def parse_snapshot(values):
+    if values[0] is None:
+        return None
+    return {'version': int(values[0]), 'balance': Decimal(values[1].decode()),
+            'locked_balance': Decimal(values[2].decode())}
+
+
+def wallet_snapshot(user_wallet):
+    return {'user_id': user_wallet.user_id, 'version': user_wallet.version,
+            'balance': user_wallet.balance, 'locked_balance': user_wallet.locked_balance}
+
+
+def store_wallets_on_commit(user_wallets):
+    """Stores snapshots of wallets saved in the surrounding transaction once it commits"""
+    snapshots = [wallet_snapshot(user_wallet) for user_wallet in user_wallets]
+    transaction.on_commit(lambda: WalletCache().store(snapshots))
+
+
+def refresh_wallets_on_commit(user_ids):
+    """Reloads the users' snapshots once the surrounding transaction commits"""
+    user_ids = list(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: WalletCache().refresh(user_ids))
@@ -0,0 +1,255 @@
+import json
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from app.models import UserWallet, Transaction
+from app.redis_client import RedisClient, AsyncRedisClient
+from app.async_db import database_sync_to_async
+from app.order_events import publish_new_order
+from app.order_writer import create_orders
+from app.order_cache import invalidate_orders_on_commit
+from app.wallet_cache import refresh_wallets_on_commit
+
+# Amounts are kept in Redis as integers of the smallest unit (8 decimal places, like the DB columns).
+# Lua numbers are doubles, so balances are exact up to 2^53 units (~90M in currency units).
+UNITS = Decimal('100000000')
+
+WALLET_KEY = 'wallet:reservation:{user_id}'
+PENDING_KEY = 'purchase:pending'
+PROCESSING_KEY = 'purchase:processing'
+REBUILD_KEY = 'purchase:rebuilding'
+
+RESERVE_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return -2
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local balance = tonumber(redis.call('HGET', KEYS[1], 'balance'))
+local locked = tonumber(redis.call('HGET', KEYS[1], 'locked_balance'))
+local amount = tonumber(ARGV[1])
+if balance < locked + amount then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], 'locked_balance', ARGV[1])
+redis.call('RPUSH', KEYS[2], ARGV[2])
+return 1
+"""
+
+ADJUST_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], 'balance', ARGV[1])
+redis.call('HINCRBY', KEYS[1], 'locked_balance', ARGV[2])
+return 1
+"""
+
+CLAIM_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+
+def to_units(amount):
+    return int(Decimal(amount) * UNITS)
+
+
+def from_units(units):
+    return Decimal(int(units)) / UNITS
+
+
+def parse_wallet(values):
+    if values[0] is None:
+        return None
+    return {'balance': from_units(values[0]), 'locked_balance': from_units(values[1])}
+
+
+def check_reserved(result):
+    if result == -2:
+        raise ValueError("Wallets are being rebuilt, try again")
+    if result == 0:
+        raise ValueError("Insufficient balance")
+
+
+def reservation_payload(user_id, crypto_currency, count, total_amount):
+    reference = str(uuid.uuid4())
+    return reference, json.dumps({
+        'reference': reference,
+        'user_id': user_id,
+        'crypto_currency_id': crypto_currency.id,
+        'symbol': crypto_currency.symbol,
+        'price': str(crypto_currency.price),
+        'count': count,
+        'amount': str(total_amount),
+    })
+
+
+class WalletReservation:
+    """Keeps wallet balances in Redis so purchases can be reserved without locking the wallet row"""
+
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client or RedisClient()
+        self.client = self.redis_client.client
+        self.reserve_script = self.client.register_script(RESERVE_SCRIPT)
+        self.adjust_script = self.client.register_script(ADJUST_SCRIPT)
+        self.claim_script = self.client.register_script(CLAIM_SCRIPT)
+
+    def reserve(self, user_id, crypto_currency, count, total_amount):
+        """Atomically checks the balance and locks the amount; the order is persisted later by the flusher"""
+        reference, payload = reservation_payload(user_id, crypto_currency, count, total_amount)
+        wallet_key = WALLET_KEY.format(user_id=user_id)
+
+        keys = [wallet_key, PENDING_KEY, REBUILD_KEY]
+        result = self.reserve_script(keys=keys, args=[to_units(total_amount), payload])
+        if result == -1:
+            self.load_wallet(user_id)
+            result = self.reserve_script(keys=keys, args=[to_units(total_amount), payload])
+
+        check_reserved(result)
+
+        return reference
+
+    def load_wallet(self, user_id):
+        """Seeds the Redis wallet from MySQL; waits for settle's row lock so a settlement is never counted twice"""
+        with transaction.atomic():
+            user_wallet = UserWallet.objects.select_for_update().get(user_id=user_id)
+            wallet_key = WALLET_KEY.format(user_id=user_id)
+            with self.redis_client.pipelined(transaction=True) as pipeline:
+                pipeline.hsetnx(wallet_key, 'balance', to_units(user_wallet.balance))
+                pipeline.hsetnx(wallet_key, 'locked_balance', to_units(user_wallet.locked_balance))
+
+    def adjust(self, user_id, balance_delta, locked_balance_delta):
+        """Mirrors a settlement into Redis; wallets that were never loaded are left to lazy loading"""
+        self.adjust_script(
+            keys=[WALLET_KEY.format(user_id=user_id)],
+            args=[to_units(balance_delta), to_units(locked_balance_delta)],
+        )
+
+    def pending_count(self):
+        return self.client.llen(PENDING_KEY) + self.client.llen(PROCESSING_KEY)
+
+    def get_wallet(self, user_id):
+        return parse_wallet(self.client.hmget(WALLET_KEY.format(user_id=user_id), 'balance', 'locked_balance'))
+
+    def claim(self, batch_size):
+        """Moves up to batch_size raw reservations to the processing list and returns them"""
+        return self.claim_script(keys=[PENDING_KEY, PROCESSING_KEY], args=[batch_size])
+
+    def flush(self, batch_size=500):
+        """Writes one batch of reservations as Transaction/Order rows; returns the number of reservations flushed"""
+        items = self.claim(batch_size)
+        if not items:
+            return 0
+
+        reservations = [json.loads(item) for item in items]
+
+        with transaction.atomic():
+            existing = set(Transaction.objects.filter(
+                reference__in=[reservation['reference'] for reservation in reservations]
+            ).values_list('reference', flat=True))
+            reservations = [reservation for reservation in reservations if reservation['reference'] not in existing]
+
+            create_orders(reservations)
+
+            total_sum_of_users = defaultdict(Decimal)
+            for reservation in reservations:
+                total_sum_of_users[reservation['user_id']] += Decimal(reservation['amount'])
+
+            for user_id in sorted(total_sum_of_users):
+                UserWallet.objects.filter(user_id=user_id).update(
+                    locked_balance=F('locked_balance') + total_sum_of_users[user_id], version=F('version') + 1
+                )
+
+            invalidate_orders_on_commit(total_sum_of_users)
+            refresh_wallets_on_commit(total_sum_of_users)
+
+        with self.redis_client.pipelined(transaction=True) as pipeline:
+            for item in items:
+                pipeline.lrem(PROCESSING_KEY, 1, item)
+
+        total_sum_of_symbols = defaultdict(Decimal)
+        for reservation in reservations:
+            total_sum_of_symbols[(reservation['crypto_currency_id'], reservation['symbol'])] += \
+                Decimal(reservation['amount'])
+        for (crypto_currency_id, symbol), total_sum in total_sum_of_symbols.items():
+            publish_new_order(crypto_currency_id, symbol, total_sum)
+
+        return len(items)
+
+    def recover(self):
+        """Puts reservations left in processing by a crashed flusher back in front of the pending list"""
+        while self.client.rpoplpush(PROCESSING_KEY, PENDING_KEY) is not None:
+            pass
+
+    def rebuild(self):
+        """
+        Rebuilds every Redis wallet from MySQL plus the reservations that are not flushed yet. Reservations are
+        refused while it runs, so the pending list holds still; the flusher must be stopped. Wallets are overwritten
+        in place under their row locks, so none is ever missing and a concurrent settlement is counted once.
+        """
+        timeout = getattr(settings, "RESERVATION_REBUILD_TIMEOUT", 600)
+        self.client.set(REBUILD_KEY, 1, ex=timeout)
+        try:
+            self.recover()
+
+            unflushed = defaultdict(Decimal)
+            for item in self.client.lrange(PENDING_KEY, 0, -1):
+                reservation = json.loads(item)
+                unflushed[reservation['user_id']] += Decimal(reservation['amount'])
+
+            chunk_size = getattr(settings, "WALLET_UPDATE_CHUNK_SIZE", 500)
+            last_user_id = 0
+            while True:
+                with transaction.atomic():
+                    wallets = list(
+                        UserWallet.objects.select_for_update().filter(user_id__gt=last_user_id).order_by('user_id')
+                        .values_list('user_id', 'balance', 'locked_balance')[:chunk_size]
+                    )
+                    if not wallets:
+                        break
+                    with self.redis_client.pipelined() as pipeline:
+                        for user_id, balance, locked_balance in wallets:
+                            pipeline.hset(WALLET_KEY.format(user_id=user_id), mapping={
+                                'balance': to_units(balance),
+                                'locked_balance': to_units(locked_balance + unflushed[user_id]),
+                            })
+                        pipeline.expire(REBUILD_KEY, timeout)
+                last_user_id = wallets[-1][0]
+        finally:
+            self.client.delete(REBUILD_KEY)
+
+
+class AsyncWalletReservation:
+    """Reserves on the event loop; only seeding a wallet that is not in Redis yet goes to the database"""
+
+    def __init__(self, redis_client=None):
+        self.client = (redis_client or AsyncRedisClient()).client
+        self.reserve_script = self.client.register_script(RESERVE_SCRIPT)
+
+    async def reserve(self, user_id, crypto_currency, count, total_amount):
+        reference, payload = reservation_payload(user_id, crypto_currency, count, total_amount)
+        wallet_key = WALLET_KEY.format(user_id=user_id)
+
+        keys = [wallet_key, PENDING_KEY, REBUILD_KEY]
+        result = await self.reserve_script(keys=keys, args=[to_units(total_amount), payload])
+        if result == -1:
+            await database_sync_to_async(WalletReservation().load_wallet)(user_id)
+            result = await self.reserve_script(keys=keys, args=[to_units(total_amount), payload])
+
+        check_reserved(result)
+
+        return reference
+
+    async def get_wallet(self, user_id):
+        return parse_wallet(await self.client.hmget(WALLET_KEY.format(user_id=user_id), 'balance', 'locked_balance'))